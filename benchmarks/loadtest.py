@@ -0,0 +1,253 @@
+"""Load-test the dashboard with concurrent headless sessions.
+
+Usage (from the repository root)::
+
+    python -m benchmarks.loadtest --sessions 8 --steps 20 --rows 100k
+    python -m benchmarks.loadtest --sessions 32 --concurrency 8 --output benchmarks/loadtest.json
+
+Each session is a Streamlit ``AppTest`` of ``app.py`` running in its own
+thread of this process, as sessions share one server process. A session
+opens the home page, then takes ``--steps`` random steps: switch to another
+page, or pick random dates, segments and products on the current one. Every
+rerun is timed. The report gives throughput, rerun latency percentiles per
+page and step, per-stage render timings (see ``services.tracing``), and the
+distribution over sessions of the resident memory each one added during its
+own reruns (so a session that leaks stands out from the others). The data
+is synthetic and written to a temporary directory, so no network or existing
+file is needed.
+
+``AppTest.run`` swaps process-wide Streamlit state (the runtime instance), so
+reruns from different sessions execute one at a time. A rerun's latency is
+its wait for the process plus its own run ("service") time. That is close to
+a real server, where reruns interleave under the GIL, and it gives the same
+throughput on a CPU-bound process.
+"""
+from __future__ import annotations
+
+import argparse
+import datetime as dt
+import json
+import logging
+import os
+import random
+import resource
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+
+import numpy as np  # noqa: E402
+from streamlit.testing.v1 import AppTest  # noqa: E402
+
+from benchmarks import run  # noqa: E402
+from services import query, tracing  # noqa: E402
+
+
+PAGES = ("app.py", "pages/1_Overview.py", "pages/2_Portfolio.py", "pages/3_Risks.py", "pages/4_3D_Storytelling.py")
+# Share of steps that switch page; the others change the filters
+NAVIGATE_SHARE = 0.3
+TIMEOUT_SECONDS = 120
+
+_run_lock = threading.Lock()
+
+
+def rss_mb() -> float:
+    """Current resident set size of this process (peak RSS where /proc is unavailable)."""
+    try:
+        with open("/proc/self/status", encoding="ascii") as status:
+            for line in status:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 2**20 if sys.platform == "darwin" else peak / 1024
+
+
+def randomize_filters(at: AppTest, rng: random.Random) -> None:
+    """Random date range and non-empty segment/product selections on the current page."""
+    start_input, end_input = at.date_input[0], at.date_input[1]
+    first, last = (bound if isinstance(bound, dt.date) else dt.date.fromisoformat(bound) for bound in (start_input.min, start_input.max))
+    span = (last - first).days
+    start = first + dt.timedelta(days=rng.randint(0, span))
+    end = start + dt.timedelta(days=rng.randint(0, (last - start).days))
+    start_input.set_value(start)
+    end_input.set_value(end)
+    for widget in at.multiselect[:2]:
+        widget.set_value(rng.sample(widget.options, rng.randint(1, len(widget.options))))
+
+
+class Session:
+    def __init__(self, session_id: int, seed: int):
+        self.id = session_id
+        self.rng = random.Random(seed)
+        self.app = AppTest.from_file(str(ROOT / "app.py"), default_timeout=TIMEOUT_SECONDS)
+        self.page = PAGES[0]
+        self.timings: List[Dict] = []
+        self.errors: List[str] = []
+        self.rss_added_mb = 0.0
+
+    def rerun(self, step: str) -> None:
+        queued = time.perf_counter()
+        with _run_lock:
+            # Reruns run one at a time, so the RSS they add is this session's
+            rss_before = rss_mb()
+            start = time.perf_counter()
+            self.app.run()
+            end = time.perf_counter()
+            self.rss_added_mb += rss_mb() - rss_before
+        self.timings.append({"page": self.page, "step": step, "seconds": end - queued, "service": end - start})
+        self.errors += [f"{self.page}: {exc.value}" for exc in self.app.exception]
+
+    def play(self, steps: int, think_seconds: float = 0.0) -> "Session":
+        self.rerun("open")
+        for _ in range(steps):
+            if self.errors:
+                break
+            if think_seconds:
+                time.sleep(self.rng.expovariate(1 / think_seconds))
+            if self.rng.random() < NAVIGATE_SHARE:
+                self.page = self.rng.choice([page for page in PAGES if page != self.page])
+                self.app.switch_page(self.page)
+                self.rerun("navigate")
+            else:
+                randomize_filters(self.app, self.rng)
+                self.rerun("filter")
+        return self
+
+
+def percentiles(values: Sequence[float]) -> Dict[str, float]:
+    values = np.asarray(values, dtype=np.float64)
+    return {
+        "count": int(len(values)),
+        "p50": float(np.quantile(values, 0.5)),
+        "p95": float(np.quantile(values, 0.95)),
+        "p99": float(np.quantile(values, 0.99)),
+        "max": float(values.max()),
+    }
+
+
+def load_test(
+    sessions: int,
+    steps: int,
+    concurrency: Optional[int] = None,
+    seed: int = 0,
+    think_seconds: float = 0.0,
+) -> Dict:
+    """Warm the process with one session over every page, then play ``sessions`` at once.
+
+    Sessions pause for a random time averaging ``think_seconds`` between
+    steps, as users do (0: back-to-back reruns, the worst case). They are kept
+    alive until the end, so the memory figures include their session state,
+    as for connected users. The warm-up pays the one-off costs (imports, the
+    shared dataset), so the per-session figures are what each session added
+    during its own reruns, including the cache entries it filled.
+    """
+    warmup = Session(-1, seed)
+    warmup.rerun("open")
+    for page in PAGES[1:]:
+        warmup.page = page
+        warmup.app.switch_page(page)
+        warmup.rerun("navigate")
+    if warmup.errors:
+        raise RuntimeError(f"Warm-up failed: {warmup.errors}")
+    tracing.RECORDER.reset()  # stage timings of the measured run only
+    rss_start = rss_mb()
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency or sessions, thread_name_prefix="session") as pool:
+        players = [Session(i, seed + i + 1) for i in range(sessions)]
+        done = list(pool.map(lambda session: session.play(steps, think_seconds), players))
+    wall = time.perf_counter() - started
+    rss_end = rss_mb()
+
+    timings = [t for session in done for t in session.timings]
+    by_step: Dict[str, List[float]] = defaultdict(list)
+    for t in timings:
+        by_step[f"{t['page']} {t['step']}"].append(t["seconds"])
+    return {
+        "sessions": sessions,
+        "concurrency": concurrency or sessions,
+        "steps": steps,
+        "think_seconds": think_seconds,
+        "reruns": len(timings),
+        "errors": [error for session in done for error in session.errors],
+        "wall_seconds": wall,
+        "throughput_rps": len(timings) / wall,
+        "latency": percentiles([t["seconds"] for t in timings]),
+        "service": percentiles([t["service"] for t in timings]),
+        "latency_by_step": {name: percentiles(values) for name, values in sorted(by_step.items())},
+        "stages": tracing.RECORDER.summary(),
+        "query_cache": query.cache_stats(),
+        "memory": {
+            "rss_start_mb": rss_start,
+            "rss_end_mb": rss_end,
+            "per_session_mb": percentiles([session.rss_added_mb for session in done]),
+            "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        },
+        "threads": threading.active_count(),
+    }
+
+
+def print_report(report: Dict) -> None:
+    latency = report["latency"]
+    print(
+        f"{report['sessions']} sessions ({report['concurrency']} concurrent), {report['reruns']} reruns "
+        f"in {report['wall_seconds']:.1f} s: {report['throughput_rps']:.1f} reruns/s"
+    )
+    service = report["service"]
+    print(f"rerun latency p50 {latency['p50'] * 1e3:.0f} ms, p95 {latency['p95'] * 1e3:.0f} ms, p99 {latency['p99'] * 1e3:.0f} ms")
+    print(f"service time  p50 {service['p50'] * 1e3:.0f} ms, p95 {service['p95'] * 1e3:.0f} ms, p99 {service['p99'] * 1e3:.0f} ms")
+    for name, stats in report["latency_by_step"].items():
+        print(f"  {name:<38} n={stats['count']:<5} p50 {stats['p50'] * 1e3:8.0f} ms  p95 {stats['p95'] * 1e3:8.0f} ms")
+    memory = report["memory"]
+    per_session = memory["per_session_mb"]
+    print(
+        f"RSS {memory['rss_start_mb']:.0f} -> {memory['rss_end_mb']:.0f} MB, added per session p50 "
+        f"{per_session['p50']:+.2f} MB, max {per_session['max']:+.2f} MB; "
+        f"query cache hit rate {report['query_cache']['hit_rate']:.0%}"
+    )
+    for error in report["errors"]:
+        print(f"ERROR {error}")
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sessions", type=int, default=8)
+    parser.add_argument("--steps", type=int, default=20, help="random reruns per session after opening the app")
+    parser.add_argument("--concurrency", type=int, default=None, help="sessions running at once (default: all)")
+    parser.add_argument("--think", type=float, default=0.0, help="mean pause between a session's steps, in seconds")
+    parser.add_argument("--rows", default="100k", help=f"synthetic dataset size, from {', '.join(run.SIZES)} or a row count")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default=str(ROOT / "benchmarks" / "loadtest.json"))
+    args = parser.parse_args(argv)
+
+    logging.disable(logging.WARNING)  # Streamlit warns about running outside "streamlit run"
+    output = Path(args.output).resolve()
+    with tempfile.TemporaryDirectory(prefix="dashboard-load-") as workdir:
+        sample = Path(workdir, "data", "sample")
+        sample.mkdir(parents=True)
+        run.prepare(run.parse_size(args.rows), sample, name="transactions.csv")
+        previous = os.getcwd()
+        os.chdir(workdir)  # the app reads data/sample/transactions.csv and data/incoming/ from the working directory
+        try:
+            report = load_test(args.sessions, args.steps, args.concurrency, args.seed, args.think)
+        finally:
+            os.chdir(previous)
+    report["rows"] = args.rows
+    report["meta"] = run.metadata()
+    output.write_text(json.dumps(report, indent=1), encoding="utf-8")
+    print_report(report)
+    print(f"Results written to {output}")
+    return 1 if report["errors"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
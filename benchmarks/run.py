@@ -0,0 +1,271 @@
+"""Benchmark the dashboard pipeline stage by stage on synthetic datasets.
+
+Usage (from the repository root)::
+
+    python -m benchmarks.run --sizes 100k,1M --output benchmarks/results.json
+    python -m benchmarks.run --sizes 100k,1M --baseline benchmarks/baseline.json --threshold 0.25
+    python -m benchmarks.run --sizes 100k,1M,10M,50M --save-baseline benchmarks/baseline.json
+
+Every stage is timed separately (median and min of ``--repeat`` runs) with its
+peak traced memory. Results are written as JSON. With ``--baseline``, a stage
+slower than the baseline by more than its threshold (``--threshold`` overall,
+``--stage-threshold name=ratio`` per stage) or using more than
+``--memory-threshold`` extra peak memory is reported, and the exit code is 1.
+"""
+from __future__ import annotations
+
+import argparse
+import gc
+import importlib.util
+import json
+import logging
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Sequence
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+
+import numpy as np  # noqa: E402
+import pandas as pd  # noqa: E402
+
+from services import column_store, parallel, query  # noqa: E402
+from services.data_loader import generate_synthetic_data, read_sample_data  # noqa: E402
+from services.filter_engine import FilterIndex  # noqa: E402
+from viz.charts import build_bar_by_segment, build_time_series  # noqa: E402
+from viz.downsample import CHART_WIDTH_PX  # noqa: E402
+from viz.plotly_3d import build_mini_3d_scene  # noqa: E402
+
+
+SIZES = {"100k": 100_000, "1M": 1_000_000, "10M": 10_000_000, "50M": 50_000_000}
+DEFAULT_SIZES = "100k,1M"
+NUM_DAYS = 365
+# Share of customers with a row on a given day in the synthetic generator (between 1/3 and 1/2)
+ROWS_PER_CUSTOMER_DAY = 5 / 12
+STAGES = (
+    "load",
+    "filter_index",
+    "cube",
+    "filter",
+    "kpis",
+    "time_series",
+    "bar_by_segment",
+    "heatmap",
+    "mini_3d",
+    "serialize",
+)
+
+
+def _load_page(name: str):
+    spec = importlib.util.spec_from_file_location(name.replace(".py", ""), ROOT / "pages" / name)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def parse_size(text: str) -> int:
+    return SIZES.get(text, None) or int(float(text))
+
+
+def size_label(rows: int) -> str:
+    for label, value in SIZES.items():
+        if value == rows:
+            return label
+    return str(rows)
+
+
+def prepare(rows: int, workdir: Path, name: Optional[str] = None) -> str:
+    """Synthetic dataset of about ``rows`` rows, stored as the app stores it (CSV + columnar cache)."""
+    num_customers = max(10, round(rows / (NUM_DAYS * ROWS_PER_CUSTOMER_DAY)))
+    df = generate_synthetic_data(num_days=NUM_DAYS, num_customers=num_customers, end_date="2024-12-31")
+    csv_path = workdir / (name or f"transactions_{size_label(rows)}.csv")
+    csv_path.write_text(",".join(df.columns) + "\n", encoding="utf-8")  # the app only parses it when the cache is stale
+    column_store.write_columns(df, column_store.cache_dir_for(csv_path))
+    return str(csv_path)
+
+
+def measure(func: Callable[[], object], repeat: int, warmup: int = 1) -> Dict[str, float]:
+    """Median/min seconds over ``repeat`` runs and the largest traced peak (MB).
+
+    ``warmup`` untimed runs go first, so one-off costs (lazy imports, Plotly
+    templates) do not count.
+    """
+    for _ in range(warmup):
+        func()
+    timings, peak = [], 0
+    for _ in range(repeat):
+        gc.collect()
+        tracemalloc.reset_peak()
+        start_mem = tracemalloc.get_traced_memory()[0]
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+        peak = max(peak, tracemalloc.get_traced_memory()[1] - start_mem)
+    return {"seconds": statistics.median(timings), "seconds_min": min(timings), "peak_mb": peak / 2**20}
+
+
+def run_size(rows: int, workdir: Path, repeat: int = 3) -> List[Dict]:
+    portfolio = _load_page("2_Portfolio.py")
+    csv_path = prepare(rows, workdir)
+    state: Dict[str, object] = {}
+
+    def load():
+        state["df"] = read_sample_data(csv_path)
+
+    def filter_index():
+        state["index"] = FilterIndex(state["df"])
+
+    def cube():
+        state["cube"] = parallel.build_cube(state["index"].frame)
+        state["cube"].prefix_sums()  # built with the dataset, as on the first query
+
+    def filter_cube():
+        full = state["cube"]
+        filters = {
+            "start_date": full.dates[len(full.dates) // 4],
+            "end_date": full.dates[-1],
+            "segments": ["Retail", "SME"],
+            "products": [],
+        }
+        _, normalized = query.normalize_filters(filters, full)
+        state["normalized"] = normalized
+        state["rows"] = state["index"].select(normalized)
+        state["selected"] = full.select(normalized)
+
+    def kpis():
+        query.compute_kpis(state["selected"], state["cube"].prefix_sums().totals(state["normalized"]))
+
+    def figure(name: str, build: Callable[[], object]) -> Callable[[], None]:
+        def run():
+            state.setdefault("figures", {})[name] = build()
+        return run
+
+    def serialize():
+        for fig in state["figures"].values():
+            fig.to_json()
+
+    stages = {
+        "load": load,
+        "filter_index": filter_index,
+        "cube": cube,
+        "filter": filter_cube,
+        "kpis": kpis,
+        "time_series": figure("time_series", lambda: build_time_series(state["selected"], width_px=CHART_WIDTH_PX["wide"])),
+        "bar_by_segment": figure("bar_by_segment", lambda: build_bar_by_segment(state["selected"])),
+        "heatmap": figure("heatmap", lambda: portfolio.build_heatmap_segment_product(state["selected"])),
+        "mini_3d": figure("mini_3d", lambda: build_mini_3d_scene(state["selected"])),
+        "serialize": serialize,
+    }
+    results = []
+    for stage in STAGES:
+        result = measure(stages[stage], repeat)
+        results.append({"size": size_label(rows), "rows": len(state["df"]), "stage": stage, **result})
+        print(f"{size_label(rows):>6} {stage:<15} {result['seconds'] * 1e3:10.2f} ms {result['peak_mb']:10.1f} MB", flush=True)
+    return results
+
+
+def metadata() -> Dict:
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        "timestamp": pd.Timestamp.now(tz="UTC").isoformat(),
+        "commit": commit,
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "pandas": pd.__version__,
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "workers": parallel.resolve_workers(),
+    }
+
+
+def compare(
+    results: Sequence[Dict],
+    baseline: Sequence[Dict],
+    threshold: float,
+    stage_thresholds: Optional[Dict[str, float]] = None,
+    memory_threshold: Optional[float] = None,
+    min_seconds: float = 0.001,
+) -> List[str]:
+    """Regressions of ``results`` against ``baseline`` (matched on size and stage).
+
+    A stage regresses when its median time exceeds the baseline's by more than
+    its threshold ratio (stages faster than ``min_seconds`` in both are too
+    noisy to judge), or its peak memory by more than ``memory_threshold``.
+    """
+    stage_thresholds = stage_thresholds or {}
+    previous = {(entry["size"], entry["stage"]): entry for entry in baseline}
+    regressions = []
+    for entry in results:
+        old = previous.get((entry["size"], entry["stage"]))
+        if old is None:
+            continue
+        limit = stage_thresholds.get(entry["stage"], threshold)
+        if max(entry["seconds"], old["seconds"]) >= min_seconds and entry["seconds"] > old["seconds"] * (1 + limit):
+            regressions.append(
+                f"{entry['size']} {entry['stage']}: {entry['seconds'] * 1e3:.2f} ms vs {old['seconds'] * 1e3:.2f} ms "
+                f"(+{entry['seconds'] / old['seconds'] - 1:.0%}, limit +{limit:.0%})"
+            )
+        if memory_threshold is not None and entry["peak_mb"] > old["peak_mb"] * (1 + memory_threshold) + 1:
+            regressions.append(
+                f"{entry['size']} {entry['stage']}: peak {entry['peak_mb']:.1f} MB vs {old['peak_mb']:.1f} MB"
+            )
+    return regressions
+
+
+def _stage_threshold(text: str) -> tuple:
+    name, _, ratio = text.partition("=")
+    if name not in STAGES or not ratio:
+        raise argparse.ArgumentTypeError(f"expected <stage>=<ratio> with a stage in {', '.join(STAGES)}")
+    return name, float(ratio)
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", default=DEFAULT_SIZES, help=f"comma-separated, from {', '.join(SIZES)} or row counts")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--output", default=str(ROOT / "benchmarks" / "results.json"))
+    parser.add_argument("--baseline", help="JSON results to compare against")
+    parser.add_argument("--save-baseline", help="also write the results to this baseline file")
+    parser.add_argument("--threshold", type=float, default=0.25, help="allowed slowdown ratio (0.25 = +25%%)")
+    parser.add_argument("--stage-threshold", type=_stage_threshold, action="append", default=[])
+    parser.add_argument("--memory-threshold", type=float, default=None, help="allowed peak memory growth ratio")
+    args = parser.parse_args(argv)
+
+    logging.disable(logging.WARNING)  # Streamlit warns about running outside "streamlit run"
+    tracemalloc.start()
+    results: List[Dict] = []
+    with tempfile.TemporaryDirectory(prefix="dashboard-bench-") as workdir:
+        for size in args.sizes.split(","):
+            results += run_size(parse_size(size.strip()), Path(workdir), args.repeat)
+    tracemalloc.stop()
+
+    report = {"meta": metadata(), "results": results}
+    for path in filter(None, [args.output, args.save_baseline]):
+        Path(path).write_text(json.dumps(report, indent=1), encoding="utf-8")
+        print(f"Results written to {path}")
+
+    if args.baseline:
+        baseline = json.loads(Path(args.baseline).read_text(encoding="utf-8"))["results"]
+        regressions = compare(results, baseline, args.threshold, dict(args.stage_threshold), args.memory_threshold)
+        for line in regressions:
+            print(f"REGRESSION {line}")
+        if regressions:
+            return 1
+        print("No regression against the baseline")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
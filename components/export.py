@@ -0,0 +1,52 @@
+from __future__ import annotations
+
+import functools
+
+import streamlit as st
+
+from components.timing import traced_fragment
+from services.data_loader import COLUMNS
+from services.dataset import Dataset
+from services.export import COMPRESSIONS, EXPORT_MAX_BYTES, FORMATS, export_bytes, file_name, parquet_available
+from services.query import QueryResult
+
+
+def _file_stem(result: QueryResult) -> str:
+    start, end = result.filters.get("start_date"), result.filters.get("end_date")
+    stem = "transactions" if result.filters.get("mode") != "snapshot" else "snapshot"
+    if start is not None:
+        stem += f"_{start:%Y%m%d}"
+    if end is not None:
+        stem += f"_{end:%Y%m%d}"
+    return stem
+
+
+def render_export(dataset: Dataset, result: QueryResult) -> None:
+    """Sidebar download of the rows behind ``result``, streamed to a file chunk by chunk.
+
+    The file is only generated when the button is clicked (see
+    ``services.export``); changing an option reruns the export panel alone.
+    """
+    # A fragment may only create widgets inside its own container, so it is opened in the sidebar
+    with st.sidebar:
+        _render_export_panel(dataset, result)
+
+
+@traced_fragment("export")
+def _render_export_panel(dataset: Dataset, result: QueryResult) -> None:
+    with st.expander("Export"):
+        formats = [fmt for fmt in FORMATS if fmt != "parquet" or parquet_available()]
+        fmt = st.radio("Format", formats, format_func=str.upper, horizontal=True, key="export_format")
+        compression = st.selectbox(
+            "Compression", COMPRESSIONS[fmt], format_func=lambda codec: codec or "none", key=f"export_compression_{fmt}"
+        )
+        columns = st.multiselect("Columns", COLUMNS, default=COLUMNS, key="export_columns")
+        st.download_button(
+            "Download selection",
+            data=functools.partial(export_bytes, dataset, result.filters, fmt=fmt, columns=columns or None, compression=compression),
+            file_name=file_name(_file_stem(result), fmt, compression),
+            mime=FORMATS[fmt][1] if fmt == "parquet" or compression is None else "application/octet-stream",
+            on_click="ignore",
+            use_container_width=True,
+        )
+        st.caption(f"Files over {EXPORT_MAX_BYTES / 2**20:,.0f} MB are refused: write them with `python -m services.export`.")
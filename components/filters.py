@@ -6,10 +6,18 @@ from typing import Dict, List
 import pandas as pd
 import streamlit as st
 
+from services.filter_engine import FilterDomain
 
-def render_filters(df: pd.DataFrame) -> Dict:
-    min_date = pd.to_datetime(df["date"]).min() if "date" in df.columns else pd.Timestamp.today() - pd.Timedelta(days=365)
-    max_date = pd.to_datetime(df["date"]).max() if "date" in df.columns else pd.Timestamp.today()
+
+VIEW_LABELS = {"flows": "All rows in the period", "snapshot": "Snapshot at end date"}
+
+
+def render_filters(df: pd.DataFrame | FilterDomain, snapshot: bool = False) -> Dict:
+    """Sidebar filters; with ``snapshot``, also the choice between the period's rows and
+    each customer's latest row at the end date (when the raw rows are available)."""
+    domain = df if isinstance(df, FilterDomain) else FilterDomain.from_frame(df)
+    min_date = domain.min_date if domain.min_date is not None else pd.Timestamp.today() - pd.Timedelta(days=365)
+    max_date = domain.max_date if domain.max_date is not None else pd.Timestamp.today()
 
     with st.sidebar:
         st.header("Filters")
@@ -18,18 +26,27 @@ def render_filters(df: pd.DataFrame) -> Dict:
 
         segments: List[str] = []
         products: List[str] = []
-        if "segment" in df.columns:
-            segs = sorted([s for s in df["segment"].dropna().unique().tolist()])
-            segments = st.multiselect("Segments", segs, default=segs)
-        if "product" in df.columns:
-            prods = sorted([p for p in df["product"].dropna().unique().tolist()])
-            products = st.multiselect("Products", prods, default=prods)
+        if domain.segments:
+            segments = st.multiselect("Segments", domain.segments, default=domain.segments)
+        if domain.products:
+            products = st.multiselect("Products", domain.products, default=domain.products)
+
+        mode = "flows"
+        if snapshot and domain.snapshots:
+            mode = st.radio(
+                "View",
+                list(VIEW_LABELS),
+                format_func=VIEW_LABELS.get,
+                help="Snapshot: each customer's latest balance and status at the end date, counted once. "
+                "Customers last seen before the start date are left out.",
+            )
 
     return {
         "start_date": pd.Timestamp(start_date),
         "end_date": pd.Timestamp(end_date),
         "segments": segments,
         "products": products,
+        "mode": mode,
     }
 
 
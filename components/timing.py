@@ -0,0 +1,99 @@
+from __future__ import annotations
+
+import functools
+import os
+from typing import Any, Callable
+
+import pandas as pd
+import streamlit as st
+
+from services import tracing
+from services.query import QueryResult, cache_stats, figure, figure_cache_stats
+
+
+# Show the render timings panel in the sidebar (also with ?timings=1 in the URL)
+SHOW_TIMINGS = os.environ.get("DASHBOARD_TIMINGS", "0").lower() in ("1", "true", "yes")
+
+
+def timings_enabled() -> bool:
+    return SHOW_TIMINGS or st.query_params.get("timings") == "1"
+
+
+def traced_page(page: str) -> Callable[[Callable[[], None]], Callable[[], None]]:
+    """Decorate a page's ``main`` so every render is traced as ``page``."""
+
+    def decorate(main: Callable[[], None]) -> Callable[[], None]:
+        @functools.wraps(main)
+        def run() -> None:
+            with tracing.trace(page) as render:
+                main()
+            if timings_enabled():
+                render_timing_panel(render)
+
+        return run
+
+    return decorate
+
+
+def traced_fragment(name: str) -> Callable[[Callable[..., None]], Callable[..., None]]:
+    """Decorate a part of a page as an ``st.fragment``, traced as ``name`` when it reruns alone.
+
+    Interacting with a widget created inside the fragment reruns only that
+    function, with the arguments of the last full run (e.g. the same query
+    result), so chart options never reload, filter or re-aggregate the data.
+    During a full run its spans go to the page's trace as usual.
+    """
+
+    def decorate(part: Callable[..., None]) -> Callable[..., None]:
+        @st.fragment
+        @functools.wraps(part)
+        def run(*args, **kwargs) -> None:
+            if tracing.current() is not None:
+                part(*args, **kwargs)
+                return
+            with tracing.trace(name):
+                part(*args, **kwargs)
+
+        return run
+
+    return decorate
+
+
+def render_chart(label: str, build: Callable[..., Any], result: QueryResult, **options) -> None:
+    """Send the figure ``build(result.cube, **options)`` to the browser, timing both steps.
+
+    Figures are cached with the query result (see ``services.query.figure``),
+    so the build is skipped for views already shown or precomputed.
+    """
+    with tracing.span("figure", label):
+        fig = figure(result, build, **options)
+    with tracing.span("serialize", label):
+        st.plotly_chart(fig, use_container_width=True)
+
+
+def render_timing_panel(render: tracing.Trace) -> None:
+    """Sidebar breakdown of the render that just finished, and this page's p50/p95."""
+    with st.sidebar.expander("Render timings", expanded=True):
+        st.caption(f"Total: {render.seconds * 1e3:,.1f} ms")
+        spans = pd.DataFrame(
+            [{"stage": s.stage, "detail": s.label, "ms": round(s.seconds * 1e3, 2)} for s in render.spans]
+        )
+        st.dataframe(spans, hide_index=True, use_container_width=True)
+        stats, figures = cache_stats(), figure_cache_stats()
+        st.caption(
+            f"Query cache: {render.notes.get('query_cache', '-')} "
+            f"(hit rate {stats['hit_rate']:.0%}, {stats['entries']} entries). "
+            f"Figure cache: hit rate {figures['hit_rate']:.0%}, {figures['entries']} entries"
+        )
+        history = [row for row in tracing.RECORDER.summary() if row["page"] == render.page]
+        if history:
+            st.dataframe(
+                pd.DataFrame(
+                    [
+                        {"stage": row["stage"], "p50 ms": round(row["p50"] * 1e3, 2), "p95 ms": round(row["p95"] * 1e3, 2), "renders": row["window"]}
+                        for row in history
+                    ]
+                ),
+                hide_index=True,
+                use_container_width=True,
+            )
@@ -1,30 +1,42 @@
 import pandas as pd
 import streamlit as st
 
+from components.export import render_export
 from components.filters import render_filters
 from components.menu import render_sidebar_menu
 from components.layout import render_top_nav
-from services.data_loader import load_sample_data
+from components.timing import render_chart, traced_page
+from services import tracing
+from services.cube import Cube
+from services.query import load_dataset, run_query
 from viz.charts import build_bar_by_segment
-import plotly.express as px
 
 
 st.set_page_config(page_title="Portfolio", page_icon="📁", layout="wide")
 
 
-def build_bar_by_product(df: pd.DataFrame):
-    if df.empty or "product" not in df.columns:
+def build_bar_by_product(df: pd.DataFrame | Cube):
+    import plotly.express as px
+    if df.empty or (not isinstance(df, Cube) and "product" not in df.columns):
         return px.bar(title="No data")
-    agg = df.groupby("product", as_index=False)["balance"].sum().sort_values("balance", ascending=False)
+    if isinstance(df, Cube):
+        agg = df.by_product()[["product", "balance"]]
+    else:
+        agg = df.groupby("product", as_index=False, observed=True)["balance"].sum()
+    agg = agg.sort_values("balance", ascending=False)
     fig = px.bar(agg, x="product", y="balance", title="Balance by product")
     fig.update_layout(margin=dict(l=10, r=10, t=40, b=10))
     return fig
 
 
-def build_heatmap_segment_product(df: pd.DataFrame):
-    if df.empty or not {"segment", "product"}.issubset(df.columns):
+def build_heatmap_segment_product(df: pd.DataFrame | Cube):
+    import plotly.express as px
+    if df.empty or (not isinstance(df, Cube) and not {"segment", "product"}.issubset(df.columns)):
         return px.imshow([[0]], labels=dict(x="Product", y="Segment", color="Balance"), title="No data")
-    pivot = df.pivot_table(index="segment", columns="product", values="balance", aggfunc="sum", fill_value=0.0)
+    if isinstance(df, Cube):
+        pivot = df.pivot("balance")
+    else:
+        pivot = df.pivot_table(index="segment", columns="product", values="balance", aggfunc="sum", fill_value=0.0, observed=True)
     fig = px.imshow(
         pivot,
         labels=dict(x="Product", y="Segment", color="Balance"),
@@ -36,31 +48,29 @@ def build_heatmap_segment_product(df: pd.DataFrame):
     return fig
 
 
+@traced_page("portfolio")
 def main() -> None:
     render_top_nav(active="portfolio")
     render_sidebar_menu()
     st.title("Portfolio")
 
-    df = load_sample_data()
-    filters = render_filters(df)
-
-    mask = (df["date"] >= pd.to_datetime(filters["start_date"])) & (df["date"] <= pd.to_datetime(filters["end_date"]))
-    if filters["segments"]:
-        mask &= df["segment"].isin(filters["segments"])
-    if filters["products"]:
-        mask &= df["product"].isin(filters["products"])
-    filtered = df.loc[mask].copy()
+    with tracing.span("load"):
+        dataset = load_dataset()
+    with tracing.span("filters"):
+        filters = render_filters(dataset.domain, snapshot=True)
+    result = run_query(filters)
+    render_export(dataset, result)
 
     col1, col2 = st.columns(2)
     with col1:
         st.subheader("Encours par produit")
-        st.plotly_chart(build_bar_by_product(filtered), use_container_width=True)
+        render_chart("bar_by_product", build_bar_by_product, result)
     with col2:
         st.subheader("Encours par segment")
-        st.plotly_chart(build_bar_by_segment(filtered), use_container_width=True)
+        render_chart("bar_by_segment", build_bar_by_segment, result)
 
     st.subheader("Composition segment x produit")
-    st.plotly_chart(build_heatmap_segment_product(filtered), use_container_width=True)
+    render_chart("heatmap", build_heatmap_segment_product, result)
 
 
 if __name__ == "__main__":
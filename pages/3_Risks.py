@@ -1,71 +1,143 @@
+from typing import Optional
+
+import numpy as np
 import pandas as pd
 import streamlit as st
-import plotly.express as px
 
+from components.export import render_export
 from components.filters import render_filters
 from components.menu import render_sidebar_menu
 from components.layout import render_top_nav
-from services.data_loader import load_sample_data
+from components.timing import render_chart, traced_fragment, traced_page
+from services.cube import Cube
+from services.histogram import DEFAULT_BINS, edges_for
+from services import tracing
+from services.query import QueryResult, load_dataset, run_query
+from viz.charts import rolling_series, with_note
+from viz.downsample import CHART_WIDTH_PX, downsample_frame
 
 
 st.set_page_config(page_title="Risks", page_icon="⚠️", layout="wide")
 
 
-def build_delinquency_timeseries(df: pd.DataFrame):
-    if df.empty or "delinquent" not in df.columns:
+def build_delinquency_timeseries(df: pd.DataFrame | Cube, width_px: Optional[int] = None, downsample: str = "lttb"):
+    import plotly.express as px
+    if df.empty or (not isinstance(df, Cube) and "delinquent" not in df.columns):
         return px.line(title="Aucune donnée")
-    df = df.copy()
-    df["date"] = pd.to_datetime(df["date"]).dt.floor("D")
-    daily = df.groupby("date", as_index=False)["delinquent"].mean()
+    if isinstance(df, Cube):
+        daily = df.daily()
+        daily = daily[["date"]].assign(delinquent=daily["delinquent"] / daily["count"])
+    else:
+        df = df.copy()
+        df["date"] = pd.to_datetime(df["date"]).dt.floor("D")
+        daily = df.groupby("date", as_index=False)["delinquent"].mean()
     daily["delinquency_rate"] = daily["delinquent"] * 100.0
-    fig = px.line(daily, x="date", y="delinquency_rate", markers=True, title="Taux de défaut quotidien (%)")
+    daily, note = downsample_frame(daily, "date", "delinquency_rate", width_px, downsample)
+    fig = px.line(daily, x="date", y="delinquency_rate", markers=note is None, title=with_note("Taux de défaut quotidien (%)", note))
     fig.update_layout(margin=dict(l=10, r=10, t=40, b=10))
     return fig
 
 
-def build_delinquency_by_segment(df: pd.DataFrame):
-    if df.empty or not {"segment", "delinquent"}.issubset(df.columns):
+def build_rolling_delinquency(df: pd.DataFrame | Cube, width_px: Optional[int] = None, downsample: str = "lttb"):
+    import plotly.express as px
+    if df.empty:
+        return px.line(title="Aucune donnée")
+    rolling, note = rolling_series(df, "delinquency_rate", width_px=width_px, downsample=downsample)
+    rolling["window"] = rolling["window"].str.replace("days", "jours")
+    fig = px.line(rolling, x="date", y="delinquency_rate", color="window", title=with_note("Taux de défaut glissant (%)", note))
+    fig.update_layout(margin=dict(l=10, r=10, t=40, b=10), legend_title_text="")
+    return fig
+
+
+def build_delinquency_by_segment(df: pd.DataFrame | Cube):
+    import plotly.express as px
+    if df.empty or (not isinstance(df, Cube) and not {"segment", "delinquent"}.issubset(df.columns)):
         return px.bar(title="Aucune donnée")
-    agg = df.groupby("segment", as_index=False)["delinquent"].mean()
+    if isinstance(df, Cube):
+        agg = df.by_segment()
+        agg = agg[["segment"]].assign(delinquent=agg["delinquent"] / agg["count"])
+    else:
+        agg = df.groupby("segment", as_index=False, observed=True)["delinquent"].mean()
     agg["rate"] = agg["delinquent"] * 100.0
     fig = px.bar(agg, x="segment", y="rate", title="Taux de défaut par segment (%)")
     fig.update_layout(margin=dict(l=10, r=10, t=40, b=10))
     return fig
 
 
-def build_distribution_balance(df: pd.DataFrame):
-    if df.empty or "balance" not in df.columns:
+BINNING_LABELS = {"linear": "Linéaire", "log": "Logarithmique", "quantile": "Quantiles"}
+
+
+def build_distribution_balance(df: pd.DataFrame | Cube, mode: str = "linear", bins: int = DEFAULT_BINS):
+    """Balance histogram binned server-side; only the bins are sent to the browser.
+
+    ``mode`` is "linear", "log" (signed log bins) or "quantile" (equal-count
+    bins). With variable-width bins the bars show a density (accounts per €).
+    """
+    import plotly.express as px
+    import plotly.graph_objects as go
+    if df.empty or (not isinstance(df, Cube) and "balance" not in df.columns):
         return px.histogram(title="Aucune donnée")
-    fig = px.histogram(df, x="balance", nbins=50, title="Distribution des encours")
-    fig.update_layout(margin=dict(l=10, r=10, t=40, b=10))
+    if isinstance(df, Cube):
+        edges, counts = df.histogram(mode)
+    else:
+        values = df["balance"].to_numpy()
+        edges = edges_for(mode, values, bins)
+        counts = np.histogram(np.clip(values, edges[0], edges[-1]), bins=edges)[0]
+    widths = np.diff(edges)
+    density = mode != "linear"
+    fig = go.Figure(
+        go.Bar(
+            x=edges[:-1] + widths / 2,
+            y=counts / widths if density else counts,
+            width=widths,
+            customdata=np.column_stack([edges[:-1], edges[1:], counts]),
+            hovertemplate="%{customdata[0]:,.0f} – %{customdata[1]:,.0f} €<br>Comptes: %{customdata[2]:,}<extra></extra>",
+            marker_line_width=0,
+        )
+    )
+    fig.update_layout(
+        title="Distribution des encours",
+        xaxis_title="balance",
+        yaxis_title="comptes par €" if density else "count",
+        bargap=0,
+        margin=dict(l=10, r=10, t=40, b=10),
+    )
     return fig
 
 
+@traced_fragment("risks.distribution")
+def render_distribution(result: QueryResult) -> None:
+    """Balance histogram: switching the binning reruns only this part."""
+    st.subheader("Distribution des encours")
+    mode = st.radio("Classes", list(BINNING_LABELS), format_func=BINNING_LABELS.get, horizontal=True)
+    render_chart("distribution", build_distribution_balance, result, mode=mode)
+
+
+@traced_page("risks")
 def main() -> None:
     render_top_nav(active="risks")
     render_sidebar_menu()
     st.title("Risks")
 
-    df = load_sample_data()
-    filters = render_filters(df)
-
-    mask = (df["date"] >= pd.to_datetime(filters["start_date"])) & (df["date"] <= pd.to_datetime(filters["end_date"]))
-    if filters["segments"]:
-        mask &= df["segment"].isin(filters["segments"])
-    if filters["products"]:
-        mask &= df["product"].isin(filters["products"])
-    filtered = df.loc[mask].copy()
+    with tracing.span("load"):
+        dataset = load_dataset()
+    with tracing.span("filters"):
+        filters = render_filters(dataset.domain)
+    result = run_query(filters)
+    render_export(dataset, result)
 
     col1, col2 = st.columns(2)
     with col1:
         st.subheader("Taux de défaut quotidien")
-        st.plotly_chart(build_delinquency_timeseries(filtered), use_container_width=True)
+        render_chart("delinquency_timeseries", build_delinquency_timeseries, result, width_px=CHART_WIDTH_PX["half"])
     with col2:
         st.subheader("Taux de défaut par segment")
-        st.plotly_chart(build_delinquency_by_segment(filtered), use_container_width=True)
+        render_chart("delinquency_by_segment", build_delinquency_by_segment, result)
 
-    st.subheader("Distribution des encours")
-    st.plotly_chart(build_distribution_balance(filtered), use_container_width=True)
+    st.subheader("Taux de défaut glissant (7/30/90 jours)")
+    render_chart("rolling_delinquency", build_rolling_delinquency, result, width_px=CHART_WIDTH_PX["full"])
+
+    render_distribution(result)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,145 @@
+from __future__ import annotations
+
+import json
+import os
+import shutil
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+
+
+META_FILE = "meta.json"
+FORMAT_VERSION = 1
+
+
+def cache_dir_for(source: str | os.PathLike) -> Path:
+    """Columnar cache directory stored next to a source file (``x.csv`` -> ``x.columns``)."""
+    path = Path(source)
+    return path.with_name(path.stem + ".columns")
+
+
+def is_fresh(cache_dir: str | os.PathLike, source: Optional[str | os.PathLike] = None) -> bool:
+    """True if the cache exists and is not older than ``source`` (when given)."""
+    meta_path = Path(cache_dir, META_FILE)
+    if not meta_path.exists():
+        return False
+    if source is None or not Path(source).exists():
+        return True
+    return Path(source).stat().st_mtime_ns <= meta_path.stat().st_mtime_ns
+
+
+def _codes_dtype(num_categories: int) -> np.dtype:
+    for dtype in (np.int8, np.int16, np.int32):
+        if num_categories < np.iinfo(dtype).max:
+            return np.dtype(dtype)
+    return np.dtype(np.int64)
+
+
+def write_columns(df: pd.DataFrame, cache_dir: str | os.PathLike) -> Path:
+    """Write ``df`` as one ``.npy`` file per column plus a JSON dictionary.
+
+    Datetimes are stored as int64 ticks, text and categorical columns as integer
+    codes with their dictionary in ``meta.json``. The directory is written
+    next to its final location and swapped in at the end, so readers never see a
+    partial cache.
+    """
+    target = Path(cache_dir)
+    tmp = target.with_name(target.name + ".tmp")
+    shutil.rmtree(tmp, ignore_errors=True)
+    tmp.mkdir(parents=True)
+
+    columns: List[Dict] = []
+    for name in df.columns:
+        series = df[name]
+        entry: Dict = {"name": str(name)}
+        if isinstance(series.dtype, pd.CategoricalDtype):
+            categories = series.cat.categories.tolist()
+            values = series.cat.codes.to_numpy().astype(_codes_dtype(len(categories)))
+            entry.update(kind="category", categories=categories, ordered=bool(series.cat.ordered))
+        elif pd.api.types.is_datetime64_any_dtype(series.dtype):
+            values = series.to_numpy()
+            unit = np.datetime_data(values.dtype)[0]
+            values = values.view(np.int64)
+            entry.update(kind="datetime", unit=unit)
+        elif pd.api.types.is_numeric_dtype(series.dtype) or pd.api.types.is_bool_dtype(series.dtype):
+            values = series.to_numpy()
+            entry.update(kind="numeric")
+        else:
+            codes, uniques = pd.factorize(series, use_na_sentinel=True)
+            values = codes.astype(_codes_dtype(len(uniques)))
+            entry.update(kind="string", categories=[str(u) for u in uniques])
+        np.save(tmp / f"{name}.npy", np.ascontiguousarray(values), allow_pickle=False)
+        columns.append(entry)
+
+    meta = {"version": FORMAT_VERSION, "rows": int(len(df)), "columns": columns}
+    (tmp / META_FILE).write_text(json.dumps(meta), encoding="utf-8")
+
+    shutil.rmtree(target, ignore_errors=True)
+    os.replace(tmp, target)
+    return target
+
+
+def read_meta(cache_dir: str | os.PathLike) -> Dict:
+    return json.loads(Path(cache_dir, META_FILE).read_text(encoding="utf-8"))
+
+
+def read_columns(
+    cache_dir: str | os.PathLike,
+    columns: Optional[Sequence[str]] = None,
+    mmap: bool = True,
+) -> pd.DataFrame:
+    """Read the cache back into a DataFrame, loading only ``columns`` (all by default).
+
+    With ``mmap`` the arrays are memory-mapped read-only, so numeric and
+    datetime columns are paged in lazily by the OS instead of being read upfront.
+    """
+    meta = read_meta(cache_dir)
+    entries = {entry["name"]: entry for entry in meta["columns"]}
+    names = list(entries) if columns is None else list(columns)
+    unknown = [name for name in names if name not in entries]
+    if unknown:
+        raise KeyError(f"Columns not in cache: {unknown}")
+
+    arrays = {
+        name: np.load(Path(cache_dir, f"{name}.npy"), mmap_mode="r" if mmap else None, allow_pickle=False)
+        for name in names
+    }
+    return _frame(arrays, entries, names)
+
+
+def iter_column_chunks(
+    cache_dir: str | os.PathLike,
+    chunk_rows: int,
+    columns: Optional[Sequence[str]] = None,
+) -> Iterator[pd.DataFrame]:
+    """Read the cache back ``chunk_rows`` rows at a time.
+
+    The arrays are memory-mapped and sliced before any frame is built, so only
+    one chunk is ever materialized.
+    """
+    meta = read_meta(cache_dir)
+    entries = {entry["name"]: entry for entry in meta["columns"]}
+    names = list(entries) if columns is None else list(columns)
+    arrays = {name: np.load(Path(cache_dir, f"{name}.npy"), mmap_mode="r", allow_pickle=False) for name in names}
+    for start in range(0, meta["rows"], chunk_rows):
+        chunk = _frame({name: values[start:start + chunk_rows] for name, values in arrays.items()}, entries, names)
+        chunk.index = pd.RangeIndex(start, start + len(chunk))
+        yield chunk
+
+
+def _frame(arrays: Dict[str, np.ndarray], entries: Dict[str, Dict], names: List[str]) -> pd.DataFrame:
+    data = {}
+    for name in names:
+        entry, values = entries[name], np.asarray(arrays[name])  # plain ndarray views of the maps
+        kind = entry["kind"]
+        if kind == "datetime":
+            data[name] = values.view(f"datetime64[{entry['unit']}]")
+        elif kind == "category":
+            data[name] = pd.Categorical.from_codes(values, categories=entry["categories"], ordered=entry["ordered"])
+        elif kind == "string":
+            data[name] = pd.Categorical.from_codes(values, categories=entry["categories"]).astype(object)
+        else:
+            data[name] = values
+    return pd.DataFrame(data, columns=names, copy=False)
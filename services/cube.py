@@ -0,0 +1,372 @@
+from __future__ import annotations
+
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+from services.distinct import CustomerBitmaps, HyperLogLogSketch, accumulate_sketch, build_sketch, merge_sketches
+from services.histogram import DEFAULT_BINS, MODES as HISTOGRAM_MODES, Histogram, build_histograms
+from services.prefix import PrefixSums
+
+
+MEASURES = ("balance", "count", "delinquent")
+Sketch = CustomerBitmaps | HyperLogLogSketch
+
+
+def _codes(series: pd.Series, categories: List[str]) -> np.ndarray:
+    """Integer codes of ``series`` against ``categories`` (-1 for values outside)."""
+    if isinstance(series.dtype, pd.CategoricalDtype) and series.cat.categories.tolist() == categories:
+        return series.cat.codes.to_numpy()
+    return pd.Categorical(series, categories=categories).codes
+
+
+class Cube:
+    """Dense day x segment x product aggregate of the transactions frame.
+
+    Each cell holds sum(balance), count of rows and sum(delinquent), plus a
+    distinct-customer sketch and balance histograms sliced alongside; the day
+    axis covers every calendar day between the first and last date, empty days
+    included. KPIs and charts roll up from the cells, so their cost depends on
+    the number of cells and not on the number of rows. Roll-ups only report
+    days/categories that have rows, like ``groupby(..., observed=True)``.
+    """
+
+    def __init__(
+        self,
+        start: np.datetime64,
+        segments: List[str],
+        products: List[str],
+        measures: Dict[str, np.ndarray],
+        customers: Optional[Sketch] = None,
+        histograms: Optional[Dict[str, Histogram]] = None,
+    ):
+        self.start = np.datetime64(start, "D")
+        self.segments = list(segments)
+        self.products = list(products)
+        self.measures = measures
+        self.customers = customers
+        self.histograms = histograms or {}
+        self._prefix: Optional[PrefixSums] = None
+
+    @classmethod
+    def from_frame(
+        cls,
+        df: pd.DataFrame,
+        segments: Optional[List[str]] = None,
+        products: Optional[List[str]] = None,
+        distinct: Optional[str] = None,
+        distinct_error: Optional[float] = None,
+        histogram_modes: Sequence[str] = HISTOGRAM_MODES,
+        histogram_bins: int = DEFAULT_BINS,
+        histogram_edges: Optional[Dict[str, np.ndarray]] = None,
+        sketch_like: Optional[Sketch] = None,
+    ) -> "Cube":
+        """Aggregate raw rows.
+
+        ``distinct`` picks the customer sketch (see ``services.distinct``);
+        ``histogram_*`` control the per-cell balance histograms (see
+        ``services.histogram``), pass ``histogram_edges`` to share bins with
+        another cube.
+        """
+        if segments is None:
+            segments = _categories(df["segment"])
+        if products is None:
+            products = _categories(df["product"])
+        days = df["date"].to_numpy().astype("datetime64[D]")
+        if len(days) == 0:
+            start, num_days = np.datetime64("1970-01-01", "D"), 0
+        else:
+            start = days.min()
+            num_days = int((days.max() - start).astype(np.int64)) + 1
+        shape = (num_days, len(segments), len(products))
+
+        seg = _codes(df["segment"], segments)
+        prod = _codes(df["product"], products)
+        keep = (seg >= 0) & (prod >= 0)
+        flat = ((days - start).astype(np.int64) * len(segments) + seg) * len(products) + prod
+        balance = df["balance"].to_numpy()
+        delinquent = df["delinquent"].to_numpy() if "delinquent" in df.columns else np.zeros(len(df), dtype=np.int8)
+        customer_ids = df["customer_id"].to_numpy() if "customer_id" in df.columns else None
+        if not keep.all():
+            flat, balance, delinquent = flat[keep], balance[keep], delinquent[keep]
+            customer_ids = None if customer_ids is None else customer_ids[keep]
+        size = int(np.prod(shape))
+        measures = {
+            "balance": np.bincount(flat, weights=balance.astype(np.float64), minlength=size).reshape(shape),
+            "count": np.bincount(flat, minlength=size).reshape(shape),
+            "delinquent": np.bincount(flat, weights=delinquent, minlength=size).astype(np.int64).reshape(shape),
+        }
+        customers = None if customer_ids is None else build_sketch(
+            flat, customer_ids, shape, mode=distinct, error=distinct_error, like=sketch_like
+        )
+        histograms = build_histograms(flat, balance, shape, histogram_modes, histogram_bins, histogram_edges)
+        return cls(start, segments, products, measures, customers, histograms)
+
+    @classmethod
+    def zeros(
+        cls,
+        start: np.datetime64,
+        num_days: int,
+        segments: List[str],
+        products: List[str],
+        customers: Optional[Sketch] = None,
+        histogram_edges: Optional[Dict[str, np.ndarray]] = None,
+    ) -> "Cube":
+        """All-zero cube over a fixed grid, e.g. the running total of streamed chunks.
+
+        ``customers`` is an (empty) sketch of that grid's shape.
+        """
+        shape = (num_days, len(segments), len(products))
+        measures = {
+            "balance": np.zeros(shape),
+            "count": np.zeros(shape, dtype=np.int64),
+            "delinquent": np.zeros(shape, dtype=np.int64),
+        }
+        histograms = {
+            mode: Histogram(edges, np.zeros(shape + (len(edges) - 1,), dtype=np.int32))
+            for mode, edges in (histogram_edges or {}).items()
+        }
+        return cls(np.datetime64(start, "D"), list(segments), list(products), measures, customers, histograms)
+
+    def template(self) -> "Cube":
+        """Zero-day cube with this one's categories, sketch kind and histogram edges.
+
+        It is all ``aggregate_like`` needs, and is cheap to send to a worker.
+        """
+        return Cube(
+            self.start,
+            self.segments,
+            self.products,
+            {name: values[:0] for name, values in self.measures.items()},
+            None if self.customers is None else self.customers.with_data(self.customers.data[:0]),
+            {mode: histogram.with_data(histogram.counts[:0]) for mode, histogram in self.histograms.items()},
+        )
+
+    def aggregate_like(self, df: pd.DataFrame) -> "Cube":
+        """Cube of ``df`` that can be merged into this one.
+
+        It uses the same categories (plus any new ones), the same kind of customer
+        sketch and the same histogram edges.
+        """
+        return Cube.from_frame(
+            df,
+            segments=self.segments + [s for s in _categories(df["segment"]) if s not in self.segments],
+            products=self.products + [p for p in _categories(df["product"]) if p not in self.products],
+            distinct="none" if self.customers is None else None,
+            sketch_like=self.customers,
+            histogram_modes=list(self.histograms),
+            histogram_edges={mode: histogram.edges for mode, histogram in self.histograms.items()},
+        )
+
+    def merge(self, other: "Cube") -> "Cube":
+        """Cell-wise union of two cubes over the union of their days and categories.
+
+        Measures and histograms add up, customer sketches are unioned. Histograms
+        are only kept when both sides use the same edges.
+        """
+        if other.num_days == 0:
+            return self
+        if self.num_days == 0:
+            return other
+        segments = self.segments + [s for s in other.segments if s not in self.segments]
+        products = self.products + [p for p in other.products if p not in self.products]
+        start = min(self.start, other.start)
+        num_days = int((max(self.start + self.num_days, other.start + other.num_days) - start).astype(np.int64))
+        shape = (num_days, len(segments), len(products))
+        grid = Cube(start, segments, products, {"count": np.broadcast_to(np.int8(0), shape)})
+        sides = (grid._grid_index(self), grid._grid_index(other))
+
+        def place(side: int, values: np.ndarray) -> np.ndarray:
+            out = np.zeros(shape + values.shape[3:], dtype=values.dtype)
+            out[sides[side]] = values
+            return out
+
+        measures = {name: place(0, values) + place(1, other.measures[name]) for name, values in self.measures.items()}
+        customers = merge_sketches(self.customers, other.customers, place)
+        histograms = {
+            mode: histogram.with_data(place(0, histogram.counts) + place(1, other.histograms[mode].counts))
+            for mode, histogram in self.histograms.items()
+            if mode in other.histograms and np.array_equal(histogram.edges, other.histograms[mode].edges)
+        }
+        return Cube(start, segments, products, measures, customers, histograms)
+
+    def accumulate(self, other: "Cube") -> "Cube":
+        """Add ``other`` into this cube's arrays in place, or ``merge`` when it does not fit.
+
+        Meant for a running total nobody else reads yet (e.g. while streaming
+        chunks): unlike ``merge`` it mutates ``self``. ``other`` fits when its
+        days, categories and customers lie inside this cube's grid and both
+        use the same sketch kind and histogram edges.
+        """
+        if other.num_days == 0:
+            return self
+        cells = self._grid_index(other)
+        if (
+            cells is None
+            or set(self.measures) != set(other.measures)
+            or (self.customers is None) != (other.customers is None)
+            or any(
+                mode not in other.histograms or not np.array_equal(h.edges, other.histograms[mode].edges)
+                for mode, h in self.histograms.items()
+            )
+        ):
+            return self.merge(other)
+        if self.customers is not None and not accumulate_sketch(self.customers, other.customers, cells):
+            return self.merge(other)
+        for name, values in self.measures.items():
+            values[cells] += other.measures[name]
+        for mode, histogram in self.histograms.items():
+            histogram.counts[cells] += other.histograms[mode].counts
+        self._prefix = None
+        return self
+
+    def _grid_index(self, other: "Cube") -> Optional[tuple]:
+        """``np.ix_`` index of ``other``'s cells in this cube, or None when they are not all in it."""
+        if not set(other.segments) <= set(self.segments) or not set(other.products) <= set(self.products):
+            return None
+        first_day = int((other.start - self.start).astype(np.int64))
+        if first_day < 0 or first_day + other.num_days > self.num_days:
+            return None
+        return np.ix_(
+            np.arange(first_day, first_day + other.num_days),
+            [self.segments.index(s) for s in other.segments],
+            [self.products.index(p) for p in other.products],
+        )
+
+    # -- shape -----------------------------------------------------------------
+
+    @property
+    def num_days(self) -> int:
+        return self.measures["count"].shape[0]
+
+    @property
+    def dates(self) -> pd.DatetimeIndex:
+        days = self.start + np.arange(self.num_days)
+        return pd.DatetimeIndex(days.astype("datetime64[s]"), name="date")
+
+    @property
+    def nbytes(self) -> int:
+        arrays = list(self.measures.values()) + [h.data for h in self.histograms.values()]
+        if self.customers is not None:
+            arrays.append(self.customers.data)
+        return sum(values.nbytes for values in arrays)
+
+    @property
+    def empty(self) -> bool:
+        return not self.measures["count"].any()
+
+    # -- selection ---------------------------------------------------------------
+
+    def day_slice(self, start_date: Optional[pd.Timestamp], end_date: Optional[pd.Timestamp]) -> slice:
+        lo = 0 if start_date is None else (np.datetime64(pd.Timestamp(start_date).date(), "D") - self.start).astype(int)
+        hi = self.num_days if end_date is None else (np.datetime64(pd.Timestamp(end_date).date(), "D") - self.start).astype(int) + 1
+        lo, hi = min(max(0, int(lo)), self.num_days), min(max(0, int(hi)), self.num_days)
+        return slice(lo, max(lo, hi))
+
+    @staticmethod
+    def _axis_index(values: List[str], wanted: Optional[List[str]]) -> Optional[np.ndarray]:
+        """Positions of ``wanted`` in ``values``; None when the selection keeps everything."""
+        if not wanted:
+            return None
+        wanted_set = set(wanted)
+        if wanted_set.issuperset(values):
+            return None
+        return np.asarray([i for i, v in enumerate(values) if v in wanted_set], dtype=np.intp)
+
+    def select(self, filters: Dict) -> "Cube":
+        """Sub-cube for the dict returned by ``render_filters`` (empty list = all)."""
+        days = self.day_slice(filters.get("start_date"), filters.get("end_date"))
+        seg_idx = self._axis_index(self.segments, filters.get("segments"))
+        prod_idx = self._axis_index(self.products, filters.get("products"))
+
+        def cells(values: np.ndarray) -> np.ndarray:
+            values = values[days]
+            if seg_idx is not None:
+                values = values[:, seg_idx]
+            if prod_idx is not None:
+                values = values[:, :, prod_idx]
+            return values
+
+        measures = {name: cells(values) for name, values in self.measures.items()}
+        customers = None if self.customers is None else self.customers.with_data(cells(self.customers.data))
+        histograms = {mode: histogram.with_data(cells(histogram.data)) for mode, histogram in self.histograms.items()}
+        segments = self.segments if seg_idx is None else [self.segments[i] for i in seg_idx]
+        products = self.products if prod_idx is None else [self.products[i] for i in prod_idx]
+        return Cube(self.start + days.start, segments, products, measures, customers, histograms)
+
+    # -- roll-ups ----------------------------------------------------------------
+
+    def _rollup(self, axes: tuple) -> Dict[str, np.ndarray]:
+        return {name: self.measures[name].sum(axis=axes) for name in MEASURES}
+
+    def totals(self) -> Dict[str, float]:
+        sums = self._rollup((0, 1, 2))
+        return {"balance": float(sums["balance"]), "count": int(sums["count"]), "delinquent": int(sums["delinquent"])}
+
+    def prefix_sums(self) -> PrefixSums:
+        """Running totals along the day axis, built on first use and kept with the cube.
+
+        Date-range totals then take two lookups per cell (see ``PrefixSums``);
+        worth it for a cube queried many times, like a dataset's full cube.
+        """
+        prefix = self._prefix
+        if prefix is None:
+            prefix = self._prefix = PrefixSums.from_cube(self)
+        return prefix
+
+    def distinct_customers(self) -> Optional[int]:
+        """Distinct customers over all cells (approximate in HyperLogLog mode), None without sketch."""
+        return None if self.customers is None else self.customers.count()
+
+    def histogram(self, mode: str = "linear") -> Tuple[np.ndarray, np.ndarray]:
+        """``(edges, counts)`` of balances over all cells for a binning ``mode``."""
+        if mode not in self.histograms:
+            raise KeyError(f"No {mode!r} histogram in this cube (built: {sorted(self.histograms)})")
+        return self.histograms[mode].total()
+
+    def daily(self) -> pd.DataFrame:
+        """Columns: date, balance, count, delinquent (days with rows only)."""
+        sums = self._rollup((1, 2))
+        frame = pd.DataFrame({"date": self.dates, **sums})
+        return frame.loc[sums["count"] > 0].reset_index(drop=True)
+
+    def by_segment(self) -> pd.DataFrame:
+        sums = self._rollup((0, 2))
+        frame = pd.DataFrame({"segment": self.segments, **sums})
+        return frame.loc[sums["count"] > 0].reset_index(drop=True)
+
+    def by_product(self) -> pd.DataFrame:
+        sums = self._rollup((0, 1))
+        frame = pd.DataFrame({"product": self.products, **sums})
+        return frame.loc[sums["count"] > 0].reset_index(drop=True)
+
+    def by_segment_product(self) -> pd.DataFrame:
+        """One row per (segment, product) with rows, in cube order."""
+        sums = self._rollup((0,))
+        frame = pd.DataFrame(
+            {
+                "segment": np.repeat(self.segments, len(self.products)),
+                "product": np.tile(self.products, len(self.segments)),
+                **{name: values.ravel() for name, values in sums.items()},
+            }
+        )
+        return frame.loc[frame["count"] > 0].reset_index(drop=True)
+
+    def pivot(self, measure: str = "balance") -> pd.DataFrame:
+        """Segment x product matrix of ``measure``, restricted to observed segments/products."""
+        sums = self._rollup((0,))
+        counts = sums["count"]
+        seg_keep, prod_keep = counts.sum(axis=1) > 0, counts.sum(axis=0) > 0
+        return pd.DataFrame(
+            sums[measure][np.ix_(seg_keep, prod_keep)],
+            index=pd.Index([s for s, k in zip(self.segments, seg_keep) if k], name="segment"),
+            columns=pd.Index([p for p, k in zip(self.products, prod_keep) if k], name="product"),
+        )
+
+
+def _categories(series: pd.Series) -> List[str]:
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        return series.cat.categories.tolist()
+    return sorted(series.dropna().unique().tolist())
+
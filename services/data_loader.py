@@ -2,73 +2,266 @@ from __future__ import annotations
 
 import os
 from pathlib import Path
-from typing import Optional
+from typing import Dict, Iterator, Optional, Sequence
 
 import numpy as np
 import pandas as pd
 import streamlit as st
 
+from services import column_store, partitions, schema
 
-@st.cache_data(show_spinner=False)
-def load_sample_data(csv_path: Optional[str] = None) -> pd.DataFrame:
+
+DEFAULT_SEGMENT_MIX: Dict[str, float] = {"Retail": 0.5, "Affluent": 0.2, "SME": 0.2, "Corporate": 0.1}
+DEFAULT_PRODUCT_MIX: Dict[str, float] = {"Current": 0.45, "Savings": 0.35, "Loan": 0.15, "Invest": 0.05}
+PRODUCT_BASE_BALANCE: Dict[str, float] = {"Current": 1500, "Savings": 8000, "Loan": -12000, "Invest": 20000}
+FIRST_CUSTOMER_ID = 100000
+COLUMNS = ["date", "customer_id", "segment", "product", "balance", "delinquent"]
+CSV_DTYPES = {"segment": "category", "product": "category"}
+
+# Memory the streaming mode may use, and when "auto" switches to it
+MEMORY_BUDGET_MB = int(os.environ.get("DASHBOARD_MEMORY_MB", "1024"))
+STREAMING = os.environ.get("DASHBOARD_STREAMING", "auto")
+# Peak bytes per row while pandas parses a CSV chunk (text buffers, then the casts)
+PARSE_BYTES_PER_ROW = 400
+# Serve the shared dataset from the memory-mapped columnar cache (read-only, paged in by the OS)
+MMAP = os.environ.get("DASHBOARD_MMAP", "1").lower() in ("1", "true", "yes")
+
+
+def _normalize_mix(mix: Dict[str, float]) -> tuple[list[str], np.ndarray]:
+    names = list(mix)
+    weights = np.asarray([mix[name] for name in names], dtype=float)
+    if not names or np.any(weights < 0) or weights.sum() <= 0:
+        raise ValueError(f"Invalid mix: {mix!r}")
+    return names, weights / weights.sum()
+
+
+def iter_synthetic_chunks(
+    num_days: int = 180,
+    num_customers: int = 1200,
+    segment_mix: Optional[Dict[str, float]] = None,
+    product_mix: Optional[Dict[str, float]] = None,
+    seed: int = 42,
+    end_date: Optional[pd.Timestamp] = None,
+    chunk_rows: int = 1_000_000,
+) -> Iterator[pd.DataFrame]:
+    """Yield the synthetic dataset as DataFrames of roughly ``chunk_rows`` rows.
+
+    Each day draws its own random stream from ``(seed, day)``, so the data only
+    depends on the parameters and not on ``chunk_rows``: the same seed always
+    gives the same rows, whether they are streamed or generated in one go.
+    Columns are filled with vectorized NumPy draws, one day at a time.
+    """
+    segments, segment_p = _normalize_mix(segment_mix or DEFAULT_SEGMENT_MIX)
+    products, product_p = _normalize_mix(product_mix or DEFAULT_PRODUCT_MIX)
+    missing = [p for p in products if p not in PRODUCT_BASE_BALANCE]
+    if missing:
+        raise ValueError(f"No base balance for products: {missing}")
+    base_balance = np.asarray([PRODUCT_BASE_BALANCE[p] for p in products], dtype=float)
+
+    end = pd.Timestamp.today().normalize() if end_date is None else pd.Timestamp(end_date).normalize()
+    dates = pd.date_range(end=end, periods=num_days).to_numpy()
+    customer_ids = np.arange(FIRST_CUSTOMER_ID, FIRST_CUSTOMER_ID + num_customers, dtype=schema.CUSTOMER_ID_DTYPE)
+    customer_segments = np.random.default_rng(seed).choice(len(segments), size=num_customers, p=segment_p)
+
+    low, high = max(1, num_customers // 3), max(2, num_customers // 2)
+    pending: list[tuple] = []
+    pending_rows = 0
+    for day_index, day in enumerate(dates):
+        rng = np.random.default_rng([seed, day_index])
+        # random subset of customers active on that day
+        size = min(num_customers, int(rng.integers(low, high)))
+        active = np.sort(rng.choice(num_customers, size=size, replace=False))
+        prod = rng.choice(len(products), size=size, p=product_p)
+        balance = np.maximum(-20000.0, base_balance[prod] + rng.normal(0.0, 2000.0, size=size))
+        delinquent = ((balance < -5000) & (rng.random(size) < 0.15)).astype(np.int8)
+        pending.append((day, active, prod, balance, delinquent))
+        pending_rows += size
+        if pending_rows >= chunk_rows:
+            yield _assemble_chunk(pending, customer_ids, customer_segments, segments, products)
+            pending, pending_rows = [], 0
+    if pending:
+        yield _assemble_chunk(pending, customer_ids, customer_segments, segments, products)
+
+
+def _assemble_chunk(
+    pending: list[tuple],
+    customer_ids: np.ndarray,
+    customer_segments: np.ndarray,
+    segments: list[str],
+    products: list[str],
+) -> pd.DataFrame:
+    sizes = [len(active) for _, active, _, _, _ in pending]
+    active = np.concatenate([item[1] for item in pending])
+    df = pd.DataFrame(
+        {
+            "date": np.repeat(np.asarray([item[0] for item in pending], dtype=schema.DATE_DTYPE), sizes),
+            "customer_id": customer_ids[active],
+            "segment": pd.Categorical.from_codes(customer_segments[active], categories=segments),
+            "product": pd.Categorical.from_codes(np.concatenate([item[2] for item in pending]), categories=products),
+            "balance": np.concatenate([item[3] for item in pending]).astype(schema.BALANCE_DTYPE),
+            "delinquent": np.concatenate([item[4] for item in pending]),
+        },
+        columns=COLUMNS,
+    )
+    return schema.enforce_schema(df)
+
+
+def generate_synthetic_data(
+    num_days: int = 180,
+    num_customers: int = 1200,
+    segment_mix: Optional[Dict[str, float]] = None,
+    product_mix: Optional[Dict[str, float]] = None,
+    seed: int = 42,
+    end_date: Optional[pd.Timestamp] = None,
+    chunk_rows: int = 1_000_000,
+) -> pd.DataFrame:
+    """Generate the full synthetic dataset in memory (see ``iter_synthetic_chunks``)."""
+    chunks = list(
+        iter_synthetic_chunks(
+            num_days=num_days,
+            num_customers=num_customers,
+            segment_mix=segment_mix,
+            product_mix=product_mix,
+            seed=seed,
+            end_date=end_date,
+            chunk_rows=chunk_rows,
+        )
+    )
+    if not chunks:
+        return schema.enforce_schema(pd.DataFrame({column: [] for column in COLUMNS}))
+    if len(chunks) == 1:
+        return chunks[0]
+    return pd.concat(chunks, ignore_index=True)
+
+
+def read_transactions_csv(path: Path) -> pd.DataFrame:
+    """Parse one transactions CSV into the canonical schema."""
+    return _normalize(pd.read_csv(path, dtype=CSV_DTYPES))
+
+
+def _normalize(df: pd.DataFrame) -> pd.DataFrame:
+    if "date" in df.columns:
+        df["date"] = pd.to_datetime(df["date"])
+    # Normalize any previously generated French product names to English
+    if "product" in df.columns:
+        fr_to_en_products = {
+            "Courant": "Current",
+            "Épargne": "Savings",
+            "Epargne": "Savings",
+            "Crédit": "Loan",
+            "Credit": "Loan",
+            "Invest": "Invest",
+            "Tous": "All",
+        }
+        df["product"] = schema.recode(df["product"], fr_to_en_products)
+    return schema.enforce_schema(df)
+
+
+def _project(df: pd.DataFrame, columns: Optional[Sequence[str]]) -> pd.DataFrame:
+    return df if columns is None else df[list(columns)]
+
+
+def read_sample_data(
+    csv_path: Optional[str] = None,
+    columns: Optional[Sequence[str]] = None,
+    mmap: bool = MMAP,
+) -> pd.DataFrame:
     """Load sample banking data. If no file exists, generate a synthetic dataset.
 
     Columns: date, customer_id, segment, product, balance, delinquent
+    (dtypes per ``services.schema.enforce_schema``)
+
+    The parsed data is kept in a columnar cache next to the CSV (see
+    ``services.column_store``); the CSV is only parsed again when it is newer
+    than that cache. ``columns`` restricts which columns are read.
+
+    With ``mmap`` the frame is always served from that cache, memory-mapped
+    read-only: its numeric columns are views of the page cache, shared with
+    every other reader of the files, and the freshly parsed copy is dropped.
+    Not cached by Streamlit, so the caller owns the only reference; the shared
+    ``Dataset`` loads it once per process.
     """
     if csv_path is None:
         csv_path = os.path.join("data", "sample", "transactions.csv")
     path = Path(csv_path)
+    cache_dir = column_store.cache_dir_for(path)
     if path.exists():
-        df = pd.read_csv(path)
-        df["date"] = pd.to_datetime(df["date"])
-        # Normalize any previously generated French product names to English
-        if "product" in df.columns:
-            fr_to_en_products = {
-                "Courant": "Current",
-                "Épargne": "Savings",
-                "Epargne": "Savings",
-                "Crédit": "Loan",
-                "Credit": "Loan",
-                "Invest": "Invest",
-                "Tous": "All",
-            }
-            df["product"] = df["product"].replace(fr_to_en_products)
-        return df
-
-    # Generate synthetic dataset
-    rng = np.random.default_rng(42)
-    num_days = 180
-    dates = pd.date_range(end=pd.Timestamp.today().normalize(), periods=num_days)
-    segments = ["Retail", "Affluent", "SME", "Corporate"]
-    products = ["Current", "Savings", "Loan", "Invest"]
-    num_customers = 1200
-
-    customer_ids = np.arange(100000, 100000 + num_customers)
-    customer_segments = rng.choice(segments, size=num_customers, p=[0.5, 0.2, 0.2, 0.1])
-
-    rows = []
-    for day in dates:
-        # random subset of customers active daily
-        active = rng.choice(customer_ids, size=rng.integers(num_customers // 3, num_customers // 2), replace=False)
-        for cid in active:
-            seg = customer_segments[cid - 100000]
-            prod = rng.choice(products, p=[0.45, 0.35, 0.15, 0.05])
-            base = {
-                "Current": 1500,
-                "Savings": 8000,
-                "Loan": -12000,
-                "Invest": 20000,
-            }[prod]
-            noise = rng.normal(0, 2000)
-            balance = max(-20000, base + noise)
-            delinquent = int(balance < -5000 and rng.random() < 0.15)
-            rows.append([day, cid, seg, prod, float(balance), delinquent])
-
-    df = pd.DataFrame(rows, columns=["date", "customer_id", "segment", "product", "balance", "delinquent"])
-    # Save for reuse
-    out_dir = Path("data", "sample")
-    out_dir.mkdir(parents=True, exist_ok=True)
-    df.to_csv(out_dir / "transactions.csv", index=False)
-    return df
+        if column_store.is_fresh(cache_dir, path):
+            return schema.enforce_schema(column_store.read_columns(cache_dir, columns=columns, mmap=mmap))
+        df = read_transactions_csv(path)
+        column_store.write_columns(df, cache_dir)
+    else:
+        # Generate synthetic dataset and save it for reuse
+        df = generate_synthetic_data()
+        out_dir = Path("data", "sample")
+        out_dir.mkdir(parents=True, exist_ok=True)
+        df.to_csv(out_dir / "transactions.csv", index=False)
+        cache_dir = column_store.write_columns(df, column_store.cache_dir_for(out_dir / "transactions.csv"))
+    if mmap:
+        del df
+        return schema.enforce_schema(column_store.read_columns(cache_dir, columns=columns))
+    return _project(df, columns)
+
+
+@st.cache_data(show_spinner=False)
+def load_sample_data(csv_path: Optional[str] = None, columns: Optional[Sequence[str]] = None) -> pd.DataFrame:
+    """``read_sample_data`` in memory, cached by Streamlit.
 
+    Every call returns a private copy (unpickled from the cache), which suits
+    ad-hoc callers that may modify it. The app itself goes through the shared
+    ``Dataset`` instead.
+    """
+    return read_sample_data(csv_path, columns, mmap=False)
+
+
+def chunk_rows_for(memory_mb: int = MEMORY_BUDGET_MB, in_flight: int = 1) -> int:
+    """Rows per streamed chunk: the ``in_flight`` chunks being parsed or aggregated
+    at once may take a quarter of the budget."""
+    return max(10_000, memory_mb * 1024 * 1024 // 4 // max(1, in_flight) // PARSE_BYTES_PER_ROW)
+
+
+def should_stream(csv_path: Optional[str] = None, mode: str = STREAMING, memory_mb: int = MEMORY_BUDGET_MB) -> bool:
+    """Whether to aggregate ``csv_path`` chunk by chunk instead of loading it whole.
 
+    ``mode`` is "1"/"0" to force either, or "auto": stream when the source is
+    larger on disk than the memory budget (the compact in-memory frame is about
+    half the CSV size, the filter index and parse buffers take the rest).
+    """
+    if mode != "auto":
+        return mode.lower() in ("1", "true", "yes", "stream")
+    path = Path(csv_path or os.path.join("data", "sample", "transactions.csv"))
+    if partitions.is_fresh(partitions.parts_dir_for(path), path):
+        return True  # partitions are opened one at a time, never loaded whole
+    return path.is_file() and path.stat().st_size > memory_mb * 1024 * 1024
+
+
+def iter_transaction_chunks(
+    csv_path: Optional[str] = None,
+    chunk_rows: Optional[int] = None,
+    columns: Optional[Sequence[str]] = None,
+) -> Iterator[pd.DataFrame]:
+    """Yield the dataset ``chunk_rows`` rows at a time, never holding it whole.
+
+    Reads, in order of preference: the partitioned layout when it is fresh
+    (one chunk per partition, see ``services.partitions``), the columnar cache
+    (memory-mapped slices, no parsing), the CSV with ``read_csv(chunksize=...)``,
+    and the synthetic generator when there is no file. Chunks follow the
+    canonical schema.
+    """
+    chunk_rows = chunk_rows or chunk_rows_for()
+    path = Path(csv_path or os.path.join("data", "sample", "transactions.csv"))
+    parts_dir = partitions.parts_dir_for(path)
+    cache_dir = column_store.cache_dir_for(path)
+    if partitions.is_fresh(parts_dir, path):
+        yield from partitions.Manifest.load(parts_dir).iter_frames(columns=columns)
+    elif path.exists() and column_store.is_fresh(cache_dir, path):
+        for chunk in column_store.iter_column_chunks(cache_dir, chunk_rows, columns=columns):
+            yield schema.enforce_schema(chunk)
+    elif path.exists():
+        dtypes = {k: v for k, v in CSV_DTYPES.items() if columns is None or k in columns}
+        with pd.read_csv(path, dtype=dtypes, usecols=columns, chunksize=chunk_rows) as reader:
+            for chunk in reader:
+                yield _normalize(chunk)
+    else:
+        for chunk in iter_synthetic_chunks(chunk_rows=chunk_rows):
+            yield _project(chunk, columns)
@@ -0,0 +1,221 @@
+from __future__ import annotations
+
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Optional, Tuple, Union
+
+import numpy as np
+import pandas as pd
+
+from services import parallel, partitions, schema, sql_store
+from services.cube import Cube
+from services.data_loader import chunk_rows_for, iter_transaction_chunks, read_sample_data, read_transactions_csv, should_stream
+from services.filter_engine import FilterDomain, FilterIndex
+from services.ingest import IncomingFiles
+from services.streaming import aggregate_chunks
+
+
+# Minimum delay between two looks at the source files, so reruns stay cheap
+REFRESH_SECONDS = float(os.environ.get("DASHBOARD_REFRESH_SECONDS", "5"))
+
+# What can select raw rows for a filter dict
+Rows = Union[FilterIndex, partitions.PartitionedRows, sql_store.SqlStore]
+
+
+class Dataset:
+    """Filter index and cube of one data source, shared by all pages and sessions.
+
+    The source is a main CSV plus, optionally, the files dropped into an
+    incoming directory. ``refresh`` parses only the incoming files it has not
+    seen yet and merges their rows into the index and the cube. A changed main
+    CSV, or an incoming file that was modified or removed after ingestion,
+    triggers a full reload instead. ``version`` goes up on every change and is
+    part of the query cache key, so results of an older version are never
+    served again (they age out of the LRU).
+
+    ``state`` is swapped as a whole, so a reader that takes it once sees a
+    consistent ``(version, index, cube)`` even while a refresh runs.
+
+    In streaming mode (sources larger than the memory budget, or stored as
+    partitions, see ``data_loader.should_stream``) the cube is aggregated chunk
+    by chunk and no raw frame is kept: ``index`` and ``frame`` are None. The
+    ``rows`` of a partitioned source are still reachable, by opening only the
+    partitions a selection can match.
+
+    With a SQL ``backend`` (see ``services.sql_store``) the rows live in a
+    database file and ``rows`` is the store: queries are answered by the
+    database, and the cube only holds per-cell sums for the sidebar bounds and
+    for normalizing filters.
+    """
+
+    def __init__(
+        self,
+        rows: Optional[Rows],
+        cube: Cube,
+        name: str = "",
+        csv_path: Optional[str] = None,
+        incoming_dir: Optional[str | Path] = None,
+        streaming: bool = False,
+        backend: str = "pandas",
+    ):
+        self.state: Tuple[int, Optional[Rows], Cube] = (0, rows, cube)
+        self.name = name
+        self.csv_path = csv_path
+        self.streaming = streaming
+        self.backend = backend
+        self.incoming = None if incoming_dir is None else IncomingFiles(incoming_dir)
+        self._source = _source_fingerprint(csv_path)
+        self._lock = threading.Lock()
+        self._last_refresh = time.monotonic()
+
+    @classmethod
+    def load(
+        cls,
+        csv_path: Optional[str] = None,
+        incoming_dir: Optional[str | Path] = None,
+        streaming: Optional[bool] = None,
+        backend: Optional[str] = None,
+    ) -> "Dataset":
+        """Load ``csv_path`` (plus ``incoming_dir``); ``streaming`` None decides from the source size,
+        ``backend`` None uses ``DASHBOARD_BACKEND``."""
+        if streaming is None:
+            streaming = should_stream(csv_path)
+        backend = sql_store.BACKEND if backend is None else backend
+        rows, cube = _build(csv_path, streaming, backend)
+        dataset = cls(
+            rows,
+            cube,
+            name=csv_path or "",
+            csv_path=csv_path or os.path.join("data", "sample", "transactions.csv"),
+            incoming_dir=incoming_dir,
+            streaming=streaming,
+            backend=backend,
+        )
+        dataset.refresh(force=True)
+        return dataset
+
+    @property
+    def version(self) -> int:
+        return self.state[0]
+
+    @property
+    def rows(self) -> Optional[Rows]:
+        """Whatever can ``select`` raw rows: the filter index, the partitions, or None."""
+        return self.state[1]
+
+    @property
+    def index(self) -> Optional[FilterIndex]:
+        rows = self.rows
+        return rows if isinstance(rows, FilterIndex) else None
+
+    @property
+    def cube(self) -> Cube:
+        return self.state[2]
+
+    @property
+    def frame(self) -> Optional[pd.DataFrame]:
+        index = self.index
+        return None if index is None else index.frame
+
+    @property
+    def domain(self) -> FilterDomain:
+        """Sidebar bounds and options: from the manifest of a partitioned source,
+        from the cube's non-empty days and categories otherwise."""
+        rows = self.rows
+        if isinstance(rows, partitions.PartitionedRows) and rows.extra is None:
+            return rows.manifest.domain()
+        count = self.cube.measures["count"]
+        days = np.flatnonzero(count.sum(axis=(1, 2)))
+        dates = self.cube.dates
+        return FilterDomain(
+            dates[days[0]] if len(days) else None,
+            dates[days[-1]] if len(days) else None,
+            [s for s, n in zip(self.cube.segments, count.sum(axis=(0, 2))) if n],
+            [p for p, n in zip(self.cube.products, count.sum(axis=(0, 1))) if n],
+            snapshots=rows is not None,
+        )
+
+    def append(self, df: pd.DataFrame) -> None:
+        """Merge new rows into the index and the cube (only ``df`` is aggregated)."""
+        if df.empty:
+            return
+        df = schema.enforce_schema(df)
+        version, rows, cube = self.state
+        rows = None if rows is None else rows.append(df)
+        self.state = (version + 1, rows, cube.merge(cube.aggregate_like(df)))
+
+    def reload(self) -> None:
+        """Rebuild everything from the main CSV and every incoming file."""
+        rows, cube = _build(self.csv_path, self.streaming, self.backend)
+        self._source = _source_fingerprint(self.csv_path)
+        self.state = (self.version + 1, rows, cube)
+        if self.incoming is not None:
+            self.incoming.reset()
+            self._ingest_new()
+
+    def refresh(self, force: bool = False) -> bool:
+        """Pick up source changes; returns True when the data changed.
+
+        Does nothing when called again within ``REFRESH_SECONDS`` (unless
+        ``force``) or while another session is already refreshing.
+        """
+        if not force and time.monotonic() - self._last_refresh < REFRESH_SECONDS:
+            return False
+        if not self._lock.acquire(blocking=force):
+            return False
+        try:
+            self._last_refresh = time.monotonic()
+            version = self.version
+            if _source_fingerprint(self.csv_path) != self._source:
+                self.reload()
+            elif self.incoming is not None:
+                new, changed = self.incoming.scan()
+                if changed:
+                    self.reload()
+                elif new:
+                    self._ingest_new(new)
+            return self.version != version
+        finally:
+            self._lock.release()
+
+    def _ingest_new(self, paths: Optional[list] = None) -> None:
+        if paths is None:
+            paths, _ = self.incoming.scan()
+        frames = []
+        for path in paths:
+            fingerprint = self.incoming.fingerprint(path)
+            frames.append(read_transactions_csv(path))
+            self.incoming.mark(path, fingerprint)
+        if frames:
+            self.append(pd.concat(frames, ignore_index=True) if len(frames) > 1 else frames[0])
+
+
+def _build(csv_path: Optional[str], streaming: bool, backend: str = "pandas") -> Tuple[Optional[Rows], Cube]:
+    if backend != "pandas":
+        path = csv_path or os.path.join("data", "sample", "transactions.csv")
+        store = sql_store.open_store(
+            path, backend, _source_fingerprint(path), lambda: iter_transaction_chunks(path, chunk_rows_for())
+        )
+        return store, store.grid()
+    if streaming:
+        # Chunks in flight: two per worker plus the one being read
+        chunk_rows = chunk_rows_for(in_flight=2 * parallel.resolve_workers() + 1)
+        cube = aggregate_chunks(lambda columns: iter_transaction_chunks(csv_path, chunk_rows, columns=columns))
+        path = csv_path or os.path.join("data", "sample", "transactions.csv")
+        parts_dir = partitions.parts_dir_for(path)
+        if partitions.is_fresh(parts_dir, path):
+            return partitions.PartitionedRows(partitions.Manifest.load(parts_dir)), cube
+        return None, cube
+    index = FilterIndex(read_sample_data(csv_path))
+    return index, parallel.build_cube(index.frame)
+
+
+def _source_fingerprint(csv_path: Optional[str]) -> Optional[Tuple[int, int]]:
+    if csv_path is None or not os.path.exists(csv_path):
+        return None
+    if os.path.isdir(csv_path):
+        csv_path = os.path.join(csv_path, partitions.MANIFEST_FILE)
+    stat = os.stat(csv_path)
+    return stat.st_mtime_ns, stat.st_size
@@ -0,0 +1,258 @@
+from __future__ import annotations
+
+import math
+import os
+from typing import Callable, Optional
+
+import numpy as np
+
+
+DEFAULT_MODE = os.environ.get("DASHBOARD_DISTINCT_MODE", "auto")
+DEFAULT_ERROR = float(os.environ.get("DASHBOARD_DISTINCT_ERROR", "0.02"))
+# "auto" keeps exact bitmaps while they fit in this many bytes, HyperLogLog beyond
+BITMAP_BUDGET_BYTES = int(os.environ.get("DASHBOARD_DISTINCT_BITMAP_MB", "256")) * 1024 * 1024
+
+_POPCOUNT = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+
+class CustomerBitmaps:
+    """Exact distinct-customer sets, one packed bitmap per cube cell.
+
+    ``data`` has shape ``cells + (width,)``: bit ``i`` of a cell is set when
+    customer ``base + i`` has a row in it. Customer ids are dense, so this is
+    what a roaring bitmap stores for its dense containers; a union over any
+    selection is a byte-wise OR of ``width`` bytes per cell, then a popcount.
+    """
+
+    exact = True
+
+    def __init__(self, base: int, data: np.ndarray):
+        self.base = int(base)
+        self.data = data
+
+    @staticmethod
+    def nbytes_for(num_cells: int, customer_ids: np.ndarray) -> int:
+        if len(customer_ids) == 0:
+            return 0
+        base = (int(customer_ids.min()) // 8) * 8
+        return num_cells * ((int(customer_ids.max()) - base) // 8 + 1)
+
+    @classmethod
+    def empty(cls, shape: tuple, first_id: int, last_id: int) -> "CustomerBitmaps":
+        """All-zero bitmaps with room for customers ``first_id..last_id``."""
+        base = (int(first_id) // 8) * 8
+        return cls(base, np.zeros(shape + ((int(last_id) - base) // 8 + 1,), dtype=np.uint8))
+
+    @classmethod
+    def build(cls, cells: np.ndarray, customer_ids: np.ndarray, shape: tuple) -> "CustomerBitmaps":
+        """``cells`` are flat cell indices into ``shape``, one per row."""
+        if len(customer_ids) == 0:
+            return cls(0, np.zeros(shape + (0,), dtype=np.uint8))
+        base = (int(customer_ids.min()) // 8) * 8
+        offsets = customer_ids.astype(np.int64) - base
+        width = int(offsets.max()) // 8 + 1
+        packed = np.zeros(int(np.prod(shape)) * width, dtype=np.uint8)
+        bits = np.left_shift(1, 7 - (offsets & 7)).astype(np.uint8)
+        np.bitwise_or.at(packed, cells.astype(np.int64) * width + (offsets >> 3), bits)
+        return cls(base, packed.reshape(shape + (width,)))
+
+    def with_data(self, data: np.ndarray) -> "CustomerBitmaps":
+        return CustomerBitmaps(self.base, data)
+
+    def count(self) -> int:
+        if self.data.size == 0:
+            return 0
+        union = np.bitwise_or.reduce(self.data.reshape(-1, self.data.shape[-1]), axis=0)
+        return int(_POPCOUNT[union].sum(dtype=np.int64))
+
+
+class HyperLogLogSketch:
+    """Approximate distinct-customer counts, one HyperLogLog per cube cell.
+
+    ``precision`` p gives ``2**p`` one-byte registers per cell and a relative
+    standard error of about ``1.04 / sqrt(2**p)``. The union over a selection is
+    an element-wise max of the registers.
+    """
+
+    exact = False
+
+    def __init__(self, precision: int, data: np.ndarray):
+        self.precision = int(precision)
+        self.data = data
+
+    @staticmethod
+    def precision_for(error: float) -> int:
+        """Smallest precision whose standard error is at most ``error`` (4..16)."""
+        if not 0 < error < 1:
+            raise ValueError(f"error must be in (0, 1), got {error!r}")
+        return int(min(16, max(4, math.ceil(math.log2((1.04 / error) ** 2)))))
+
+    @property
+    def error(self) -> float:
+        return 1.04 / math.sqrt(1 << self.precision)
+
+    @classmethod
+    def empty(cls, shape: tuple, precision: int) -> "HyperLogLogSketch":
+        return cls(precision, np.zeros(shape + (1 << precision,), dtype=np.uint8))
+
+    @classmethod
+    def build(
+        cls,
+        cells: np.ndarray,
+        customer_ids: np.ndarray,
+        shape: tuple,
+        error: float = DEFAULT_ERROR,
+        precision: Optional[int] = None,
+    ) -> "HyperLogLogSketch":
+        precision = precision or cls.precision_for(error)
+        m = 1 << precision
+        hashed = _splitmix64(customer_ids.astype(np.uint64))
+        register = (hashed >> np.uint64(64 - precision)).astype(np.int64)
+        rest = hashed << np.uint64(precision)
+        rank = np.minimum(65 - _bit_length64(rest), 64 - precision + 1).astype(np.uint8)
+        registers = np.zeros(int(np.prod(shape)) * m, dtype=np.uint8)
+        np.maximum.at(registers, cells.astype(np.int64) * m + register, rank)
+        return cls(precision, registers.reshape(shape + (m,)))
+
+    def with_data(self, data: np.ndarray) -> "HyperLogLogSketch":
+        return HyperLogLogSketch(self.precision, data)
+
+    def count(self) -> int:
+        m = 1 << self.precision
+        if self.data.size == 0:
+            return 0
+        registers = np.maximum.reduce(self.data.reshape(-1, m), axis=0)
+        alpha = {16: 0.673, 32: 0.697, 64: 0.709}.get(m, 0.7213 / (1 + 1.079 / m))
+        estimate = alpha * m * m / float(np.sum(np.ldexp(1.0, -registers.astype(np.int64))))
+        zeros = int(np.count_nonzero(registers == 0))
+        if estimate <= 2.5 * m and zeros:
+            estimate = m * math.log(m / zeros)  # linear counting for small cardinalities
+        return int(round(estimate))
+
+
+def build_sketch(
+    cells: np.ndarray,
+    customer_ids: np.ndarray,
+    shape: tuple,
+    mode: Optional[str] = None,
+    error: Optional[float] = None,
+    like: CustomerBitmaps | HyperLogLogSketch | None = None,
+) -> CustomerBitmaps | HyperLogLogSketch | None:
+    """Distinct-customer sketch per cell: ``mode`` is "bitmap", "hll", "auto" or "none".
+
+    With ``like``, build the same kind of sketch (and HLL precision) so the
+    two can be merged.
+    """
+    if like is not None:
+        if isinstance(like, CustomerBitmaps):
+            return CustomerBitmaps.build(cells, customer_ids, shape)
+        return HyperLogLogSketch.build(cells, customer_ids, shape, precision=like.precision)
+    mode = resolve_mode(mode, int(np.prod(shape)), customer_ids)
+    if mode == "none":
+        return None
+    if mode == "bitmap":
+        return CustomerBitmaps.build(cells, customer_ids, shape)
+    if mode == "hll":
+        return HyperLogLogSketch.build(cells, customer_ids, shape, error=error or DEFAULT_ERROR)
+    raise ValueError(f"Unknown distinct mode: {mode!r}")
+
+
+def resolve_mode(mode: Optional[str], num_cells: int, customer_ids: np.ndarray) -> str:
+    """The concrete mode ("bitmap", "hll" or "none") that ``mode`` stands for."""
+    mode = mode or DEFAULT_MODE
+    if mode == "auto":
+        fits = CustomerBitmaps.nbytes_for(num_cells, customer_ids) <= BITMAP_BUDGET_BYTES
+        return "bitmap" if fits else "hll"
+    return mode
+
+
+def empty_sketch(
+    shape: tuple,
+    first_id: int,
+    last_id: int,
+    mode: Optional[str] = None,
+    error: Optional[float] = None,
+) -> CustomerBitmaps | HyperLogLogSketch | None:
+    """All-zero sketch of ``shape`` for customers ``first_id..last_id``, ``mode`` as in ``build_sketch``."""
+    mode = resolve_mode(mode, int(np.prod(shape)), np.array([first_id, last_id]))
+    if mode == "none":
+        return None
+    if mode == "bitmap":
+        return CustomerBitmaps.empty(shape, first_id, last_id)
+    if mode == "hll":
+        return HyperLogLogSketch.empty(shape, HyperLogLogSketch.precision_for(error or DEFAULT_ERROR))
+    raise ValueError(f"Unknown distinct mode: {mode!r}")
+
+
+def accumulate_sketch(
+    total: CustomerBitmaps | HyperLogLogSketch,
+    part: CustomerBitmaps | HyperLogLogSketch,
+    cells: tuple,
+) -> bool:
+    """Union ``part`` into ``total`` in place, at grid index ``cells`` of ``total``.
+
+    Returns False, without touching ``total``, when ``part`` does not fit
+    (other kind or precision, customers outside the bitmap span).
+    """
+    if isinstance(total, CustomerBitmaps) and isinstance(part, CustomerBitmaps):
+        offset, width = (part.base - total.base) // 8, part.data.shape[-1]
+        if offset < 0 or offset + width > total.data.shape[-1]:
+            return False
+        total.data[cells + (slice(offset, offset + width),)] |= part.data
+        return True
+    if (
+        isinstance(total, HyperLogLogSketch)
+        and isinstance(part, HyperLogLogSketch)
+        and total.precision == part.precision
+    ):
+        target = total.data[cells]
+        total.data[cells] = np.maximum(target, part.data)
+        return True
+    return False
+
+
+def merge_sketches(
+    left: CustomerBitmaps | HyperLogLogSketch | None,
+    right: CustomerBitmaps | HyperLogLogSketch | None,
+    place: Callable[[int, np.ndarray], np.ndarray],
+) -> CustomerBitmaps | HyperLogLogSketch | None:
+    """Union of two sketches whose cells ``place(side, data)`` maps onto a common grid.
+
+    ``side`` is 0 for ``left`` and 1 for ``right``. Bitmaps are re-based onto a
+    common customer span and OR-ed; HyperLogLog registers (same precision) are
+    max-ed. Mismatched or missing sketches give None: the union is unknown.
+    """
+    if isinstance(left, CustomerBitmaps) and isinstance(right, CustomerBitmaps):
+        base = min(left.base, right.base)
+        stop = max(left.base + 8 * left.data.shape[-1], right.base + 8 * right.data.shape[-1])
+        width = (stop - base) // 8
+
+        def rebased(side: int, sketch: CustomerBitmaps) -> np.ndarray:
+            before = (sketch.base - base) // 8
+            after = width - before - sketch.data.shape[-1]
+            padding = [(0, 0)] * (sketch.data.ndim - 1) + [(before, after)]
+            return place(side, np.pad(sketch.data, padding))
+
+        return CustomerBitmaps(base, rebased(0, left) | rebased(1, right))
+    if (
+        isinstance(left, HyperLogLogSketch)
+        and isinstance(right, HyperLogLogSketch)
+        and left.precision == right.precision
+    ):
+        return left.with_data(np.maximum(place(0, left.data), place(1, right.data)))
+    return None
+
+
+def _splitmix64(values: np.ndarray) -> np.ndarray:
+    with np.errstate(over="ignore"):
+        z = values + np.uint64(0x9E3779B97F4A7C15)
+        z = (z ^ (z >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+        z = (z ^ (z >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+        return z ^ (z >> np.uint64(31))
+
+
+def _bit_length64(values: np.ndarray) -> np.ndarray:
+    """Bit length of uint64 values, exact (each 32-bit half fits in a float64)."""
+    high = (values >> np.uint64(32)).astype(np.float64)
+    low = (values & np.uint64(0xFFFFFFFF)).astype(np.float64)
+    return np.where(high > 0, np.frexp(high)[1] + 32, np.frexp(low)[1])
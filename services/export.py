@@ -0,0 +1,271 @@
+"""Stream the rows of a filter selection to CSV or Parquet.
+
+Usage (from the repository root)::
+
+    python -m services.export out.csv.gz --start 2024-01-01 --segments Retail,SME --compression gzip
+    python -m services.export out.parquet --format parquet --columns date,customer_id,balance
+
+Rows are read and written ``chunk_rows`` at a time, so memory stays flat
+whatever the size of the selection. Parquet needs ``pyarrow``.
+"""
+from __future__ import annotations
+
+import argparse
+import bz2
+import gzip
+import io
+import itertools
+import lzma
+import os
+import sys
+import tempfile
+from contextlib import ExitStack
+from typing import BinaryIO, Dict, Iterable, Iterator, List, Optional, Sequence
+
+import pandas as pd
+
+from services import partitions, schema
+from services.data_loader import COLUMNS, iter_transaction_chunks, read_transactions_csv
+from services.dataset import Dataset
+from services.filter_engine import FILTER_COLUMNS, FilterIndex
+from services.sql_store import SqlStore
+
+
+# Rows read and written at a time
+EXPORT_CHUNK_ROWS = int(os.environ.get("DASHBOARD_EXPORT_CHUNK_ROWS", "100000"))
+# Largest file a download button builds; the command line has no cap
+EXPORT_MAX_BYTES = int(os.environ.get("DASHBOARD_EXPORT_MAX_MB", "200")) * 1024 * 1024
+FORMATS = {"csv": (".csv", "text/csv"), "parquet": (".parquet", "application/vnd.apache.parquet")}
+# Compression codecs per format; None writes uncompressed
+COMPRESSIONS: Dict[str, List[Optional[str]]] = {"csv": ["gzip", "bz2", "xz", None], "parquet": ["snappy", "zstd", "gzip", None]}
+_CSV_OPENERS = {
+    "gzip": (lambda target: gzip.GzipFile(fileobj=target, mode="wb"), ".gz"),
+    "bz2": (lambda target: bz2.BZ2File(target, mode="wb"), ".bz2"),
+    "xz": (lambda target: lzma.LZMAFile(target, mode="wb"), ".xz"),
+}
+
+
+def parquet_available() -> bool:
+    try:
+        import pyarrow.parquet  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def file_name(stem: str, fmt: str, compression: Optional[str]) -> str:
+    """``stem`` with the extension of ``fmt`` and, for CSV, of its compression."""
+    name = stem + FORMATS[fmt][0]
+    if fmt == "csv" and compression is not None:
+        name += _CSV_OPENERS[compression][1]
+    return name
+
+
+def _matching(frame: pd.DataFrame, filters: Dict) -> pd.DataFrame:
+    """Rows of an unindexed chunk matching ``filters``."""
+    keep = pd.Series(True, index=frame.index)
+    if filters.get("start_date") is not None:
+        keep &= frame["date"] >= pd.Timestamp(filters["start_date"])
+    if filters.get("end_date") is not None:
+        keep &= frame["date"] <= pd.Timestamp(filters["end_date"])
+    for key, column in FILTER_COLUMNS.items():
+        if filters.get(key):
+            keep &= frame[column].isin(filters[key])
+    return frame if keep.all() else frame.loc[keep]
+
+
+def _rechunk(frames: Iterable[pd.DataFrame], chunk_rows: int) -> Iterator[pd.DataFrame]:
+    for frame in frames:
+        for start in range(0, len(frame), chunk_rows):
+            yield frame.iloc[start:start + chunk_rows]
+
+
+def iter_selection(
+    dataset: Dataset,
+    filters: Dict,
+    chunk_rows: int = EXPORT_CHUNK_ROWS,
+    columns: Optional[Sequence[str]] = None,
+) -> Iterator[pd.DataFrame]:
+    """Rows of ``dataset`` matching ``filters``, at most ``chunk_rows`` at a time.
+
+    Reads from the filter index when the rows are in memory, from the
+    database with a SQL backend, from the partitions that can match for a
+    partitioned source, and otherwise scans
+    the source (and the ingested files) chunk by chunk. In snapshot mode,
+    yields each customer's latest row (see ``services.snapshot``). Always
+    yields at least one chunk, empty when nothing matches, so writers know
+    the columns.
+    """
+    columns = list(columns or COLUMNS)
+    rows = dataset.rows
+    if filters.get("mode") == "snapshot":
+        if rows is None:
+            raise RuntimeError("Snapshots need the raw rows, which are not kept in streaming mode")
+        from services.query import _latest_rows
+
+        end = filters.get("end_date") if filters.get("end_date") is not None else dataset.cube.dates[-1]
+        chunks = _rechunk([_latest_rows(rows, filters, end)[columns]], chunk_rows)
+    elif isinstance(rows, (FilterIndex, SqlStore)):
+        chunks = rows.iter_select(filters, chunk_rows, columns)
+    elif isinstance(rows, partitions.PartitionedRows):
+        frames = (FilterIndex(frame).select(filters)[columns] for frame in rows.manifest.iter_frames(rows.manifest.prune(filters)))
+        chunks = _rechunk(frames, chunk_rows)
+        if rows.extra is not None:
+            chunks = itertools.chain(chunks, rows.extra.iter_select(filters, chunk_rows, columns))
+    else:
+        sources = [iter_transaction_chunks(dataset.csv_path, chunk_rows)]
+        if dataset.incoming is not None:
+            sources += [_rechunk([read_transactions_csv(path)], chunk_rows) for path in dataset.incoming.paths()]
+        chunks = (_matching(chunk, filters)[columns] for source in sources for chunk in source)
+
+    empty = True
+    for chunk in chunks:
+        if len(chunk):
+            empty = False
+            yield chunk
+    if empty:
+        yield schema.enforce_schema(pd.DataFrame({column: [] for column in COLUMNS}))[columns]
+
+
+def write_csv(chunks: Iterable[pd.DataFrame], target: BinaryIO, compression: Optional[str] = "gzip") -> int:
+    """Write ``chunks`` as one CSV (header once) to ``target``; returns the number of rows."""
+    rows = 0
+    with ExitStack() as stack:
+        stream = target
+        if compression is not None:
+            opener, _ = _CSV_OPENERS[compression]
+            stream = stack.enter_context(opener(target))
+        text = io.TextIOWrapper(stream, encoding="utf-8", newline="")
+        header = True
+        try:
+            for chunk in chunks:
+                chunk.to_csv(text, index=False, header=header, date_format="%Y-%m-%d")
+                header = False
+                rows += len(chunk)
+            text.flush()
+        finally:
+            text.detach()  # leave ``target`` open for the caller, even on error
+    return rows
+
+
+def write_parquet(chunks: Iterable[pd.DataFrame], target: BinaryIO, compression: Optional[str] = "snappy") -> int:
+    """Write ``chunks`` as the row groups of one Parquet file to ``target``; returns the number of rows."""
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError as exc:
+        raise RuntimeError("Parquet export needs pyarrow (pip install pyarrow)") from exc
+
+    rows, writer = 0, None
+    try:
+        for chunk in chunks:
+            table = pa.Table.from_pandas(chunk, preserve_index=False)
+            if writer is None:
+                writer = pq.ParquetWriter(target, table.schema, compression=compression or "none")
+            writer.write_table(table.cast(writer.schema))
+            rows += len(chunk)
+    finally:
+        if writer is not None:
+            writer.close()
+    return rows
+
+
+WRITERS = {"csv": write_csv, "parquet": write_parquet}
+
+
+def _check_size(size: int, max_bytes: Optional[int]) -> None:
+    if max_bytes is not None and size > max_bytes:
+        raise RuntimeError(
+            f"The export is over {size / 2**20:,.1f} MB, past the {max_bytes / 2**20:,.0f} MB limit: narrow the "
+            "selection, keep fewer columns or compress it, or write it with python -m services.export"
+        )
+
+
+def _capped(chunks: Iterable[pd.DataFrame], target: BinaryIO, max_bytes: int) -> Iterator[pd.DataFrame]:
+    for chunk in chunks:
+        _check_size(target.tell(), max_bytes)
+        yield chunk
+
+
+def export(
+    dataset: Dataset,
+    filters: Dict,
+    target: BinaryIO,
+    fmt: str = "csv",
+    columns: Optional[Sequence[str]] = None,
+    compression: Optional[str] = "gzip",
+    chunk_rows: int = EXPORT_CHUNK_ROWS,
+    max_bytes: Optional[int] = None,
+) -> int:
+    """Stream the selection ``filters`` of ``dataset`` to ``target``; returns the number of rows.
+
+    With ``max_bytes``, stops with a ``RuntimeError`` at the first chunk
+    after ``target`` (which must support ``tell``) grows past it.
+    """
+    if fmt not in WRITERS:
+        raise ValueError(f"Unknown export format: {fmt!r}")
+    if compression not in COMPRESSIONS[fmt]:
+        raise ValueError(f"Unknown {fmt} compression: {compression!r}")
+    chunks = iter_selection(dataset, filters, chunk_rows, columns)
+    if max_bytes is not None:
+        chunks = _capped(chunks, target, max_bytes)
+    rows = WRITERS[fmt](chunks, target, compression)
+    if max_bytes is not None:
+        _check_size(target.tell(), max_bytes)
+    return rows
+
+
+def export_bytes(dataset: Dataset, filters: Dict, max_bytes: int = EXPORT_MAX_BYTES, **options) -> bytes:
+    """``export`` through a temporary file, for a download button.
+
+    Streamlit sends a download from memory, so the finished (compressed)
+    file is read back once; building it never holds more than a chunk.
+    Files over ``max_bytes`` (``DASHBOARD_EXPORT_MAX_MB``) are never read
+    back: the export stops with a ``RuntimeError`` that the button reports.
+    """
+    with tempfile.TemporaryFile() as handle:
+        export(dataset, filters, handle, max_bytes=max_bytes, **options)
+        handle.seek(0)
+        return handle.read()
+
+
+def main(argv: Optional[Sequence[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("output", help="file to write ('-' for standard output)")
+    parser.add_argument("--source", default=None, help="transactions CSV (default: the sample data)")
+    parser.add_argument("--format", choices=sorted(FORMATS), default="csv")
+    parser.add_argument("--compression", default=None, help="codec, or 'none' (default: gzip for CSV, snappy for Parquet)")
+    parser.add_argument("--columns", default=None, help="comma-separated columns to keep")
+    parser.add_argument("--start", default=None)
+    parser.add_argument("--end", default=None)
+    parser.add_argument("--segments", default="")
+    parser.add_argument("--products", default="")
+    parser.add_argument("--snapshot", action="store_true", help="each customer's latest row at the end date")
+    parser.add_argument("--chunk-rows", type=int, default=EXPORT_CHUNK_ROWS)
+    args = parser.parse_args(argv)
+
+    compression = COMPRESSIONS[args.format][0] if args.compression is None else args.compression
+    filters = {
+        "start_date": None if args.start is None else pd.Timestamp(args.start),
+        "end_date": None if args.end is None else pd.Timestamp(args.end),
+        "segments": [s for s in args.segments.split(",") if s],
+        "products": [p for p in args.products.split(",") if p],
+        "mode": "snapshot" if args.snapshot else "flows",
+    }
+    dataset = Dataset.load(args.source)
+    options = dict(
+        fmt=args.format,
+        columns=None if args.columns is None else args.columns.split(","),
+        compression=None if compression == "none" else compression,
+        chunk_rows=args.chunk_rows,
+    )
+    if args.output == "-":
+        rows = export(dataset, filters, sys.stdout.buffer, **options)
+    else:
+        with open(args.output, "wb") as handle:
+            rows = export(dataset, filters, handle, **options)
+    print(f"{rows:,} rows written to {args.output}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,213 @@
+from __future__ import annotations
+
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+
+from services import schema
+from services.snapshot import AsOfIndex
+
+
+CATEGORY_COLUMNS = ("segment", "product")
+FILTER_COLUMNS = {"segments": "segment", "products": "product"}
+
+
+class FilterDomain:
+    """What the sidebar filters offer: the date bounds and each category's options.
+
+    Built from whatever is at hand (a frame, a cube) so the sidebar never
+    needs the raw rows. ``snapshots`` tells whether the raw rows are there
+    for the snapshot mode (see ``services.snapshot``).
+    """
+
+    def __init__(
+        self,
+        min_date: Optional[pd.Timestamp],
+        max_date: Optional[pd.Timestamp],
+        segments: List[str],
+        products: List[str],
+        snapshots: bool = True,
+    ):
+        self.min_date = min_date
+        self.max_date = max_date
+        self.segments = sorted(segments)
+        self.products = sorted(products)
+        self.snapshots = snapshots
+
+    @classmethod
+    def from_frame(cls, df: pd.DataFrame) -> "FilterDomain":
+        dates = pd.to_datetime(df["date"]) if "date" in df.columns else None
+
+        def options(column: str) -> List[str]:
+            return df[column].dropna().unique().tolist() if column in df.columns else []
+
+        return cls(
+            None if dates is None or dates.empty else dates.min(),
+            None if dates is None or dates.empty else dates.max(),
+            options("segment"),
+            options("product"),
+        )
+
+
+class FilterIndex:
+    """Filter engine built once per dataset load.
+
+    Rows are kept sorted by date, so a date range is a binary-search slice,
+    and every category value of ``segment``/``product`` has a packed row bitmap,
+    so a multiselect becomes bitwise OR/AND over bytes. ``select`` returns a
+    zero-copy slice of the sorted frame whenever the selection is a contiguous
+    date range, and only gathers rows when categories actually drop some.
+    The frame must be treated as read-only by callers.
+    """
+
+    def __init__(self, df: pd.DataFrame, category_columns: Iterable[str] = CATEGORY_COLUMNS):
+        dates = df["date"].to_numpy()
+        if len(dates) > 1 and not (dates[1:] >= dates[:-1]).all():
+            self.frame = df.iloc[np.argsort(dates, kind="stable")].reset_index(drop=True)
+        else:
+            # A shallow frame with a fresh index, so the columns stay views of ``df``
+            # (e.g. memory-mapped); reset_index copies them without copy-on-write
+            self.frame = df.copy(deep=False)
+            self.frame.index = pd.RangeIndex(len(df))
+        self._dates = self.frame["date"].to_numpy()
+        self._bitmaps: Dict[str, Dict[str, np.ndarray]] = {}
+        self._as_of: Optional[AsOfIndex] = None
+        for column in category_columns:
+            if column in self.frame.columns:
+                self._bitmaps[column] = self._build_bitmaps(self.frame[column])
+
+    @staticmethod
+    def _build_bitmaps(series: pd.Series) -> Dict[str, np.ndarray]:
+        if not isinstance(series.dtype, pd.CategoricalDtype):
+            series = series.astype("category")
+        codes = series.cat.codes.to_numpy()
+        return {
+            category: np.packbits(codes == code)
+            for code, category in enumerate(series.cat.categories)
+        }
+
+    def append(self, df: pd.DataFrame) -> "FilterIndex":
+        """New index over this one's rows followed by ``df``'s.
+
+        When ``df`` only holds dates at or after the last indexed one (the usual
+        case for daily files), the sorted order is kept as is and only the new
+        rows' bits are packed onto the bitmaps. Otherwise everything is re-sorted
+        and rebuilt. The current index is left untouched, so readers holding it
+        stay consistent.
+        """
+        frame = self.frame
+        for column in self._bitmaps:
+            if column in df.columns and df[column].dtype != frame[column].dtype:
+                dtype = schema.union_categories(frame[column].dtype, df[column].dtype)
+                frame = frame.assign(**{column: frame[column].astype(dtype)})
+                df = df.assign(**{column: df[column].astype(dtype)})
+        dates = df["date"].to_numpy().astype(self._dates.dtype)
+        if len(self._dates) and len(dates) and dates.min() < self._dates[-1]:
+            return FilterIndex(pd.concat([frame, df], ignore_index=True), category_columns=list(self._bitmaps))
+        if len(dates) > 1 and not (dates[1:] >= dates[:-1]).all():
+            df = df.iloc[np.argsort(dates, kind="stable")]
+
+        index = FilterIndex.__new__(FilterIndex)
+        index.frame = pd.concat([frame, df], ignore_index=True)
+        index._dates = index.frame["date"].to_numpy()
+        index._bitmaps = {}
+        index._as_of = None
+        old_rows = len(self.frame)
+        for column, bitmaps in self._bitmaps.items():
+            series = index.frame[column].iloc[old_rows:]
+            codes = series.cat.codes.to_numpy()
+            index._bitmaps[column] = {
+                category: _append_bits(bitmaps.get(category), old_rows, codes == code)
+                for code, category in enumerate(series.cat.categories)
+            }
+        return index
+
+    def __len__(self) -> int:
+        return len(self.frame)
+
+    def as_of(self) -> AsOfIndex:
+        """Per-customer point-in-time index of the rows, built on first use (see ``services.snapshot``)."""
+        index = self._as_of
+        if index is None:
+            index = self._as_of = AsOfIndex(self.frame)
+        return index
+
+    def date_slice(self, start_date: Optional[pd.Timestamp], end_date: Optional[pd.Timestamp]) -> slice:
+        """Row slice with ``start_date <= date <= end_date`` (either bound may be None)."""
+        unit = self._dates.dtype
+        lo = 0 if start_date is None else int(np.searchsorted(self._dates, pd.Timestamp(start_date).to_datetime64().astype(unit), "left"))
+        hi = len(self._dates) if end_date is None else int(np.searchsorted(self._dates, pd.Timestamp(end_date).to_datetime64().astype(unit), "right"))
+        return slice(lo, max(lo, hi))
+
+    def _category_bits(self, column: str, values: Sequence[str], start_byte: int, end_byte: int) -> Optional[np.ndarray]:
+        """OR of the bitmaps of ``values`` over a byte range, or None when nothing is excluded."""
+        bitmaps = self._bitmaps.get(column)
+        if bitmaps is None or not values:
+            return None
+        wanted = set(values)
+        if wanted.issuperset(bitmaps):
+            return None
+        combined = np.zeros(end_byte - start_byte, dtype=np.uint8)
+        for category in wanted.intersection(bitmaps):
+            combined |= bitmaps[category][start_byte:end_byte]
+        return combined
+
+    def positions(self, filters: Dict, within: Optional[slice] = None) -> slice | np.ndarray:
+        """Sorted row positions matching ``filters`` (the dict from ``render_filters``).
+
+        An empty segment/product list means no restriction on that column.
+        ``within`` restricts the answer to a range of rows.
+        """
+        rows = self.date_slice(filters.get("start_date"), filters.get("end_date"))
+        if within is not None:
+            start = max(rows.start, within.start)
+            rows = slice(start, max(start, min(rows.stop, within.stop)))
+        if rows.start == rows.stop:
+            return rows
+        start_byte, end_byte = rows.start // 8, (rows.stop + 7) // 8
+        bits = None
+        for key, column in FILTER_COLUMNS.items():
+            column_bits = self._category_bits(column, filters.get(key) or [], start_byte, end_byte)
+            if column_bits is not None:
+                bits = column_bits if bits is None else bits & column_bits
+        if bits is None:
+            return rows
+        offset = rows.start - start_byte * 8
+        hits = np.flatnonzero(np.unpackbits(bits)[offset:offset + rows.stop - rows.start])
+        if len(hits) == rows.stop - rows.start:
+            return rows
+        return hits + rows.start
+
+    def select(self, filters: Dict) -> pd.DataFrame:
+        """Filtered frame: a view for contiguous selections, a gathered copy otherwise."""
+        rows = self.positions(filters)
+        if isinstance(rows, slice):
+            return self.frame.iloc[rows]
+        return self.frame.take(rows)
+
+    def iter_select(self, filters: Dict, chunk_rows: int, columns: Optional[Sequence[str]] = None) -> Iterator[pd.DataFrame]:
+        """``select`` in pieces of at most ``chunk_rows`` rows, restricted to ``columns``.
+
+        Works through the date range ``chunk_rows`` rows at a time, so memory
+        stays bounded by the chunk whatever the size of the selection.
+        """
+        frame = self.frame if columns is None else self.frame[list(columns)]
+        dates = self.date_slice(filters.get("start_date"), filters.get("end_date"))
+        for start in range(dates.start, dates.stop, chunk_rows):
+            rows = self.positions(filters, slice(start, start + chunk_rows))
+            chunk = frame.iloc[rows] if isinstance(rows, slice) else frame.take(rows)
+            if len(chunk):
+                yield chunk
+
+
+
+def _append_bits(packed: Optional[np.ndarray], num_bits: int, bits: np.ndarray) -> np.ndarray:
+    """Packed bitmap of ``num_bits`` bits (None: all zero) followed by ``bits``."""
+    if packed is None:
+        packed = np.zeros((num_bits + 7) // 8, dtype=np.uint8)
+    tail = num_bits % 8
+    if not tail:
+        return np.concatenate([packed, np.packbits(bits)])
+    head = np.unpackbits(packed[-1:])[:tail].astype(bool)
+    return np.concatenate([packed[:-1], np.packbits(np.concatenate([head, bits]))])
@@ -0,0 +1,99 @@
+from __future__ import annotations
+
+from typing import Dict, Optional, Sequence, Tuple
+
+import numpy as np
+
+
+MODES = ("linear", "log", "quantile")
+DEFAULT_BINS = 50
+
+
+def linear_edges(low: float, high: float, bins: int = DEFAULT_BINS) -> np.ndarray:
+    if high <= low:
+        high = low + 1.0
+    return np.linspace(low, high, bins + 1)
+
+
+def _symlog(values: np.ndarray) -> np.ndarray:
+    return np.sign(values) * np.log10(1.0 + np.abs(values))
+
+
+def _symlog_inverse(values: np.ndarray) -> np.ndarray:
+    return np.sign(values) * (10.0 ** np.abs(values) - 1.0)
+
+
+def log_edges(low: float, high: float, bins: int = DEFAULT_BINS) -> np.ndarray:
+    """Edges evenly spaced in signed log space (``sign(v) * log10(1 + |v|)``).
+
+    Balances can be negative (loans), so a plain log scale does not apply; the
+    signed version gives narrow bins near zero and wide ones in the tails.
+    """
+    edges = _symlog_inverse(linear_edges(float(_symlog(np.float64(low))), float(_symlog(np.float64(high))), bins))
+    edges[0], edges[-1] = low, high
+    return edges
+
+
+def quantile_edges(values: np.ndarray, bins: int = DEFAULT_BINS) -> np.ndarray:
+    """Edges at the quantiles of ``values`` (equal-count bins; duplicates dropped)."""
+    if len(values) == 0:
+        return linear_edges(0.0, 1.0, bins)
+    edges = np.unique(np.quantile(values.astype(np.float64), np.linspace(0.0, 1.0, bins + 1)))
+    return edges if len(edges) > 1 else linear_edges(float(edges[0]), float(edges[0]) + 1.0, 1)
+
+
+def edges_for(mode: str, values: np.ndarray, bins: int = DEFAULT_BINS) -> np.ndarray:
+    if mode not in MODES:
+        raise ValueError(f"Unknown histogram mode: {mode!r}")
+    if mode == "quantile":
+        return quantile_edges(values, bins)
+    low, high = (float(values.min()), float(values.max())) if len(values) else (0.0, 1.0)
+    return linear_edges(low, high, bins) if mode == "linear" else log_edges(low, high, bins)
+
+
+class Histogram:
+    """Balance histogram per cube cell over fixed bin ``edges``.
+
+    ``counts`` has shape ``cells + (bins,)``. Edges are fixed when the cube is
+    built, so the histograms of any selection, chunk or partition that share
+    them merge by plain addition. Values outside the edges fall in the first or
+    last bin.
+    """
+
+    def __init__(self, edges: np.ndarray, counts: np.ndarray):
+        self.edges = np.asarray(edges, dtype=np.float64)
+        self.counts = counts
+
+    @property
+    def data(self) -> np.ndarray:
+        return self.counts
+
+    @classmethod
+    def build(cls, cells: np.ndarray, values: np.ndarray, shape: tuple, edges: np.ndarray) -> "Histogram":
+        bins = len(edges) - 1
+        which = np.clip(np.searchsorted(edges, values, side="right") - 1, 0, bins - 1)
+        counts = np.bincount(cells.astype(np.int64) * bins + which, minlength=int(np.prod(shape)) * bins)
+        return cls(edges, counts.astype(np.int32).reshape(shape + (bins,)))
+
+    def with_data(self, data: np.ndarray) -> "Histogram":
+        return Histogram(self.edges, data)
+
+    def total(self) -> Tuple[np.ndarray, np.ndarray]:
+        """``(edges, counts)`` summed over all cells."""
+        return self.edges, self.counts.reshape(-1, len(self.edges) - 1).sum(axis=0, dtype=np.int64)
+
+
+def build_histograms(
+    cells: np.ndarray,
+    values: np.ndarray,
+    shape: tuple,
+    modes: Sequence[str] = MODES,
+    bins: int = DEFAULT_BINS,
+    edges: Optional[Dict[str, np.ndarray]] = None,
+) -> Dict[str, Histogram]:
+    """One ``Histogram`` per mode; ``edges`` fixes the bins (e.g. to merge partitions)."""
+    edges = edges or {}
+    return {
+        mode: Histogram.build(cells, values, shape, edges[mode] if mode in edges else edges_for(mode, values, bins))
+        for mode in modes
+    }
@@ -0,0 +1,78 @@
+from __future__ import annotations
+
+import hashlib
+import os
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+
+INCOMING_DIR = os.environ.get("DASHBOARD_INCOMING_DIR", os.path.join("data", "incoming"))
+# Confirm a changed mtime/size with a content hash before treating a file as modified
+HASH_FILES = os.environ.get("DASHBOARD_INCOMING_HASH", "1") not in ("0", "false", "no")
+
+Fingerprint = Tuple[int, int, Optional[str]]
+
+
+def file_digest(path: Path, block_size: int = 1 << 20) -> str:
+    digest = hashlib.blake2b(digest_size=16)
+    with open(path, "rb") as handle:
+        for block in iter(lambda: handle.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class IncomingFiles:
+    """Files dropped into a directory and the fingerprint each had when ingested.
+
+    A fingerprint is ``(mtime_ns, size, digest)``. ``scan`` only stats the
+    files; with ``use_hash`` a file whose mtime or size moved is hashed and
+    still counts as unchanged if its content is the same (a ``touch`` or a
+    copy that preserves the bytes).
+    """
+
+    def __init__(self, directory: str | Path, pattern: str = "*.csv", use_hash: bool = HASH_FILES):
+        self.directory = Path(directory)
+        self.pattern = pattern
+        self.use_hash = use_hash
+        self._seen: Dict[Path, Fingerprint] = {}
+
+    def __len__(self) -> int:
+        return len(self._seen)
+
+    def _stat(self, path: Path) -> Tuple[int, int]:
+        stat = path.stat()
+        return stat.st_mtime_ns, stat.st_size
+
+    def fingerprint(self, path: Path) -> Fingerprint:
+        mtime, size = self._stat(path)
+        return mtime, size, file_digest(path) if self.use_hash else None
+
+    def scan(self) -> Tuple[List[Path], bool]:
+        """``(new files in name order, whether an ingested file changed or disappeared)``."""
+        present = sorted(self.directory.glob(self.pattern)) if self.directory.is_dir() else []
+        new: List[Path] = []
+        changed = bool(set(self._seen) - set(present))
+        for path in present:
+            seen = self._seen.get(path)
+            if seen is None:
+                new.append(path)
+                continue
+            stat = self._stat(path)
+            if stat == seen[:2]:
+                continue
+            if self.use_hash and file_digest(path) == seen[2]:
+                self._seen[path] = stat + (seen[2],)
+                continue
+            changed = True
+        return new, changed
+
+    def mark(self, path: Path, fingerprint: Optional[Fingerprint] = None) -> None:
+        """Record ``path`` as ingested (with the fingerprint taken before reading it)."""
+        self._seen[path] = fingerprint or self.fingerprint(path)
+
+    def reset(self) -> None:
+        self._seen.clear()
+
+    def paths(self) -> List[Path]:
+        """Ingested files, in name order."""
+        return sorted(self._seen)
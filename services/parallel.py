@@ -0,0 +1,149 @@
+from __future__ import annotations
+
+import logging
+import os
+from concurrent.futures import FIRST_COMPLETED, Executor, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from functools import partial
+from typing import Callable, Iterable, Iterator, Optional, Sequence, TypeVar
+
+import numpy as np
+import pandas as pd
+
+from services.cube import Cube, _categories
+from services.distinct import empty_sketch
+from services.histogram import DEFAULT_BINS, MODES as HISTOGRAM_MODES, edges_for
+
+
+# Worker count: 0 = one per core, 1 = serial
+WORKERS = int(os.environ.get("DASHBOARD_WORKERS", "0"))
+# "thread" (NumPy/pandas kernels release the GIL, no data copied) or "process"
+EXECUTOR = os.environ.get("DASHBOARD_EXECUTOR", "thread")
+# Below this many rows per task, pool overhead outweighs the parallel gain
+MIN_ROWS_PER_TASK = 250_000
+
+T = TypeVar("T")
+R = TypeVar("R")
+
+logger = logging.getLogger(__name__)
+
+
+def resolve_workers(workers: Optional[int] = None) -> int:
+    workers = WORKERS if workers is None else workers
+    return max(1, workers or os.cpu_count() or 1)
+
+
+def _make_executor(workers: int, kind: str) -> Executor:
+    if kind == "process":
+        return ProcessPoolExecutor(max_workers=workers)
+    if kind == "thread":
+        return ThreadPoolExecutor(max_workers=workers, thread_name_prefix="aggregate")
+    raise ValueError(f"Unknown executor: {kind!r}")
+
+
+def map_unordered(
+    func: Callable[[T], R],
+    items: Iterable[T],
+    workers: Optional[int] = None,
+    executor: Optional[str] = None,
+    max_pending: Optional[int] = None,
+) -> Iterator[R]:
+    """``func`` over ``items`` on a pool, yielding results as they complete.
+
+    At most ``max_pending`` items (default: two per worker) are in flight, so a
+    lazy ``items`` (streamed chunks) is never read far ahead. Runs serially
+    with one worker, or when the pool cannot be created (e.g. no process
+    support in the sandbox).
+    """
+    workers = resolve_workers(workers)
+    if workers > 1:
+        try:
+            pool = _make_executor(workers, executor or EXECUTOR)
+        except (OSError, NotImplementedError) as error:
+            logger.warning("Parallel aggregation unavailable (%s), running serially", error)
+            workers = 1
+    if workers <= 1:
+        for item in items:
+            yield func(item)
+        return
+
+    max_pending = max_pending or 2 * workers
+    with pool:
+        pending = set()
+        for item in items:
+            pending.add(pool.submit(func, item))
+            if len(pending) >= max_pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    yield future.result()
+        for future in list(pending):
+            yield future.result()
+
+
+def combine(total: Cube, parts: Iterable[Cube]) -> Cube:
+    """Add partial cubes into ``total`` as they arrive (see ``Cube.accumulate``)."""
+    for part in parts:
+        total = total.accumulate(part)
+    return total
+
+
+def _aggregate(template: Cube, frame: pd.DataFrame) -> Cube:
+    return template.aggregate_like(frame)
+
+
+def aggregate_frames(
+    total: Cube,
+    frames: Iterable[pd.DataFrame],
+    workers: Optional[int] = None,
+    executor: Optional[str] = None,
+    max_pending: Optional[int] = None,
+) -> Cube:
+    """Add the partial cube of every frame into ``total``, the partials built in parallel.
+
+    Workers only receive ``total.template()`` (no cell data), so the total is
+    never shipped to another process or touched from two threads.
+    """
+    work = partial(_aggregate, total.template())
+    return combine(total, map_unordered(work, (f for f in frames if not f.empty), workers, executor, max_pending))
+
+
+def frame_grid(
+    df: pd.DataFrame,
+    distinct: Optional[str] = None,
+    distinct_error: Optional[float] = None,
+    histogram_modes: Sequence[str] = HISTOGRAM_MODES,
+    histogram_bins: int = DEFAULT_BINS,
+) -> Cube:
+    """Zero cube with the grid, sketch and histogram edges ``Cube.from_frame(df)`` would use."""
+    segments, products = _categories(df["segment"]), _categories(df["product"])
+    days = df["date"].to_numpy().astype("datetime64[D]")
+    start = days.min()
+    shape = (int((days.max() - start).astype(np.int64)) + 1, len(segments), len(products))
+    customers = None
+    if "customer_id" in df.columns:
+        ids = df["customer_id"].to_numpy()
+        customers = empty_sketch(shape, int(ids.min()), int(ids.max()), mode=distinct, error=distinct_error)
+    balance = df["balance"].to_numpy()
+    edges = {mode: edges_for(mode, balance, histogram_bins) for mode in histogram_modes}
+    return Cube.zeros(start, shape[0], segments, products, customers=customers, histogram_edges=edges)
+
+
+def build_cube(
+    df: pd.DataFrame,
+    workers: Optional[int] = None,
+    executor: Optional[str] = None,
+    min_rows_per_task: int = MIN_ROWS_PER_TASK,
+    **options,
+) -> Cube:
+    """``Cube.from_frame(df, **options)``, aggregated over row ranges in parallel.
+
+    Each range gives a partial cube on the same grid; partials are combined
+    as they complete. The result matches the serial one (up to float summation
+    order). Small frames, or ``workers=1``, take the serial path.
+    """
+    workers = resolve_workers(workers)
+    tasks = min(4 * workers, len(df) // max(1, min_rows_per_task))
+    if workers <= 1 or tasks < 2:
+        return Cube.from_frame(df, **options)
+    bounds = np.linspace(0, len(df), tasks + 1).astype(np.int64)
+    frames = (df.iloc[lo:hi] for lo, hi in zip(bounds[:-1], bounds[1:]))
+    return aggregate_frames(frame_grid(df, **options), frames, workers, executor)
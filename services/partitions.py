@@ -0,0 +1,238 @@
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import shutil
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence
+
+import pandas as pd
+
+from services import column_store, schema
+from services.filter_engine import FILTER_COLUMNS, FilterDomain, FilterIndex
+
+
+MANIFEST_FILE = "manifest.json"
+FORMAT_VERSION = 1
+# Partition key of a row: its month ("2024-03") or its day ("2024-03-31")
+GRANULARITIES = {"month": "%Y-%m", "day": "%Y-%m-%d"}
+
+
+def parts_dir_for(source: str | os.PathLike) -> Path:
+    """Partitioned layout stored next to a source file (``x.csv`` -> ``x.parts``)."""
+    path = Path(source)
+    return path if path.is_dir() else path.with_name(path.stem + ".parts")
+
+
+class Partition:
+    """One stored fragment of the dataset and its zone map.
+
+    The zone map holds the row count, the min/max of ``date``, ``balance`` and
+    ``customer_id`` and the category values present, which is enough to tell
+    whether a filter selection can match any of its rows without opening it.
+    """
+
+    def __init__(
+        self,
+        key: str,
+        path: str,
+        rows: int,
+        min_date: pd.Timestamp,
+        max_date: pd.Timestamp,
+        min_balance: float,
+        max_balance: float,
+        min_customer: int,
+        max_customer: int,
+        segments: List[str],
+        products: List[str],
+    ):
+        self.key = key
+        self.path = path
+        self.rows = rows
+        self.min_date = pd.Timestamp(min_date)
+        self.max_date = pd.Timestamp(max_date)
+        self.min_balance = min_balance
+        self.max_balance = max_balance
+        self.min_customer = min_customer
+        self.max_customer = max_customer
+        self.segments = list(segments)
+        self.products = list(products)
+
+    @classmethod
+    def describe(cls, key: str, path: str, df: pd.DataFrame) -> "Partition":
+        def present(column: str) -> List[str]:
+            counts = df[column].value_counts()
+            return sorted(str(value) for value in counts.index[counts.to_numpy() > 0])
+
+        return cls(
+            key,
+            path,
+            len(df),
+            df["date"].min(),
+            df["date"].max(),
+            float(df["balance"].min()),
+            float(df["balance"].max()),
+            int(df["customer_id"].min()),
+            int(df["customer_id"].max()),
+            present("segment"),
+            present("product"),
+        )
+
+    def to_dict(self) -> Dict:
+        return {
+            "key": self.key,
+            "path": self.path,
+            "rows": self.rows,
+            "min_date": self.min_date.date().isoformat(),
+            "max_date": self.max_date.date().isoformat(),
+            "min_balance": self.min_balance,
+            "max_balance": self.max_balance,
+            "min_customer": self.min_customer,
+            "max_customer": self.max_customer,
+            "segments": self.segments,
+            "products": self.products,
+        }
+
+    @classmethod
+    def from_dict(cls, entry: Dict) -> "Partition":
+        return cls(**entry)
+
+    def may_match(self, filters: Dict) -> bool:
+        """False only when no row of the partition can satisfy ``filters``."""
+        start, end = filters.get("start_date"), filters.get("end_date")
+        if start is not None and self.max_date < pd.Timestamp(start).normalize():
+            return False
+        if end is not None and self.min_date > pd.Timestamp(end).normalize():
+            return False
+        for key, column in FILTER_COLUMNS.items():
+            wanted = filters.get(key) or []
+            if wanted and not set(wanted).intersection(getattr(self, key)):
+                return False
+        return True
+
+
+class Manifest:
+    """Index of a partitioned dataset: ``manifest.json`` plus one columnar cache per partition."""
+
+    def __init__(self, root: str | os.PathLike, granularity: str, partitions: List[Partition]):
+        self.root = Path(root)
+        self.granularity = granularity
+        self.partitions = partitions
+
+    @classmethod
+    def load(cls, root: str | os.PathLike) -> "Manifest":
+        meta = json.loads(Path(root, MANIFEST_FILE).read_text(encoding="utf-8"))
+        return cls(root, meta["granularity"], [Partition.from_dict(entry) for entry in meta["partitions"]])
+
+    @staticmethod
+    def exists(root: str | os.PathLike) -> bool:
+        return Path(root, MANIFEST_FILE).exists()
+
+    @property
+    def rows(self) -> int:
+        return sum(partition.rows for partition in self.partitions)
+
+    def domain(self) -> FilterDomain:
+        """Sidebar bounds and options straight from the zone maps."""
+        if not self.partitions:
+            return FilterDomain(None, None, [], [])
+        return FilterDomain(
+            min(p.min_date for p in self.partitions),
+            max(p.max_date for p in self.partitions),
+            sorted({s for p in self.partitions for s in p.segments}),
+            sorted({s for p in self.partitions for s in p.products}),
+        )
+
+    def prune(self, filters: Optional[Dict] = None) -> List[Partition]:
+        """Partitions whose zone map can match ``filters`` (all of them for None)."""
+        return [p for p in self.partitions if filters is None or p.may_match(filters)]
+
+    def iter_frames(
+        self,
+        partitions: Optional[Sequence[Partition]] = None,
+        columns: Optional[Sequence[str]] = None,
+    ) -> Iterator[pd.DataFrame]:
+        """Read ``partitions`` (all by default) one at a time, restricted to ``columns``."""
+        for partition in self.partitions if partitions is None else partitions:
+            yield schema.enforce_schema(column_store.read_columns(self.root / partition.path, columns=columns))
+
+    def select(self, filters: Dict) -> pd.DataFrame:
+        """Rows matching ``filters``, opening only the partitions that can match."""
+        frames = [FilterIndex(frame).select(filters) for frame in self.iter_frames(self.prune(filters))]
+        if not frames:
+            return next(self.iter_frames(self.partitions[:1])).iloc[:0] if self.partitions else pd.DataFrame()
+        return schema.enforce_schema(pd.concat(frames, ignore_index=True)) if len(frames) > 1 else frames[0]
+
+
+def is_fresh(root: str | os.PathLike, source: Optional[str | os.PathLike] = None) -> bool:
+    """True if the manifest exists and is not older than ``source`` (when given)."""
+    manifest = Path(root, MANIFEST_FILE)
+    if not manifest.exists():
+        return False
+    if source is None or not Path(source).is_file():
+        return True
+    return Path(source).stat().st_mtime_ns <= manifest.stat().st_mtime_ns
+
+
+def write_partitions(chunks: Iterable[pd.DataFrame], root: str | os.PathLike, granularity: str = "month") -> Manifest:
+    """Write ``chunks`` as a partitioned layout under ``root``.
+
+    Each chunk's rows are split by partition key and written as one fragment
+    (``2024-03/part-00000``) per key, so the source is never held whole and a
+    key can span several fragments. Like ``column_store.write_columns``, the
+    layout is built next to ``root`` and swapped in at the end.
+    """
+    if granularity not in GRANULARITIES:
+        raise ValueError(f"Unknown granularity: {granularity!r}")
+    target = Path(root)
+    tmp = target.with_name(target.name + ".tmp")
+    shutil.rmtree(tmp, ignore_errors=True)
+    tmp.mkdir(parents=True)
+
+    partitions: List[Partition] = []
+    for chunk in chunks:
+        keys = chunk["date"].dt.strftime(GRANULARITIES[granularity])
+        for key, rows in chunk.groupby(keys, sort=True):
+            path = f"{key}/part-{len(partitions):05d}"
+            column_store.write_columns(rows.reset_index(drop=True), tmp / path)
+            partitions.append(Partition.describe(key, path, rows))
+    partitions.sort(key=lambda p: (p.min_date, p.path))
+
+    meta = {"version": FORMAT_VERSION, "granularity": granularity, "partitions": [p.to_dict() for p in partitions]}
+    (tmp / MANIFEST_FILE).write_text(json.dumps(meta, indent=1), encoding="utf-8")
+    shutil.rmtree(target, ignore_errors=True)
+    os.replace(tmp, target)
+    return Manifest(target, granularity, partitions)
+
+
+class PartitionedRows:
+    """Raw rows of a partitioned dataset plus the rows ingested since it was loaded."""
+
+    def __init__(self, manifest: Manifest, extra: Optional[FilterIndex] = None):
+        self.manifest = manifest
+        self.extra = extra
+
+    def append(self, df: pd.DataFrame) -> "PartitionedRows":
+        return PartitionedRows(self.manifest, FilterIndex(df) if self.extra is None else self.extra.append(df))
+
+    def select(self, filters: Dict) -> pd.DataFrame:
+        stored = self.manifest.select(filters)
+        if self.extra is None:
+            return stored
+        return schema.enforce_schema(pd.concat([stored, self.extra.select(filters)], ignore_index=True))
+
+
+def main(argv: Optional[Sequence[str]] = None) -> None:
+    from services.data_loader import iter_transaction_chunks
+
+    parser = argparse.ArgumentParser(description="Write a transactions CSV as a date-partitioned layout.")
+    parser.add_argument("source", nargs="?", default=os.path.join("data", "sample", "transactions.csv"))
+    parser.add_argument("--by", choices=sorted(GRANULARITIES), default="month")
+    args = parser.parse_args(argv)
+    manifest = write_partitions(iter_transaction_chunks(args.source), parts_dir_for(args.source), args.by)
+    print(f"{manifest.rows:,} rows in {len(manifest.partitions)} partitions under {manifest.root}")
+
+
+if __name__ == "__main__":
+    main()
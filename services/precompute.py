@@ -0,0 +1,158 @@
+from __future__ import annotations
+
+import logging
+import os
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+import pandas as pd
+
+from services import query, tracing
+from services.dataset import Dataset
+from services.filter_engine import FilterDomain
+
+
+# Background precompute after every load or ingestion: off with DASHBOARD_PRECOMPUTE=0
+ENABLED = os.environ.get("DASHBOARD_PRECOMPUTE", "1").lower() in ("1", "true", "yes")
+# Views computed ahead of time: "all", "last_<n>_days", "segments" (each alone), "products" (each alone)
+PRESETS = [name.strip() for name in os.environ.get("DASHBOARD_PRESETS", "all,last_30_days,last_90_days,segments").split(",") if name.strip()]
+# Plus the most frequent recent filter selections
+TOP_QUERIES = int(os.environ.get("DASHBOARD_PRECOMPUTE_TOP", "8"))
+# Cache space one pass may fill (results and figures), so it never evicts much of what sessions use
+MEMORY_BUDGET = int(os.environ.get("DASHBOARD_PRECOMPUTE_MB", "32")) * 1024 * 1024
+# A pass only works once no page has rendered for this long, and checks that often
+IDLE_GRACE_SECONDS = float(os.environ.get("DASHBOARD_PRECOMPUTE_IDLE_SECONDS", "0.2"))
+IDLE_POLL_SECONDS = 0.05
+
+logger = logging.getLogger(__name__)
+
+
+def preset_filters(name: str, domain: FilterDomain) -> List[Dict]:
+    """Filter dicts (as ``render_filters`` returns them) of the preset ``name``."""
+    if name == "all":
+        return [{}]
+    if name.startswith("last_") and name.endswith("_days"):
+        if domain.max_date is None:
+            return []
+        days = int(name[len("last_"):-len("_days")])
+        return [{"start_date": domain.max_date - pd.Timedelta(days=days - 1), "end_date": domain.max_date}]
+    if name == "segments":
+        return [{"segments": [segment]} for segment in domain.segments]
+    if name == "products":
+        return [{"products": [product]} for product in domain.products]
+    raise ValueError(f"Unknown preset: {name!r}")
+
+
+class Precomputer:
+    """Fills the query and figure caches ahead of time, on a background thread.
+
+    After every new dataset version, and when the pages render a chart not seen
+    before, it computes the results of the presets and of the most frequent
+    recent queries, then every chart the pages have rendered so far (see
+    ``query.recipes``) for each of them. Between two steps it waits until no
+    session has rendered or queried for ``IDLE_GRACE_SECONDS``, and its thread
+    has the lowest OS priority where supported. A pass stops once it has added ``budget_bytes``
+    to the caches, or when a newer version arrives.
+    """
+
+    def __init__(self, presets: List[str] = PRESETS, top_queries: int = TOP_QUERIES, budget_bytes: int = MEMORY_BUDGET):
+        self.presets = presets
+        self.top_queries = top_queries
+        self.budget_bytes = budget_bytes
+        self.last_pass: Dict[str, float] = {}
+        self._scheduled: Dict[str, Tuple[int, int]] = {}
+        self._pending: Dict[str, Dataset] = {}
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def schedule(self, dataset: Dataset) -> None:
+        """Queue a pass over ``dataset``, unless its current version already had one
+        with the charts known now."""
+        state = (dataset.version, len(query.recipes()))
+        with self._lock:
+            if self._scheduled.get(dataset.name) == state:
+                return
+            self._scheduled[dataset.name] = state
+            self._pending[dataset.name] = dataset
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._loop, name="precompute", daemon=True)
+                self._thread.start()
+        self._wake.set()
+
+    def _loop(self) -> None:
+        _lower_priority()
+        while True:
+            self._wake.wait()
+            self._wake.clear()
+            while True:
+                with self._lock:
+                    if not self._pending:
+                        break
+                    _, dataset = self._pending.popitem()
+                try:
+                    self.run(dataset)
+                except Exception:  # a failed pass must not kill the thread
+                    logger.exception("Precompute failed")
+
+    def jobs(self, dataset: Dataset) -> List[Dict]:
+        """Filters to precompute: presets first, then frequent queries, without duplicates."""
+        domain = dataset.domain
+        candidates = [f for name in self.presets for f in preset_filters(name, domain)]
+        candidates += query.frequent_filters(self.top_queries)
+        jobs, seen = [], set()
+        cube = dataset.cube
+        for filters in candidates:
+            key, _ = query.normalize_filters(filters, cube)
+            if key not in seen:
+                seen.add(key)
+                jobs.append(filters)
+        return jobs
+
+    def run(self, dataset: Dataset, wait_idle: bool = True) -> Dict[str, float]:
+        """One pass over the current version of ``dataset``; returns what it added."""
+        start = time.perf_counter()
+        version = dataset.version
+        added, results, figures = 0, 0, 0
+
+        def go_on() -> bool:
+            if wait_idle:
+                while query.busy() or tracing.idle_seconds() < IDLE_GRACE_SECONDS:
+                    time.sleep(IDLE_POLL_SECONDS)
+            return dataset.version == version and added < self.budget_bytes
+
+        for filters in self.jobs(dataset):
+            if not go_on():
+                break
+            result, computed = query.prefetch(dataset, filters)
+            if computed:
+                added += result.nbytes
+                results += 1
+            for build, options in query.recipes():
+                if query.has_figure(result, build, **options):
+                    continue
+                if not go_on():
+                    break
+                query.figure(result, build, **options)
+                added += query.figure_size(result, build, **options)
+                figures += 1
+        self.last_pass = {"version": version, "results": results, "figures": figures, "bytes": added, "seconds": time.perf_counter() - start}
+        logger.info("Precomputed %d results and %d figures (%.1f MB) in %.2f s", results, figures, added / 2**20, self.last_pass["seconds"])
+        return self.last_pass
+
+
+def _lower_priority() -> None:
+    """Give the calling thread the lowest scheduling priority (Linux: per-thread nice)."""
+    try:
+        os.setpriority(os.PRIO_PROCESS, threading.get_native_id(), 19)
+    except (AttributeError, OSError):
+        pass
+
+
+PRECOMPUTER = Precomputer()
+
+
+def schedule(dataset: Dataset) -> None:
+    if ENABLED:
+        PRECOMPUTER.schedule(dataset)
@@ -0,0 +1,343 @@
+from __future__ import annotations
+
+import os
+import threading
+from collections import Counter, deque
+from typing import Any, Callable, Deque, Dict, Hashable, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+import streamlit as st
+
+from services import tracing
+from services.cube import Cube
+from services.dataset import Dataset, Rows
+from services.filter_engine import FilterIndex
+from services.ingest import INCOMING_DIR
+from services.result_cache import LRUCache
+from services.snapshot import MODES, AsOfIndex
+from services.sql_store import SqlStore
+
+
+CACHE_MAX_ENTRIES = int(os.environ.get("DASHBOARD_QUERY_CACHE_ENTRIES", "256"))
+CACHE_MAX_BYTES = int(os.environ.get("DASHBOARD_QUERY_CACHE_MB", "64")) * 1024 * 1024
+FIGURE_CACHE_MAX_ENTRIES = int(os.environ.get("DASHBOARD_FIGURE_CACHE_ENTRIES", "256"))
+FIGURE_CACHE_MAX_BYTES = int(os.environ.get("DASHBOARD_FIGURE_CACHE_MB", "64")) * 1024 * 1024
+# Filter selections remembered to find the most frequent ones (see ``frequent_filters``)
+RECENT_QUERIES = 1000
+
+FilterKey = Tuple[Optional[str], Optional[str], Tuple[str, ...], Tuple[str, ...], str]
+
+
+class QueryResult:
+    """Filtered aggregates for one normalized filter selection.
+
+    ``cube`` is the selected sub-cube (without its customer sketch, the
+    Customers count is already in ``kpis``); ``rows()`` gives the matching raw
+    rows for the few views that still need them. In snapshot mode the cube
+    has a single day, the end date, holding each customer's latest row.
+    """
+
+    def __init__(
+        self,
+        key: FilterKey,
+        filters: Dict,
+        cube: Cube,
+        kpis: List[Dict],
+        rows: Optional[Rows],
+        version: int = 0,
+        name: str = "",
+    ):
+        self.key = key
+        self.filters = filters
+        self.cube = cube
+        self.kpis = kpis
+        self.version = version
+        self.name = name
+        self._rows = rows
+
+    @property
+    def nbytes(self) -> int:
+        return self.cube.nbytes
+
+    def rows(self) -> pd.DataFrame:
+        if self._rows is None:
+            raise RuntimeError("Raw rows are not kept in streaming mode")
+        if self.filters.get("mode") == "snapshot":
+            return _latest_rows(self._rows, self.filters, self.cube.dates[0])
+        return self._rows.select(self.filters)
+
+
+_results = LRUCache(max_entries=CACHE_MAX_ENTRIES, max_bytes=CACHE_MAX_BYTES, sizeof=lambda result: result.nbytes)
+
+
+def _json_nbytes(value: Any) -> int:
+    if isinstance(value, np.ndarray):
+        # Numbers go out as base64 typed arrays; dates and labels as strings
+        return value.nbytes * 4 // 3 if value.dtype.kind in "biuf" else value.size * 24
+    if isinstance(value, dict):
+        return sum(len(key) + 4 + _json_nbytes(item) for key, item in value.items())
+    if isinstance(value, (list, tuple)):
+        return sum(_json_nbytes(item) + 1 for item in value)
+    if isinstance(value, str):
+        return len(value) + 2
+    return 8
+
+
+def figure_nbytes(fig: Any) -> int:
+    """Approximate size of a Plotly figure as the JSON sent to the browser.
+
+    Estimated from its arrays and properties: serializing it here would
+    double the cost of ``st.plotly_chart``, which serializes it again.
+    """
+    return sum(_json_nbytes(trace.to_plotly_json()) for trace in fig.data) + _json_nbytes(fig.layout.to_plotly_json())
+
+
+# Built Plotly figures
+_figures = LRUCache(max_entries=FIGURE_CACHE_MAX_ENTRIES, max_bytes=FIGURE_CACHE_MAX_BYTES, sizeof=figure_nbytes)
+# Charts the pages asked for, with the options they last used, for the precompute to replay
+_recipes: Dict[Hashable, Tuple[Callable[..., Any], Dict[str, Any]]] = {}
+_recent: Deque[Tuple[FilterKey, Dict]] = deque(maxlen=RECENT_QUERIES)
+_active = 0
+_active_lock = threading.Lock()
+
+
+@st.cache_resource(show_spinner=False)
+def _shared_dataset(csv_path: Optional[str], incoming_dir: Optional[str]) -> Dataset:
+    return Dataset.load(csv_path, incoming_dir=incoming_dir)
+
+
+def load_dataset(csv_path: Optional[str] = None, incoming_dir: Optional[str] = None) -> Dataset:
+    """Dataset shared by all pages and sessions of the process, with new files merged in.
+
+    The default dataset also ingests ``DASHBOARD_INCOMING_DIR``; another
+    ``csv_path`` only does when ``incoming_dir`` is given.
+    """
+    if incoming_dir is None and csv_path is None:
+        incoming_dir = INCOMING_DIR
+    dataset = _shared_dataset(csv_path, incoming_dir)
+    dataset.refresh()
+    from services import precompute  # imports this module
+
+    precompute.schedule(dataset)
+    return dataset
+
+
+def compute_kpis(
+    dataframe: pd.DataFrame | Cube,
+    totals: Optional[Dict[str, float]] = None,
+    customers: Optional[int] = None,
+) -> list[dict]:
+    """KPI cards of rows or of a cube; ``totals`` and ``customers`` replace ``cube.totals()``
+    and the cube's distinct count when already known."""
+    customers_help = "Number of unique customers"
+    if isinstance(dataframe, Cube):
+        totals = dataframe.totals() if totals is None else totals
+        distinct = dataframe.distinct_customers() if customers is None else customers
+        total_customers = "-" if distinct is None else distinct
+        if dataframe.customers is not None and not dataframe.customers.exact:
+            customers_help += f" (approximate, ±{dataframe.customers.error:.1%})"
+        total_balance = totals["balance"]
+        average_balance = totals["balance"] / totals["count"] if totals["count"] else 0.0
+        delinquency_rate = totals["delinquent"] / totals["count"] * 100.0 if totals["count"] else 0.0
+    else:
+        total_customers = int(dataframe["customer_id"].nunique())
+        total_balance = float(dataframe["balance"].sum())
+        average_balance = float(dataframe["balance"].mean()) if not dataframe.empty else 0.0
+        delinquency_rate = float(dataframe["delinquent"].mean() * 100.0) if "delinquent" in dataframe.columns else 0.0
+
+    return [
+        {"label": "Customers", "value": total_customers, "help": customers_help},
+        {"label": "Total balance (M€)", "value": total_balance / 1e6, "format": "{:,.2f}", "help": "Sum of all balances"},
+        {"label": "Avg. balance (€)", "value": average_balance, "format": "{:,.0f}", "help": "Average balance per account"},
+        {"label": "Delinquency rate (%)", "value": delinquency_rate, "format": "{:,.2f}", "help": "Share of accounts in default"},
+    ]
+
+
+def normalize_filters(filters: Dict, cube: Cube) -> Tuple[FilterKey, Dict]:
+    """Canonical cache key and filter dict for ``filters``.
+
+    Dates are clipped to the data range (a bound outside it becomes None),
+    category lists are sorted and de-duplicated, and a list that selects every
+    value collapses to the empty list, which also means "all". ``mode`` is
+    one of ``services.snapshot.MODES``, "flows" when missing.
+    """
+    dates = cube.dates
+    first, last = (dates[0], dates[-1]) if len(dates) else (None, None)
+    start, end = filters.get("start_date"), filters.get("end_date")
+    start = None if start is None or first is None or pd.Timestamp(start) <= first else pd.Timestamp(start).normalize()
+    end = None if end is None or last is None or pd.Timestamp(end) >= last else pd.Timestamp(end).normalize()
+
+    def categories(values: Optional[List[str]], domain: List[str]) -> Tuple[str, ...]:
+        chosen = sorted(set(values or []))
+        return () if not chosen or set(chosen).issuperset(domain) else tuple(chosen)
+
+    segments = categories(filters.get("segments"), cube.segments)
+    products = categories(filters.get("products"), cube.products)
+    mode = filters.get("mode") or MODES[0]
+    if mode not in MODES:
+        raise ValueError(f"Unknown filter mode: {mode!r}")
+    key = (
+        None if start is None else start.date().isoformat(),
+        None if end is None else end.date().isoformat(),
+        segments,
+        products,
+        mode,
+    )
+    normalized = {"start_date": start, "end_date": end, "segments": list(segments), "products": list(products), "mode": mode}
+    return key, normalized
+
+
+def run_query(filters: Dict, csv_path: Optional[str] = None, incoming_dir: Optional[str] = None) -> QueryResult:
+    """Filtered cube and KPIs for ``filters``, cached across pages and sessions.
+
+    The key includes the dataset version, so ingested rows invalidate older results.
+    Within a traced render, the lookup is timed as "query" (with "filter" and
+    "aggregate" on a miss) and noted as a query cache hit or miss.
+    """
+    global _active
+    with _active_lock:
+        _active += 1
+    try:
+        dataset = load_dataset(csv_path, incoming_dir)
+        tracing.note("query_cache", "hit")
+        with tracing.span("query"):
+            result = lookup(dataset, filters)
+        _recent.append((result.key, result.filters))
+        return result
+    finally:
+        with _active_lock:
+            _active -= 1
+
+
+def lookup(dataset: Dataset, filters: Dict) -> QueryResult:
+    """Cached result of ``filters`` on the current version of ``dataset``, computed on a miss."""
+    cache_key, compute = _query(dataset, filters)
+    return _results.get_or_compute(cache_key, compute)
+
+
+def prefetch(dataset: Dataset, filters: Dict) -> Tuple[QueryResult, bool]:
+    """``lookup`` for background precomputation, and whether the result had to be computed.
+
+    Left out of the cache statistics and recency, so they keep describing
+    what sessions ask for.
+    """
+    cache_key, compute = _query(dataset, filters)
+    result = _results.peek(cache_key)
+    if result is not None:
+        return result, False
+    result = compute()
+    _results.put(cache_key, result)
+    return result, True
+
+
+def _query(dataset: Dataset, filters: Dict) -> Tuple[Hashable, Callable[[], QueryResult]]:
+    version, rows, full_cube = dataset.state
+    key, normalized = normalize_filters(filters, full_cube)
+
+    def compute() -> QueryResult:
+        tracing.note("query_cache", "miss")
+        if isinstance(rows, SqlStore):
+            return _pushdown(key, normalized, rows, full_cube, version, dataset.name)
+        if normalized["mode"] == "snapshot":
+            return _snapshot(key, normalized, rows, full_cube, version, dataset.name)
+        with tracing.span("filter"):
+            cube = full_cube.select(normalized)
+        with tracing.span("aggregate"):
+            kpis = compute_kpis(cube, full_cube.prefix_sums().totals(normalized))
+        cube.customers = None  # counted already; don't keep the sketch slice in the cache
+        return QueryResult(key, normalized, cube, kpis, rows, version, dataset.name)
+
+    return (dataset.name, version, key), compute
+
+
+def _snapshot(key: FilterKey, filters: Dict, rows: Optional[Rows], full_cube: Cube, version: int, name: str) -> QueryResult:
+    """Result of a snapshot selection: a one-day cube of each customer's latest row."""
+    if rows is None:
+        raise RuntimeError("Snapshots need the raw rows, which are not kept in streaming mode")
+    as_of = filters["end_date"] if filters["end_date"] is not None else full_cube.dates[-1]
+    with tracing.span("filter"):
+        latest = _latest_rows(rows, filters, as_of)
+    with tracing.span("aggregate"):
+        cube = Cube.from_frame(
+            latest.assign(date=as_of),
+            segments=full_cube.segments,
+            products=full_cube.products,
+            histogram_edges={mode: histogram.edges for mode, histogram in full_cube.histograms.items()},
+            sketch_like=full_cube.customers,
+        )
+        kpis = compute_kpis(cube)
+    cube.customers = None
+    return QueryResult(key, filters, cube, kpis, rows, version, name)
+
+
+def _pushdown(key: FilterKey, filters: Dict, store: SqlStore, full_cube: Cube, version: int, name: str) -> QueryResult:
+    """Result of a selection on a SQL backend: filters and group-bys run in the database."""
+    with tracing.span("aggregate", store.engine):
+        cube, customers = store.aggregate(filters, full_cube)
+        kpis = compute_kpis(cube, customers=customers)
+    return QueryResult(key, filters, cube, kpis, store, version, name)
+
+
+def _latest_rows(rows: Rows, filters: Dict, as_of: pd.Timestamp) -> pd.DataFrame:
+    if isinstance(rows, SqlStore):
+        return rows.latest(filters, as_of)
+    # Partitioned rows are indexed per query, from the partitions up to the date only
+    index = rows.as_of() if isinstance(rows, FilterIndex) else AsOfIndex(rows.select({"end_date": as_of}))
+    return index.snapshot(filters)
+
+
+def _figure_key(result: QueryResult, build: Callable[..., Any], options: Dict[str, Any]) -> Tuple[Hashable, Hashable]:
+    recipe = (build.__module__, build.__qualname__, tuple(sorted(options.items())))
+    return (result.name, result.version, result.key) + recipe, recipe
+
+
+def figure(result: QueryResult, build: Callable[..., Any], **options) -> Any:
+    """``build(result.cube, **options)``, built once per result and shared like the result.
+
+    The figure must be treated as read-only. The (build, options) pair is
+    remembered so ``services.precompute`` can build the same charts ahead of time.
+    """
+    key, recipe = _figure_key(result, build, options)
+    _recipes[recipe[:2]] = (build, options)
+    return _figures.get_or_compute(key, lambda: build(result.cube, **options))
+
+
+def has_figure(result: QueryResult, build: Callable[..., Any], **options) -> bool:
+    return _figure_key(result, build, options)[0] in _figures
+
+
+def figure_size(result: QueryResult, build: Callable[..., Any], **options) -> int:
+    """Cached size of that figure in bytes (0 when not cached)."""
+    return _figures.size_of(_figure_key(result, build, options)[0])
+
+
+def recipes() -> List[Tuple[Callable[..., Any], Dict[str, Any]]]:
+    """(build, options) of every chart the pages have rendered so far, with its latest options."""
+    return list(_recipes.values())
+
+
+def frequent_filters(limit: int) -> List[Dict]:
+    """Normalized filters of the ``limit`` most frequent recent queries."""
+    recent = list(_recent)
+    filters = dict(recent)
+    return [filters[key] for key, _ in Counter(key for key, _ in recent).most_common(limit)]
+
+
+def busy() -> bool:
+    """Whether a session is rendering a page or running a query right now."""
+    return _active > 0 or tracing.active_renders() > 0
+
+
+def cache_stats() -> Dict[str, float]:
+    """Hit/miss counters and occupancy of the shared query cache."""
+    return _results.stats()
+
+
+def figure_cache_stats() -> Dict[str, float]:
+    return _figures.stats()
+
+
+def clear_cache() -> None:
+    _results.clear()
+    _figures.clear()
@@ -0,0 +1,97 @@
+from __future__ import annotations
+
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple
+
+
+class LRUCache:
+    """Thread-safe LRU cache bounded by entry count and by total size in bytes.
+
+    Values are stored with a size computed by ``sizeof`` when inserted; the least
+    recently used entries are evicted until both bounds hold again. One instance
+    lives per process, so every Streamlit session shares it.
+    """
+
+    def __init__(self, max_entries: int = 256, max_bytes: int = 64 * 1024 * 1024, sizeof: Optional[Callable[[Any], int]] = None):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._sizeof = sizeof or (lambda value: 0)
+        self._items: "OrderedDict[Hashable, Tuple[Any, int]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            item = self._items.get(key)
+            if item is None:
+                self.misses += 1
+                return default
+            self._items.move_to_end(key)
+            self.hits += 1
+            return item[0]
+
+    def __contains__(self, key: Hashable) -> bool:
+        with self._lock:
+            return key in self._items
+
+    def peek(self, key: Hashable, default: Any = None) -> Any:
+        """Value for ``key`` without counting a lookup or refreshing its recency."""
+        with self._lock:
+            item = self._items.get(key)
+            return default if item is None else item[0]
+
+    def size_of(self, key: Hashable) -> int:
+        """Recorded size of the entry for ``key`` (0 when absent)."""
+        with self._lock:
+            item = self._items.get(key)
+            return 0 if item is None else item[1]
+
+    def put(self, key: Hashable, value: Any) -> None:
+        size = int(self._sizeof(value))
+        with self._lock:
+            if key in self._items:
+                self._bytes -= self._items.pop(key)[1]
+            if size > self.max_bytes:
+                return  # never cache a value larger than the whole budget
+            self._items[key] = (value, size)
+            self._bytes += size
+            while self._items and (len(self._items) > self.max_entries or self._bytes > self.max_bytes):
+                _, (_, evicted_size) = self._items.popitem(last=False)
+                self._bytes -= evicted_size
+                self.evictions += 1
+
+    def get_or_compute(self, key: Hashable, compute: Callable[[], Any]) -> Any:
+        """Cached value for ``key``, computing and storing it on a miss.
+
+        The computation runs outside the lock: two sessions missing on the same
+        key at once may both compute it, but neither blocks the other's hits.
+        """
+        sentinel = object()
+        value = self.get(key, sentinel)
+        if value is sentinel:
+            value = compute()
+            self.put(key, value)
+        return value
+
+    def clear(self) -> None:
+        with self._lock:
+            self._items.clear()
+            self._bytes = 0
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+                "entries": len(self._items),
+                "bytes": self._bytes,
+                "max_entries": self.max_entries,
+                "max_bytes": self.max_bytes,
+            }
@@ -0,0 +1,100 @@
+from __future__ import annotations
+
+from typing import Dict, List, Mapping
+
+import numpy as np
+import pandas as pd
+
+
+SEGMENTS: List[str] = ["Retail", "Affluent", "SME", "Corporate"]
+PRODUCTS: List[str] = ["Current", "Savings", "Loan", "Invest"]
+CATEGORIES: Dict[str, List[str]] = {"segment": SEGMENTS, "product": PRODUCTS}
+
+# Canonical in-memory dtypes of the transactions frame
+DATE_DTYPE = np.dtype("datetime64[s]")
+CUSTOMER_ID_DTYPE = np.dtype(np.int32)
+BALANCE_DTYPE = np.dtype(np.float32)
+DELINQUENT_DTYPE = np.dtype(np.int8)
+
+
+def category_dtype(column: str, values: pd.Series | None = None) -> pd.CategoricalDtype:
+    """Fixed dictionary for ``column``; values outside it are appended in sorted order."""
+    categories = list(CATEGORIES[column])
+    if values is not None:
+        seen = values.cat.categories if isinstance(values.dtype, pd.CategoricalDtype) else pd.unique(values.dropna())
+        extras = sorted(str(v) for v in seen if v not in categories)
+        categories += extras
+    return pd.CategoricalDtype(categories)
+
+
+def union_categories(left: pd.CategoricalDtype, right: pd.CategoricalDtype) -> pd.CategoricalDtype:
+    """Categories of ``left`` followed by those only in ``right`` (existing codes keep their meaning)."""
+    extras = [c for c in right.categories if c not in left.categories]
+    return pd.CategoricalDtype(list(left.categories) + extras) if extras else left
+
+
+def recode(series: pd.Series, mapping: Mapping[str, str]) -> pd.Series:
+    """Rename values of a categorical column, merging categories that map to the same name.
+
+    Works on the (few) categories and remaps integer codes, never on the rows' strings.
+    """
+    if not isinstance(series.dtype, pd.CategoricalDtype):
+        series = series.astype("category")
+    old = series.cat.categories
+    renamed = [mapping.get(c, c) for c in old]
+    new_categories = list(dict.fromkeys(renamed))
+    remap = np.asarray([new_categories.index(r) for r in renamed] + [-1], dtype=np.int64)
+    codes = remap[series.cat.codes.to_numpy()]  # code -1 (missing) picks the trailing -1
+    return pd.Series(pd.Categorical.from_codes(codes, categories=new_categories), index=series.index, name=series.name)
+
+
+def enforce_schema(df: pd.DataFrame) -> pd.DataFrame:
+    """Cast the transactions frame to the canonical compact schema.
+
+    - ``date``: normalized to the day, ``datetime64[s]``
+    - ``customer_id``: int32 (kept as int64 if ids do not fit)
+    - ``segment`` / ``product``: categoricals over the fixed dictionaries
+    - ``balance``: float32
+    - ``delinquent``: int8
+
+    Columns already in the right dtype are left untouched.
+    """
+    casts: Dict[str, pd.Series] = {}
+    if "date" in df.columns:
+        date = df["date"]
+        if date.dtype != DATE_DTYPE:
+            date = pd.to_datetime(date)
+            if not (date.dt.normalize() == date).all():
+                date = date.dt.normalize()
+            casts["date"] = date.astype(DATE_DTYPE)
+    if "customer_id" in df.columns and df["customer_id"].dtype != CUSTOMER_ID_DTYPE:
+        ids = df["customer_id"]
+        info = np.iinfo(CUSTOMER_ID_DTYPE)
+        if ids.empty or (ids.min() >= info.min and ids.max() <= info.max):
+            casts["customer_id"] = ids.astype(CUSTOMER_ID_DTYPE)
+    for column in CATEGORIES:
+        if column in df.columns:
+            dtype = category_dtype(column, df[column])
+            if df[column].dtype != dtype:
+                casts[column] = df[column].astype(dtype)
+    if "balance" in df.columns and df["balance"].dtype != BALANCE_DTYPE:
+        casts["balance"] = df["balance"].astype(BALANCE_DTYPE)
+    if "delinquent" in df.columns and df["delinquent"].dtype != DELINQUENT_DTYPE:
+        casts["delinquent"] = df["delinquent"].astype(DELINQUENT_DTYPE)
+    return df.assign(**casts) if casts else df
+
+
+def memory_report(df: pd.DataFrame) -> pd.DataFrame:
+    """Deep memory usage per column, in total bytes and bytes per row."""
+    usage = df.memory_usage(index=False, deep=True)
+    rows = max(1, len(df))
+    report = pd.DataFrame(
+        {
+            "dtype": [str(df[c].dtype) for c in usage.index],
+            "bytes": usage.to_numpy(),
+            "bytes_per_row": usage.to_numpy() / rows,
+        },
+        index=usage.index,
+    )
+    report.loc["total"] = ["", int(usage.sum()), usage.sum() / rows]
+    return report
@@ -0,0 +1,62 @@
+from __future__ import annotations
+
+from typing import Dict, Optional
+
+import numpy as np
+import pandas as pd
+
+
+# Filter modes: sum every matching row over the period, or look at each customer as of the end date
+MODES = ("flows", "snapshot")
+
+
+class AsOfIndex:
+    """Each customer's latest observation at any date, over a frame of rows.
+
+    Row positions are kept sorted by (customer_id, date) as one int64 key per
+    row: ``rank(customer) * span + day``. The last row of every customer at
+    or before a date is then one vectorized binary search over all customers
+    at once; ties on the same day go to the row that comes last in the frame.
+    The frame must be treated as read-only by callers.
+    """
+
+    def __init__(self, frame: pd.DataFrame):
+        self.frame = frame
+        days = frame["date"].to_numpy().astype("datetime64[D]").astype(np.int64)
+        self.customers, rank = np.unique(frame["customer_id"].to_numpy(), return_inverse=True)
+        self.first_day = int(days.min()) if len(days) else 0
+        self.span = int(days.max()) - self.first_day + 1 if len(days) else 1
+        keys = rank.astype(np.int64) * self.span + (days - self.first_day)
+        self._order = np.argsort(keys, kind="stable")
+        self._keys = keys[self._order]
+
+    @property
+    def nbytes(self) -> int:
+        return self._order.nbytes + self._keys.nbytes + self.customers.nbytes
+
+    def positions(self, date: Optional[pd.Timestamp] = None) -> np.ndarray:
+        """Frame positions of each customer's last row on or before ``date`` (None: the last date)."""
+        day = self.span - 1 if date is None else int(np.datetime64(pd.Timestamp(date).date(), "D").astype(np.int64)) - self.first_day
+        if day < 0 or not len(self._keys):
+            return np.empty(0, dtype=np.intp)
+        day = min(day, self.span - 1)
+        ranks = np.arange(len(self.customers), dtype=np.int64)
+        found = np.searchsorted(self._keys, ranks * self.span + day, side="right") - 1
+        # A customer whose first row is after ``date`` lands on the previous customer's rows
+        found = found[(found >= 0) & (self._keys[np.maximum(found, 0)] // self.span == ranks)]
+        return self._order[found]
+
+    def snapshot(self, filters: Dict) -> pd.DataFrame:
+        """Latest row of every customer as of ``end_date``, for the dict returned by ``render_filters``.
+
+        Customers last seen before ``start_date`` are left out, and the
+        segment/product lists apply to the latest rows.
+        """
+        rows = self.frame.take(self.positions(filters.get("end_date")))
+        keep = np.ones(len(rows), dtype=bool)
+        if filters.get("start_date") is not None:
+            keep &= rows["date"].to_numpy() >= np.datetime64(pd.Timestamp(filters["start_date"]))
+        for key, column in (("segments", "segment"), ("products", "product")):
+            if filters.get(key):
+                keep &= rows[column].isin(filters[key]).to_numpy()
+        return rows if keep.all() else rows.iloc[np.flatnonzero(keep)]
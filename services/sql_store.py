@@ -0,0 +1,442 @@
+"""Transactions in a local SQL database, with filters and aggregates pushed down.
+
+Set ``DASHBOARD_BACKEND`` to ``sqlite`` (standard library) or ``duckdb``
+(needs the ``duckdb`` package) to serve the dataset from a database file next
+to the source (``x.csv`` -> ``x.sqlite`` / ``x.duckdb``) instead of pandas.
+The file is filled from the source chunk by chunk and rebuilt when the source
+changes. No raw rows are kept in memory: every query miss runs its date,
+segment and product filters and its group-bys in the database, and only the
+aggregates come back.
+"""
+from __future__ import annotations
+
+import json
+import math
+import os
+import sqlite3
+import threading
+from pathlib import Path
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+from services import schema
+from services.cube import Cube
+from services.data_loader import COLUMNS
+from services.filter_engine import FILTER_COLUMNS
+from services.histogram import DEFAULT_BINS, MODES as HISTOGRAM_MODES, Histogram, edges_for, linear_edges, log_edges
+from services.streaming import SAMPLE_SIZE
+
+
+# "pandas" keeps everything in memory; the others name an engine of ENGINES
+BACKEND = os.environ.get("DASHBOARD_BACKEND", "pandas").lower()
+TABLE = "transactions"
+# Stored columns; ``day`` is days since 1970-01-01 and ``seq`` the row's position in the source
+_COLUMNS = ("seq", "day", "customer_id", "segment", "product", "balance", "delinquent")
+
+
+def sql_path_for(source: str | os.PathLike, engine: str) -> Path:
+    """Database file stored next to a source file (``x.csv`` -> ``x.sqlite``)."""
+    path = Path(source)
+    return path.with_name(path.stem + "." + engine)
+
+
+def _day(date: pd.Timestamp) -> int:
+    return int(np.datetime64(pd.Timestamp(date).date(), "D").astype(np.int64))
+
+
+def _bin_case(column: str, edges: np.ndarray, lo: int = 0, hi: Optional[int] = None) -> str:
+    """SQL expression of the bin of ``column`` over ``edges``, as ``Histogram.build`` assigns it.
+
+    A balanced tree of CASE, so each row takes about log2(bins) comparisons;
+    values outside the edges fall in the first or last bin.
+    """
+    hi = len(edges) - 2 if hi is None else hi
+    if lo == hi:
+        return str(lo)
+    mid = (lo + hi + 1) // 2
+    return f"CASE WHEN {column} < {float(edges[mid])!r} THEN {_bin_case(column, edges, lo, mid - 1)} ELSE {_bin_case(column, edges, mid, hi)} END"
+
+
+def _labels(series: pd.Series) -> np.ndarray:
+    """Category labels of a categorical column, as an object array sharing one str per category."""
+    labels = np.asarray(list(series.cat.categories) + [None], dtype=object)
+    return labels[series.cat.codes.to_numpy()]  # code -1 (missing) picks the trailing None
+
+
+def _cells(cells: List[tuple], start: np.datetime64, num_days: int, segments: List[str], products: List[str]) -> Dict[str, np.ndarray]:
+    """Dense measures of (day, segment, product, balance, count, delinquent) group rows.
+
+    Rows whose segment or product is not in ``segments``/``products`` (e.g.
+    missing) are left out, like code -1 in ``Cube.from_frame``.
+    """
+    shape = (num_days, len(segments), len(products))
+    measures = {
+        "balance": np.zeros(shape),
+        "count": np.zeros(shape, dtype=np.int64),
+        "delinquent": np.zeros(shape, dtype=np.int64),
+    }
+    segment_codes, product_codes = {s: i for i, s in enumerate(segments)}, {p: i for i, p in enumerate(products)}
+    cells = [cell for cell in cells if cell[1] in segment_codes and cell[2] in product_codes]
+    if cells:
+        day, segment, product, *sums = zip(*cells)
+        flat = np.ravel_multi_index(
+            (
+                np.asarray(day, dtype=np.int64) - int(start.astype(np.int64)),
+                [segment_codes[s] for s in segment],
+                [product_codes[p] for p in product],
+            ),
+            shape,
+        )
+        for values, column in zip(measures.values(), sums):
+            values.reshape(-1)[flat] = np.asarray(column, dtype=values.dtype)
+    return measures
+
+
+class SqlStore:
+    """One database file holding the transactions table, shared by all sessions.
+
+    Works as the dataset's ``rows`` (``select``, ``iter_select``, ``append``)
+    and answers whole queries with ``aggregate``. Each thread gets its own
+    connection. Rows appended from the incoming directory are stored after the
+    source rows and dropped when the store is opened again, since the dataset
+    ingests those files anew. Subclasses implement one engine.
+    """
+
+    engine = ""
+    seq_type = "BIGINT"
+
+    def __init__(self, path: str | os.PathLike):
+        self.path = Path(path)
+        self._local = threading.local()
+        self._append_lock = threading.Lock()
+        self.histogram_edges: Dict[str, np.ndarray] = {}
+        self.rows = 0
+
+    # -- engine hooks --------------------------------------------------------------
+
+    def _connect(self):
+        raise NotImplementedError
+
+    def _insert(self, con, frame: pd.DataFrame) -> None:
+        """Insert ``frame`` (the stored columns, in order) into the table."""
+        raise NotImplementedError
+
+    def _create_indexes(self, con) -> None:
+        pass
+
+    def _latest(self) -> str:
+        """Subquery of each customer's latest row on or before the day given as its parameter."""
+        ranked = f"SELECT *, ROW_NUMBER() OVER (PARTITION BY customer_id ORDER BY day DESC, seq DESC) AS position FROM {TABLE} WHERE day <= ?"
+        return f"SELECT {', '.join(_COLUMNS)} FROM ({ranked}) AS ranked WHERE position = 1"
+
+    def _commit(self, con) -> None:
+        con.commit()
+
+    def _fetch_frame(self, cursor, names: Sequence[str]) -> pd.DataFrame:
+        return pd.DataFrame.from_records(cursor.fetchall(), columns=list(names))
+
+    # -- storage -------------------------------------------------------------------
+
+    @property
+    def connection(self):
+        con = getattr(self._local, "connection", None)
+        if con is None:
+            con = self._local.connection = self._connect()
+        return con
+
+    def _execute(self, sql: str, params: Sequence = ()):
+        return self.connection.execute(sql, list(params))
+
+    def _meta(self) -> Dict[str, str]:
+        try:
+            return dict(self._execute("SELECT key, value FROM meta").fetchall())
+        except Exception:  # no database yet, or one of another layout
+            return {}
+
+    def open(self, fingerprint, chunks: Callable[[], Iterable[pd.DataFrame]]) -> "SqlStore":
+        """Reuse the database when it was filled from ``fingerprint``, else fill it from ``chunks()``."""
+        meta = self._meta()
+        if meta.get("fingerprint") != json.dumps(fingerprint):
+            self.ingest(chunks(), fingerprint)
+            meta = self._meta()
+        self.rows = int(meta["source_rows"])
+        self.histogram_edges = {mode: np.asarray(edges) for mode, edges in json.loads(meta["histogram_edges"]).items()}
+        con = self.connection
+        con.execute(f"DELETE FROM {TABLE} WHERE seq >= ?", [self.rows])
+        self._commit(con)
+        return self
+
+    def ingest(self, chunks: Iterable[pd.DataFrame], fingerprint=None, bins: int = DEFAULT_BINS) -> None:
+        """Replace the table by the rows of ``chunks``, then index it and record its histogram edges."""
+        con = self.connection
+        con.execute("DROP TABLE IF EXISTS meta")
+        con.execute(f"DROP TABLE IF EXISTS {TABLE}")
+        con.execute(
+            f"CREATE TABLE {TABLE} (seq {self.seq_type}, day INTEGER, customer_id INTEGER, segment VARCHAR, "
+            "product VARCHAR, balance REAL, delinquent SMALLINT)"
+        )
+        rows = 0
+        for chunk in chunks:
+            self._insert(con, self._stored(chunk, rows))
+            rows += len(chunk)
+        self._create_indexes(con)
+
+        low, high = self._execute(f"SELECT MIN(balance), MAX(balance) FROM {TABLE}").fetchone()
+        low, high = (0.0, 1.0) if low is None else (float(low), float(high))
+        step = max(1, math.ceil(rows / SAMPLE_SIZE))
+        sample = np.asarray([v for (v,) in self._execute(f"SELECT balance FROM {TABLE} WHERE seq % ? = 0", [step]).fetchall()])
+        edges = {"linear": linear_edges(low, high, bins), "log": log_edges(low, high, bins)}
+        edges = {mode: edges[mode] if mode in edges else edges_for(mode, sample, bins) for mode in HISTOGRAM_MODES}
+
+        con.execute("CREATE TABLE meta (key VARCHAR PRIMARY KEY, value VARCHAR)")
+        meta = {
+            "fingerprint": json.dumps(fingerprint),
+            "source_rows": str(rows),
+            "histogram_edges": json.dumps({mode: values.tolist() for mode, values in edges.items()}),
+        }
+        con.executemany("INSERT INTO meta VALUES (?, ?)", list(meta.items()))
+        self._commit(con)
+
+    @staticmethod
+    def _stored(df: pd.DataFrame, first_seq: int) -> pd.DataFrame:
+        df = schema.enforce_schema(df)
+        return pd.DataFrame(
+            {
+                "seq": np.arange(first_seq, first_seq + len(df), dtype=np.int64),
+                "day": df["date"].to_numpy().astype("datetime64[D]").astype(np.int64),
+                "customer_id": df["customer_id"].to_numpy().astype(np.int64),
+                "segment": _labels(df["segment"]),
+                "product": _labels(df["product"]),
+                "balance": df["balance"].to_numpy(),
+                "delinquent": df["delinquent"].to_numpy().astype(np.int64),
+            }
+        )
+
+    def append(self, df: pd.DataFrame) -> "SqlStore":
+        """Insert ingested rows after the stored ones; the same store serves the new version."""
+        with self._append_lock:
+            con = self.connection
+            (count,) = con.execute(f"SELECT COUNT(*) FROM {TABLE}").fetchone()
+            self._insert(con, self._stored(df, int(count)))
+            self._commit(con)
+        return self
+
+    # -- pushdown ------------------------------------------------------------------
+
+    @staticmethod
+    def _where(filters: Dict, end: bool = True, categorized: bool = False) -> Tuple[List[str], List]:
+        """SQL predicates and parameters of the dict returned by ``render_filters``; with
+        ``categorized``, only rows with a segment and a product, which are all a cube holds."""
+        clauses, params = (["segment IS NOT NULL", "product IS NOT NULL"] if categorized else []), []
+        if filters.get("start_date") is not None:
+            clauses.append("day >= ?")
+            params.append(_day(filters["start_date"]))
+        if end and filters.get("end_date") is not None:
+            clauses.append("day <= ?")
+            params.append(_day(filters["end_date"]))
+        for key, column in FILTER_COLUMNS.items():
+            if filters.get(key):
+                clauses.append(f"{column} IN ({', '.join('?' * len(filters[key]))})")
+                params.extend(filters[key])
+        return clauses, params
+
+    def _source(self, filters: Dict, as_of: Optional[pd.Timestamp] = None, categorized: bool = False) -> Tuple[str, List]:
+        """FROM clause (with its WHERE) of the matching rows; with ``as_of``, of each
+        customer's latest row on or before that date (see ``services.snapshot``)."""
+        if as_of is None:
+            clauses, params = self._where(filters, categorized=categorized)
+            return TABLE + ("" if not clauses else " WHERE " + " AND ".join(clauses)), params
+        clauses, params = self._where(filters, end=False, categorized=categorized)
+        latest = f"({self._latest()}) AS latest"
+        return latest + ("" if not clauses else " WHERE " + " AND ".join(clauses)), [_day(as_of)] + params
+
+    def aggregate(self, filters: Dict, grid: Cube) -> Tuple[Cube, int]:
+        """Cube and distinct customers of a normalized selection, aggregated by the database.
+
+        ``grid`` (the dataset's cube) gives the days and categories. One
+        GROUP BY fills the day x segment x product cells, one more counts the
+        balances between the edges of all histogram modes at once. The
+        histograms are summed over the selected days (their day axis has
+        length 1), which is all the distribution chart reads. In snapshot mode
+        the cube has the single day ``as_of``, like ``query._snapshot``.
+        """
+        snapshot = filters.get("mode") == "snapshot"
+        segments = [s for s in grid.segments if not filters.get("segments") or s in filters["segments"]]
+        products = [p for p in grid.products if not filters.get("products") or p in filters["products"]]
+        if snapshot:
+            as_of = filters["end_date"] if filters.get("end_date") is not None else grid.dates[-1]
+            start, num_days = np.datetime64(pd.Timestamp(as_of).date(), "D"), 1
+        else:
+            as_of = None
+            days = grid.day_slice(filters.get("start_date"), filters.get("end_date"))
+            start, num_days = grid.start + days.start, days.stop - days.start
+        source, params = self._source(filters, as_of, categorized=True)
+
+        keys = "segment, product" if snapshot else "day, segment, product"
+        cells = self._execute(
+            f"SELECT {keys}, SUM(balance), COUNT(*), SUM(delinquent) FROM {source} GROUP BY {keys}", params
+        ).fetchall()
+        if snapshot:
+            cells = [(int(start.astype(np.int64)),) + tuple(cell) for cell in cells]
+        measures = _cells(cells, start, num_days, segments, products)
+
+        # Bins between the edges of all modes at once; each lies inside one bin of every mode
+        fine = np.unique(np.concatenate(list(self.histogram_edges.values())))
+        counts = self._execute(
+            f"SELECT segment, product, {_bin_case('balance', fine)}, COUNT(*) FROM {source} GROUP BY 1, 2, 3", params
+        ).fetchall()
+        fine_counts = np.zeros((1, len(segments), len(products), len(fine) - 1), dtype=np.int64)
+        segment_codes, product_codes = {s: i for i, s in enumerate(segments)}, {p: i for i, p in enumerate(products)}
+        for segment, product, which, count in counts:
+            fine_counts[0, segment_codes[segment], product_codes[product], which] = count
+        histograms = {}
+        for mode, edges in self.histogram_edges.items():
+            which = np.clip(np.searchsorted(edges, fine[:-1], side="right") - 1, 0, len(edges) - 2)
+            data = np.zeros(fine_counts.shape[:3] + (len(edges) - 1,), dtype=np.int64)
+            np.add.at(data, (slice(None), slice(None), slice(None), which), fine_counts)
+            histograms[mode] = Histogram(edges, data)
+
+        cube = Cube(start, segments, products, measures, None, histograms)
+        if snapshot:
+            return cube, int(measures["count"].sum())
+        (customers,) = self._execute(f"SELECT COUNT(DISTINCT customer_id) FROM {source}", params).fetchone()
+        return cube, int(customers)
+
+    def grid(self) -> Cube:
+        """Cube of every stored row, without customer sketch or histograms: the dataset's days,
+        categories and per-cell sums, for the sidebar and for normalizing filters."""
+        cells = self._execute(
+            f"SELECT day, segment, product, SUM(balance), COUNT(*), SUM(delinquent) FROM {TABLE} "
+            "WHERE segment IS NOT NULL AND product IS NOT NULL GROUP BY day, segment, product"
+        ).fetchall()
+        segments = list(schema.category_dtype("segment", pd.Series([c[1] for c in cells], dtype=object)).categories)
+        products = list(schema.category_dtype("product", pd.Series([c[2] for c in cells], dtype=object)).categories)
+        days = [c[0] for c in cells]
+        start = np.datetime64(min(days) if days else 0, "D")
+        num_days = max(days) - min(days) + 1 if days else 0
+        return Cube(start, segments, products, _cells(cells, start, num_days, segments, products))
+
+    # -- raw rows ------------------------------------------------------------------
+
+    def _frame(self, records: pd.DataFrame) -> pd.DataFrame:
+        if "day" in records.columns:
+            records["day"] = records["day"].to_numpy(dtype=np.int64).astype("datetime64[D]")
+            records = records.rename(columns={"day": "date"})
+        return schema.enforce_schema(records)
+
+    @staticmethod
+    def _names(columns: Optional[Sequence[str]]) -> List[str]:
+        return ["day" if c == "date" else c for c in (columns or COLUMNS)]
+
+    def select(self, filters: Dict, columns: Optional[Sequence[str]] = None) -> pd.DataFrame:
+        """Rows matching ``filters``, in date order like ``FilterIndex.select``."""
+        names = self._names(columns)
+        source, params = self._source(filters)
+        cursor = self._execute(f"SELECT {', '.join(names)} FROM {source} ORDER BY day, seq", params)
+        return self._frame(self._fetch_frame(cursor, names))
+
+    def iter_select(self, filters: Dict, chunk_rows: int, columns: Optional[Sequence[str]] = None) -> Iterator[pd.DataFrame]:
+        """``select`` fetched ``chunk_rows`` rows at a time."""
+        names = self._names(columns)
+        source, params = self._source(filters)
+        # A cursor of its own: the thread's connection may run other queries meanwhile
+        con = self._connect()
+        try:
+            cursor = con.execute(f"SELECT {', '.join(names)} FROM {source} ORDER BY day, seq", params)
+            while True:
+                records = cursor.fetchmany(chunk_rows)
+                if not records:
+                    break
+                yield self._frame(pd.DataFrame.from_records(records, columns=names))
+        finally:
+            con.close()
+
+    def latest(self, filters: Dict, as_of: pd.Timestamp) -> pd.DataFrame:
+        """Each customer's latest row on or before ``as_of``, like ``AsOfIndex.snapshot``."""
+        names = self._names(None)
+        source, params = self._source(filters, as_of)
+        cursor = self._execute(f"SELECT {', '.join(names)} FROM {source} ORDER BY customer_id", params)
+        return self._frame(self._fetch_frame(cursor, names))
+
+
+class SqliteStore(SqlStore):
+    """SQLite (standard library). The table is indexed for the pushed-down queries:
+    (day, segment, product, balance, delinquent) covers the date range scans and
+    their group-bys without reading the table, and (customer_id, day) finds each
+    customer's latest row with one seek (``seq`` is the rowid). WAL journaling
+    lets sessions read while new rows are appended."""
+
+    engine = "sqlite"
+    seq_type = "INTEGER PRIMARY KEY"
+    # Rows per INSERT batch, so only a slice of a chunk is ever held as Python objects
+    insert_rows = 10_000
+
+    def _connect(self):
+        con = sqlite3.connect(self.path, check_same_thread=False)
+        con.execute("PRAGMA journal_mode=WAL")
+        return con
+
+    def _insert(self, con, frame: pd.DataFrame) -> None:
+        sql = f"INSERT INTO {TABLE} VALUES ({', '.join('?' * len(_COLUMNS))})"
+        for start in range(0, len(frame), self.insert_rows):
+            part = frame.iloc[start:start + self.insert_rows]
+            con.executemany(sql, zip(*(part[name].tolist() for name in _COLUMNS)))
+
+    def _create_indexes(self, con) -> None:
+        con.execute(f"CREATE INDEX {TABLE}_cells ON {TABLE} (day, segment, product, balance, delinquent)")
+        con.execute(f"CREATE INDEX {TABLE}_customer ON {TABLE} (customer_id, day)")
+        con.execute("ANALYZE")
+
+    def _latest(self) -> str:
+        seek = f"SELECT seq FROM {TABLE} WHERE customer_id = customers.customer_id AND day <= ? ORDER BY day DESC, seq DESC LIMIT 1"
+        return (
+            f"SELECT {', '.join('t.' + c for c in _COLUMNS)} FROM (SELECT DISTINCT customer_id FROM {TABLE}) AS customers "
+            f"JOIN {TABLE} AS t ON t.seq = ({seek})"
+        )
+
+
+class DuckDbStore(SqlStore):
+    """DuckDB (optional ``duckdb`` package). It scans columns and skips row groups by
+    their min/max, so the table gets no index; rows are inserted in date order."""
+
+    engine = "duckdb"
+
+    def __init__(self, path: str | os.PathLike):
+        try:
+            import duckdb
+        except ImportError as exc:
+            raise RuntimeError("The duckdb backend needs the duckdb package (pip install duckdb)") from exc
+        super().__init__(path)
+        self._database = duckdb.connect(str(self.path))
+
+    def _connect(self):
+        return self._database.cursor()
+
+    def _insert(self, con, frame: pd.DataFrame) -> None:
+        con.register("chunk", frame.sort_values("day", kind="stable"))
+        try:
+            con.execute(f"INSERT INTO {TABLE} SELECT {', '.join(_COLUMNS)} FROM chunk")
+        finally:
+            con.unregister("chunk")
+
+    def _commit(self, con) -> None:
+        pass  # autocommit
+
+    def _fetch_frame(self, cursor, names: Sequence[str]) -> pd.DataFrame:
+        return cursor.df()
+
+
+ENGINES = {"sqlite": SqliteStore, "duckdb": DuckDbStore}
+BACKENDS = ("pandas",) + tuple(ENGINES)
+
+
+def open_store(source: str | os.PathLike, engine: str, fingerprint, chunks: Callable[[], Iterable[pd.DataFrame]]) -> SqlStore:
+    """Store of ``source`` for ``engine``, filled from ``chunks()`` unless already filled from ``fingerprint``."""
+    if engine not in ENGINES:
+        raise ValueError(f"Unknown backend: {engine!r} (expected one of {', '.join(BACKENDS)})")
+    path = sql_path_for(source, engine)
+    # The source may not exist yet (the sample is generated), nor its directory on a fresh checkout
+    path.parent.mkdir(parents=True, exist_ok=True)
+    return ENGINES[engine](path).open(fingerprint, chunks)
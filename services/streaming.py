@@ -0,0 +1,106 @@
+from __future__ import annotations
+
+from typing import Callable, Dict, Iterable, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+
+from services import schema
+from services.cube import Cube
+from services.distinct import empty_sketch
+from services.histogram import DEFAULT_BINS, MODES as HISTOGRAM_MODES, edges_for, linear_edges, log_edges
+from services.parallel import aggregate_frames
+
+# Balances kept to place the quantile histogram edges of a streamed source
+SAMPLE_SIZE = 100_000
+
+ChunkSource = Callable[[Optional[Sequence[str]]], Iterable[pd.DataFrame]]
+
+
+class SourceProfile:
+    """What the aggregation must know before the first chunk: the grid and the bin edges.
+
+    Collected in one cheap pass over ``date``, ``customer_id`` and ``balance``.
+    Quantile edges come from a uniform sample of at most ``SAMPLE_SIZE``
+    balances (halving the sampling rate whenever it overflows).
+    """
+
+    def __init__(self, seed: int = 0):
+        self.rows = 0
+        self.first_date: Optional[np.datetime64] = None
+        self.last_date: Optional[np.datetime64] = None
+        self.first_id: Optional[int] = None
+        self.last_id: Optional[int] = None
+        self.low = np.inf
+        self.high = -np.inf
+        self.sample = np.empty(0, dtype=schema.BALANCE_DTYPE)
+        self._rate = 1.0
+        self._rng = np.random.default_rng(seed)
+
+    def update(self, chunk: pd.DataFrame) -> None:
+        if chunk.empty:
+            return
+        self.rows += len(chunk)
+        days = chunk["date"].to_numpy().astype("datetime64[D]")
+        ids = chunk["customer_id"].to_numpy()
+        balance = chunk["balance"].to_numpy()
+        self.first_date = days.min() if self.first_date is None else min(self.first_date, days.min())
+        self.last_date = days.max() if self.last_date is None else max(self.last_date, days.max())
+        self.first_id = int(ids.min()) if self.first_id is None else min(self.first_id, int(ids.min()))
+        self.last_id = int(ids.max()) if self.last_id is None else max(self.last_id, int(ids.max()))
+        self.low, self.high = min(self.low, float(balance.min())), max(self.high, float(balance.max()))
+        kept = balance[self._rng.random(len(balance)) < self._rate]
+        self.sample = np.concatenate([self.sample, kept])
+        while len(self.sample) > SAMPLE_SIZE:
+            self._rate /= 2
+            self.sample = self.sample[self._rng.random(len(self.sample)) < 0.5]
+
+    @property
+    def num_days(self) -> int:
+        return 0 if self.first_date is None else int((self.last_date - self.first_date).astype(np.int64)) + 1
+
+    def histogram_edges(self, modes: Sequence[str] = HISTOGRAM_MODES, bins: int = DEFAULT_BINS) -> Dict[str, np.ndarray]:
+        low, high = (self.low, self.high) if self.rows else (0.0, 1.0)
+        edges = {"linear": linear_edges(low, high, bins), "log": log_edges(low, high, bins)}
+        return {mode: edges[mode] if mode in edges else edges_for(mode, self.sample, bins) for mode in modes}
+
+
+def profile(chunks: Iterable[pd.DataFrame]) -> SourceProfile:
+    result = SourceProfile()
+    for chunk in chunks:
+        result.update(chunk)
+    return result
+
+
+def aggregate_chunks(
+    chunks: ChunkSource,
+    distinct: Optional[str] = None,
+    distinct_error: Optional[float] = None,
+    histogram_modes: Sequence[str] = HISTOGRAM_MODES,
+    histogram_bins: int = DEFAULT_BINS,
+    workers: Optional[int] = None,
+    executor: Optional[str] = None,
+    max_pending: Optional[int] = None,
+) -> Cube:
+    """Cube of a source too large to load, built chunk by chunk.
+
+    ``chunks(columns)`` must yield the source in chunks (all columns when
+    ``columns`` is None) and may be called twice. A first pass over three
+    columns fixes the day range, the customer span and the histogram edges.
+    The second pass aggregates each chunk into a partial cube, on ``workers``
+    in parallel (see ``services.parallel``), and adds it into a running total
+    allocated once over that grid. Memory is ``max_pending`` chunks plus the
+    cube, whatever the source size. The result equals ``Cube.from_frame`` of
+    the whole source, except for the quantile edges, which are estimated from a
+    sample.
+    """
+    stats = profile(chunks(["date", "customer_id", "balance"]))
+    segments, products = list(schema.SEGMENTS), list(schema.PRODUCTS)
+    shape = (stats.num_days, len(segments), len(products))
+    customers = None
+    if stats.rows:
+        customers = empty_sketch(shape, stats.first_id, stats.last_id, mode=distinct, error=distinct_error)
+    edges = stats.histogram_edges(histogram_modes, histogram_bins)
+    start = stats.first_date if stats.rows else np.datetime64("1970-01-01", "D")
+    total = Cube.zeros(start, stats.num_days, segments, products, customers=customers, histogram_edges=edges)
+    return aggregate_frames(total, chunks(None), workers=workers, executor=executor, max_pending=max_pending)
@@ -0,0 +1,218 @@
+from __future__ import annotations
+
+import contextvars
+import json
+import os
+import threading
+import time
+from collections import defaultdict, deque
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Deque, Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+
+# Directory for the latency log (latency.jsonl) and Prometheus textfile (latency.prom); unset = no export
+TRACE_DIR = os.environ.get("DASHBOARD_TRACE_DIR")
+# Renders kept per page/stage for the percentiles, and how often they are exported
+TRACE_WINDOW = int(os.environ.get("DASHBOARD_TRACE_WINDOW", "500"))
+FLUSH_SECONDS = float(os.environ.get("DASHBOARD_TRACE_FLUSH_SECONDS", "30"))
+# The JSONL log rolls over to latency.jsonl.1 past this size
+MAX_LOG_BYTES = int(os.environ.get("DASHBOARD_TRACE_LOG_MB", "10")) * 1024 * 1024
+QUANTILES = (0.5, 0.95)
+
+
+class Span:
+    __slots__ = ("stage", "label", "start", "seconds")
+
+    def __init__(self, stage: str, label: str, start: float, seconds: float):
+        self.stage = stage
+        self.label = label
+        self.start = start
+        self.seconds = seconds
+
+
+class Trace:
+    """Timed stages of one page render, plus notes such as cache hit/miss states."""
+
+    def __init__(self, page: str):
+        self.page = page
+        self.started = time.perf_counter()
+        self.seconds = 0.0
+        self.spans: List[Span] = []
+        self.notes: Dict[str, str] = {}
+
+    def stages(self) -> Dict[str, float]:
+        """Seconds per stage, summed over its spans, in first-seen order."""
+        totals: Dict[str, float] = {}
+        for span in self.spans:
+            totals[span.stage] = totals.get(span.stage, 0.0) + span.seconds
+        return totals
+
+    def to_dict(self) -> Dict:
+        return {
+            "page": self.page,
+            "seconds": self.seconds,
+            "stages": self.stages(),
+            "spans": [{"stage": s.stage, "label": s.label, "seconds": s.seconds} for s in self.spans],
+            "notes": dict(self.notes),
+        }
+
+
+_current: contextvars.ContextVar[Optional[Trace]] = contextvars.ContextVar("dashboard_trace", default=None)
+_active = 0
+_active_lock = threading.Lock()
+_last_end = 0.0
+
+
+def current() -> Optional[Trace]:
+    return _current.get()
+
+
+@contextmanager
+def span(stage: str, label: str = "") -> Iterator[None]:
+    """Time the enclosed block as ``stage`` of the current render (no-op outside one)."""
+    trace = _current.get()
+    if trace is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        trace.spans.append(Span(stage, label, start - trace.started, time.perf_counter() - start))
+
+
+def note(key: str, value: str) -> None:
+    """Attach a fact to the current render, e.g. ``note("query_cache", "hit")``."""
+    trace = _current.get()
+    if trace is not None:
+        trace.notes[key] = value
+
+
+@contextmanager
+def trace(page: str, recorder: Optional["LatencyRecorder"] = None) -> Iterator[Trace]:
+    """Collect the spans of one render of ``page``; the finished trace goes to ``recorder``."""
+    global _active, _last_end
+    render = Trace(page)
+    token = _current.set(render)
+    with _active_lock:
+        _active += 1
+    try:
+        yield render
+    finally:
+        with _active_lock:
+            _active -= 1
+            _last_end = time.monotonic()
+        _current.reset(token)
+        render.seconds = time.perf_counter() - render.started
+        (recorder or RECORDER).record(render)
+
+
+def active_renders() -> int:
+    """Number of page renders in progress in this process."""
+    return _active
+
+
+def idle_seconds() -> float:
+    """Seconds since the last page render ended (0 while one is in progress)."""
+    with _active_lock:
+        return 0.0 if _active else time.monotonic() - _last_end
+
+
+class LatencyRecorder:
+    """Rolling per-page, per-stage latencies and their export for monitoring.
+
+    The last ``window`` durations of every (page, stage) pair, "total" included,
+    are kept in memory. At most every ``flush_seconds``, their p50/p95 are
+    appended to ``latency.jsonl`` (one line per pair; the file rolls over at
+    ``max_log_bytes``). ``latency.prom`` is rewritten as a Prometheus textfile
+    (node_exporter textfile collector format). With no ``directory`` nothing
+    is written.
+    """
+
+    def __init__(
+        self,
+        directory: Optional[str | Path] = TRACE_DIR,
+        window: int = TRACE_WINDOW,
+        flush_seconds: float = FLUSH_SECONDS,
+        max_log_bytes: int = MAX_LOG_BYTES,
+    ):
+        self.directory = None if directory is None else Path(directory)
+        self.window = window
+        self.flush_seconds = flush_seconds
+        self.max_log_bytes = max_log_bytes
+        self._samples: Dict[Tuple[str, str], Deque[float]] = defaultdict(lambda: deque(maxlen=self.window))
+        self._counts: Dict[Tuple[str, str], int] = defaultdict(int)
+        self._sums: Dict[Tuple[str, str], float] = defaultdict(float)
+        self._lock = threading.Lock()
+        self._last_flush = time.monotonic()
+        self.last: Optional[Trace] = None
+
+    def record(self, render: Trace) -> None:
+        with self._lock:
+            self.last = render
+            for stage, seconds in list(render.stages().items()) + [("total", render.seconds)]:
+                key = (render.page, stage)
+                self._samples[key].append(seconds)
+                self._counts[key] += 1
+                self._sums[key] += seconds
+            due = self.directory is not None and time.monotonic() - self._last_flush >= self.flush_seconds
+        if due:
+            self.flush()
+
+    def reset(self) -> None:
+        with self._lock:
+            self._samples.clear()
+            self._counts.clear()
+            self._sums.clear()
+            self.last = None
+
+    def summary(self) -> List[Dict]:
+        """p50/p95 over the window, plus lifetime count and sum, per (page, stage)."""
+        with self._lock:
+            rows = []
+            for (page, stage), samples in sorted(self._samples.items()):
+                values = np.fromiter(samples, dtype=np.float64)
+                row = {"page": page, "stage": stage, "window": len(values)}
+                row.update({f"p{round(q * 100)}": float(np.quantile(values, q)) for q in QUANTILES})
+                row.update(count=self._counts[(page, stage)], sum=self._sums[(page, stage)])
+                rows.append(row)
+            return rows
+
+    def flush(self) -> None:
+        if self.directory is None:
+            return
+        with self._lock:
+            self._last_flush = time.monotonic()
+        rows = self.summary()
+        self.directory.mkdir(parents=True, exist_ok=True)
+        log = self.directory / "latency.jsonl"
+        if log.exists() and log.stat().st_size > self.max_log_bytes:
+            os.replace(log, log.with_name(log.name + ".1"))
+        stamp = time.strftime("%Y-%m-%dT%H:%M:%S%z")
+        with open(log, "a", encoding="utf-8") as handle:
+            for row in rows:
+                handle.write(json.dumps({"time": stamp, **row}) + "\n")
+        prom = self.directory / "latency.prom"
+        tmp = prom.with_name(prom.name + ".tmp")
+        tmp.write_text(prometheus_text(rows), encoding="utf-8")
+        os.replace(tmp, prom)
+
+
+def prometheus_text(rows: List[Dict]) -> str:
+    lines = [
+        "# HELP dashboard_render_stage_seconds Page render time per stage (quantiles over the recent window).",
+        "# TYPE dashboard_render_stage_seconds summary",
+    ]
+    for row in rows:
+        labels = f'page="{row["page"]}",stage="{row["stage"]}"'
+        for q in QUANTILES:
+            lines.append(f'dashboard_render_stage_seconds{{{labels},quantile="{q}"}} {row[f"p{round(q * 100)}"]:.6f}')
+        lines.append(f"dashboard_render_stage_seconds_sum{{{labels}}} {row['sum']:.6f}")
+        lines.append(f"dashboard_render_stage_seconds_count{{{labels}}} {row['count']}")
+    return "\n".join(lines) + "\n"
+
+
+RECORDER = LatencyRecorder()
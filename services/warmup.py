@@ -0,0 +1,82 @@
+"""Preload the dataset and the default view before the first visitor arrives.
+
+Usage (from the repository root)::
+
+    python -m services.warmup                      # build the on-disk caches, print the timings
+    python -m services.warmup --serve [-- streamlit options]
+
+``--serve`` warms this process up, then starts the Streamlit server in it, so
+the first session finds the plotting libraries imported, the shared dataset
+loaded, and the default query (full date range, every segment and product)
+in the query cache. Without it, only what persists on disk (the columnar
+cache, see ``services.column_store``) benefits the server started afterwards.
+"""
+from __future__ import annotations
+
+import argparse
+import logging
+import sys
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Iterator, Optional, Sequence
+
+from services import query
+
+
+ROOT = Path(__file__).resolve().parents[1]
+
+logger = logging.getLogger(__name__)
+
+
+@contextmanager
+def _timed(timings: Dict[str, float], step: str) -> Iterator[None]:
+    start = time.perf_counter()
+    yield
+    timings[step] = time.perf_counter() - start
+
+
+def warmup(csv_path: Optional[str] = None, incoming_dir: Optional[str] = None) -> Dict[str, float]:
+    """Load what the first render needs into this process; returns seconds per step.
+
+    The default filters of ``render_filters`` normalize to the same query key
+    as ``{}``, so that result is the one cached here.
+    """
+    timings: Dict[str, float] = {}
+    with _timed(timings, "imports"):
+        import plotly.express  # noqa: F401
+        import plotly.graph_objects  # noqa: F401
+        from viz.charts import build_bar_by_segment, build_time_series
+        from viz.plotly_3d import build_mini_3d_scene
+    with _timed(timings, "dataset"):
+        query.load_dataset(csv_path, incoming_dir)
+    with _timed(timings, "query"):
+        result = query.run_query({}, csv_path, incoming_dir)
+    with _timed(timings, "figures"):
+        # First figures pay for Plotly's templates and validators
+        for build in (build_time_series, build_bar_by_segment, build_mini_3d_scene):
+            build(result.cube).to_json()
+    logger.info("Warm-up done: %s", ", ".join(f"{step} {seconds:.2f} s" for step, seconds in timings.items()))
+    return timings
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--serve", action="store_true", help="start the Streamlit server in this process afterwards")
+    args, streamlit_args = parser.parse_known_args(argv)
+    streamlit_args = [arg for arg in streamlit_args if arg != "--"]
+
+    logging.disable(logging.WARNING)  # Streamlit warns about caches used outside "streamlit run"
+    timings = warmup()
+    logging.disable(logging.NOTSET)
+    print("Warm-up: " + ", ".join(f"{step} {seconds:.2f} s" for step, seconds in timings.items()), flush=True)
+    if not args.serve:
+        return 0
+
+    from streamlit.web import cli
+
+    return cli.main(["run", str(ROOT / "app.py"), *streamlit_args], prog_name="streamlit")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
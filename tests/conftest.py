@@ -0,0 +1,9 @@
+import pytest
+
+from services import precompute
+
+
+@pytest.fixture(autouse=True)
+def no_background_precompute(monkeypatch):
+    """Keep the shared caches deterministic: tests run precompute passes themselves."""
+    monkeypatch.setattr(precompute, "ENABLED", False)
@@ -1,7 +1,8 @@
 from services.data_loader import load_sample_data
 
 
-def test_load_data_smoke():
+def test_load_data_smoke(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)  # the sample data is generated under the working directory
     df = load_sample_data()
     assert not df.empty
     for col in ["date", "customer_id", "segment", "product", "balance", "delinquent"]:
@@ -0,0 +1,41 @@
+from benchmarks import run
+
+
+def test_every_stage_is_measured(tmp_path):
+    results = run.run_size(20_000, tmp_path, repeat=1)
+    assert [entry["stage"] for entry in results] == list(run.STAGES)
+    assert all(entry["seconds"] > 0 and entry["peak_mb"] >= 0 for entry in results)
+    assert abs(results[0]["rows"] - 20_000) < 2_000
+
+
+def test_compare_flags_slower_stages_only():
+    baseline = [
+        {"size": "1M", "stage": "cube", "seconds": 0.10, "peak_mb": 50.0},
+        {"size": "1M", "stage": "kpis", "seconds": 0.0001, "peak_mb": 1.0},
+    ]
+    results = [
+        {"size": "1M", "stage": "cube", "seconds": 0.14, "peak_mb": 80.0},
+        {"size": "1M", "stage": "kpis", "seconds": 0.0004, "peak_mb": 1.0},  # too fast to judge
+    ]
+    assert len(run.compare(results, baseline, threshold=0.25)) == 1
+    assert run.compare(results, baseline, threshold=0.25, stage_thresholds={"cube": 0.5}) == []
+    assert len(run.compare(results, baseline, threshold=0.5, memory_threshold=0.2)) == 1
+
+
+def test_load_test_reports_every_session(tmp_path, monkeypatch):
+    from benchmarks import loadtest
+    from services import query
+
+    sample = tmp_path / "data" / "sample"
+    sample.mkdir(parents=True)
+    run.prepare(20_000, sample, name="transactions.csv")
+    monkeypatch.chdir(tmp_path)
+    query._shared_dataset.clear()
+
+    report = loadtest.load_test(sessions=2, steps=3, seed=1)
+    query._shared_dataset.clear()
+    assert report["errors"] == []
+    assert report["reruns"] == 2 * 4
+    assert report["latency"]["p50"] >= report["service"]["p50"] > 0
+    assert {row["page"] for row in report["stages"]} <= {"home", "overview", "portfolio", "risks", "story3d"}
+    assert report["memory"]["per_session_mb"]["count"] == 2
@@ -0,0 +1,47 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+from services import column_store
+from services.data_loader import generate_synthetic_data, read_sample_data
+from services.dataset import Dataset
+
+
+def test_round_trip_and_projection(tmp_path):
+    df = generate_synthetic_data(num_days=5, num_customers=100, end_date="2024-03-31")
+    cache_dir = column_store.write_columns(df, tmp_path / "transactions.columns")
+    back = column_store.read_columns(cache_dir)
+    pd.testing.assert_frame_equal(back, df, check_dtype=False)
+    assert back["date"].dtype == df["date"].dtype
+    projected = column_store.read_columns(cache_dir, columns=["balance", "segment"])
+    assert list(projected.columns) == ["balance", "segment"]
+
+
+def test_cache_is_stale_when_source_is_newer(tmp_path):
+    source = tmp_path / "transactions.csv"
+    source.write_text("date\n2024-01-01\n", encoding="utf-8")
+    cache_dir = column_store.cache_dir_for(source)
+    assert not column_store.is_fresh(cache_dir, source)
+    column_store.write_columns(pd.DataFrame({"x": [1]}), cache_dir)
+    assert column_store.is_fresh(cache_dir, source)
+    meta_mtime = (cache_dir / column_store.META_FILE).stat().st_mtime_ns
+    os.utime(source, ns=(meta_mtime + 10**9, meta_mtime + 10**9))
+    assert not column_store.is_fresh(cache_dir, source)
+
+
+def _is_mapped(values: np.ndarray) -> bool:
+    while values is not None and not isinstance(values, np.memmap):
+        values = values.base if isinstance(values.base, np.ndarray) else None
+    return values is not None
+
+
+def test_shared_dataset_is_a_read_only_view_of_the_cache(tmp_path):
+    source = tmp_path / "transactions.csv"
+    generate_synthetic_data(num_days=5, num_customers=100, end_date="2024-03-31").to_csv(source, index=False)
+    parsed = read_sample_data(str(source), mmap=False)  # parses the CSV and writes the cache
+    frame = Dataset.load(str(source)).index.frame
+    pd.testing.assert_frame_equal(frame, parsed)
+    for column in ("date", "customer_id", "balance", "delinquent"):
+        values = frame[column].to_numpy()
+        assert _is_mapped(values) and not values.flags.writeable
@@ -0,0 +1,116 @@
+import importlib.util
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from services.cube import Cube
+from services.data_loader import generate_synthetic_data
+from services.filter_engine import FilterIndex
+from viz.charts import build_bar_by_segment, build_rolling_balance, build_time_series
+from viz.plotly_3d import build_mini_3d_scene
+
+ROOT = Path(__file__).resolve().parents[1]
+
+
+def _load_page(name):
+    spec = importlib.util.spec_from_file_location(name.replace(".py", ""), ROOT / "pages" / name)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+FILTERS = [
+    {"start_date": None, "end_date": None, "segments": [], "products": []},
+    {"start_date": pd.Timestamp("2024-03-10"), "end_date": pd.Timestamp("2024-03-20"), "segments": ["SME", "Retail"], "products": ["Loan", "Savings"]},
+    {"start_date": pd.Timestamp("2024-03-15"), "end_date": pd.Timestamp("2024-03-15"), "segments": ["Corporate"], "products": []},
+]
+
+
+@pytest.fixture(scope="module")
+def index():
+    return FilterIndex(generate_synthetic_data(num_days=30, num_customers=300, end_date="2024-03-31"))
+
+
+def _assert_same_traces(left, right):
+    assert len(left.data) == len(right.data)
+    for a, b in zip(left.data, right.data):
+        for axis in ("x", "y", "z"):
+            va, vb = getattr(a, axis, None), getattr(b, axis, None)
+            if va is None or vb is None:
+                assert va is None and vb is None
+                continue
+            va, vb = np.asarray(va), np.asarray(vb)
+            if va.dtype.kind in "fiu":
+                np.testing.assert_allclose(va, vb.astype(float), rtol=1e-5)
+            else:
+                assert [str(v) for v in va.ravel()] == [str(v) for v in vb.ravel()]
+
+
+@pytest.mark.parametrize("filters", FILTERS)
+def test_cube_charts_match_raw_rows(index, filters):
+    frame = index.select(filters)
+    cube = Cube.from_frame(index.frame).select(filters)
+    portfolio = _load_page("2_Portfolio.py")
+    risks = _load_page("3_Risks.py")
+    builders = [
+        build_time_series,
+        build_bar_by_segment,
+        build_rolling_balance,
+        portfolio.build_bar_by_product,
+        portfolio.build_heatmap_segment_product,
+        risks.build_delinquency_timeseries,
+        risks.build_delinquency_by_segment,
+        risks.build_rolling_delinquency,
+    ]
+    for build in builders:
+        _assert_same_traces(build(frame), build(cube))
+    for metric in ("sum_balance", "avg_balance", "accounts", "delinquency_rate"):
+        _assert_same_traces(build_mini_3d_scene(frame, metric=metric), build_mini_3d_scene(cube, metric=metric))
+
+
+def test_cube_totals_match_raw_rows(index):
+    filters = FILTERS[1]
+    frame = index.select(filters)
+    totals = Cube.from_frame(index.frame).select(filters).totals()
+    assert totals["count"] == len(frame)
+    assert totals["delinquent"] == int(frame["delinquent"].sum())
+    assert totals["balance"] == pytest.approx(float(frame["balance"].astype(float).sum()))
+
+
+def test_3d_scene_is_one_mesh_for_many_bars():
+    cells = 40 * 50
+    frame = pd.DataFrame(
+        {
+            "segment": np.repeat([f"S{i}" for i in range(40)], 50),
+            "product": np.tile([f"P{j}" for j in range(50)], 40),
+            "balance": np.arange(cells, dtype=float),
+            "delinquent": 0,
+        }
+    )
+    fig = build_mini_3d_scene(frame)
+    assert len(fig.data) == 1
+    mesh = fig.data[0]
+    assert len(mesh.x) == 8 * cells and len(mesh.i) == 12 * cells
+    assert max(mesh.z) == cells - 1
+    assert tuple(mesh.customdata[8 * 51])[:2] == ("S1", "P1")
+
+
+@pytest.mark.parametrize("mode", ["linear", "log", "quantile"])
+def test_cube_histogram_matches_binned_rows(index, mode):
+    cube = Cube.from_frame(index.frame)
+    for filters in FILTERS:
+        edges, counts = cube.select(filters).histogram(mode)
+        values = index.select(filters)["balance"].to_numpy()
+        expected = np.histogram(np.clip(values, edges[0], edges[-1]), bins=edges)[0]
+        np.testing.assert_array_equal(counts, expected)
+        assert counts.sum() == len(values)
+    assert np.all(np.diff(edges) > 0)
+
+
+def test_distribution_ships_bins_not_rows(index):
+    risks = _load_page("3_Risks.py")
+    fig = risks.build_distribution_balance(Cube.from_frame(index.frame), mode="log")
+    assert len(fig.data) == 1 and fig.data[0].type == "bar"
+    assert len(fig.data[0].x) == 50
@@ -0,0 +1,26 @@
+import pandas as pd
+
+from services.data_loader import generate_synthetic_data, iter_synthetic_chunks
+
+
+def test_synthetic_data_is_deterministic_and_chunk_independent():
+    full = generate_synthetic_data(num_days=20, num_customers=300, seed=7, end_date="2024-03-31")
+    again = generate_synthetic_data(num_days=20, num_customers=300, seed=7, end_date="2024-03-31")
+    chunks = list(iter_synthetic_chunks(num_days=20, num_customers=300, seed=7, end_date="2024-03-31", chunk_rows=500))
+    assert len(chunks) > 1
+    pd.testing.assert_frame_equal(full, again)
+    pd.testing.assert_frame_equal(full, pd.concat(chunks, ignore_index=True))
+    assert full["date"].nunique() == 20
+    assert full["balance"].min() >= -20000
+
+
+def test_synthetic_data_respects_mixes():
+    df = generate_synthetic_data(
+        num_days=5,
+        num_customers=200,
+        segment_mix={"Retail": 1.0},
+        product_mix={"Loan": 1.0},
+        end_date="2024-03-31",
+    )
+    assert set(df["segment"]) == {"Retail"}
+    assert set(df["product"]) == {"Loan"}
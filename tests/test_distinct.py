@@ -0,0 +1,38 @@
+import pandas as pd
+import pytest
+
+from services.cube import Cube
+from services.data_loader import generate_synthetic_data
+from services.distinct import HyperLogLogSketch
+from services.filter_engine import FilterIndex
+
+FILTERS = [
+    {"start_date": None, "end_date": None, "segments": [], "products": []},
+    {"start_date": pd.Timestamp("2024-03-10"), "end_date": pd.Timestamp("2024-03-12"), "segments": ["SME"], "products": ["Loan", "Current"]},
+    {"start_date": pd.Timestamp("2025-01-01"), "end_date": pd.Timestamp("2025-01-02"), "segments": [], "products": []},
+]
+
+
+@pytest.fixture(scope="module")
+def index():
+    return FilterIndex(generate_synthetic_data(num_days=30, num_customers=5000, end_date="2024-03-31"))
+
+
+@pytest.mark.parametrize("filters", FILTERS)
+def test_bitmaps_are_exact(index, filters):
+    cube = Cube.from_frame(index.frame, distinct="bitmap").select(filters)
+    assert cube.distinct_customers() == index.select(filters)["customer_id"].nunique()
+
+
+@pytest.mark.parametrize("filters", FILTERS)
+def test_hyperloglog_within_error_bound(index, filters):
+    cube = Cube.from_frame(index.frame, distinct="hll", distinct_error=0.02).select(filters)
+    expected = index.select(filters)["customer_id"].nunique()
+    assert cube.customers.error <= 0.02
+    assert cube.distinct_customers() == pytest.approx(expected, rel=3 * 0.02, abs=1)
+
+
+def test_precision_for_error():
+    assert HyperLogLogSketch.precision_for(0.02) == 12
+    with pytest.raises(ValueError):
+        HyperLogLogSketch.precision_for(0)
@@ -0,0 +1,50 @@
+import numpy as np
+import pandas as pd
+
+from viz.charts import build_time_series, rolling_series
+from viz.downsample import downsample_frame, lttb, minmax
+
+
+def _series(n=10_000, freq="h"):
+    x = pd.date_range("2020-01-01", periods=n, freq=freq).to_numpy()
+    y = np.sin(np.linspace(0, 20, n))
+    y[1234] = 5.0  # spike
+    return x, y
+
+
+def test_lttb_keeps_ends_budget_and_spike():
+    x, y = _series()
+    kept = lttb(x, y, 500)
+    assert len(kept) == 500
+    assert kept[0] == 0 and kept[-1] == len(x) - 1
+    assert np.all(np.diff(kept) > 0)
+    assert 1234 in kept
+
+
+def test_minmax_keeps_extremes():
+    x, y = _series()
+    kept = minmax(x, y, 200)
+    assert len(kept) <= 200
+    assert int(np.argmax(y)) in kept and int(np.argmin(y)) in kept
+
+
+def test_time_series_is_downsampled_to_chart_width():
+    x, y = _series(5_000, freq="D")
+    frame = pd.DataFrame({"date": x, "balance": y})
+    small, note = downsample_frame(frame, "date", "balance", width_px=10_000)
+    assert note is None and small is frame
+
+    df = pd.DataFrame({"date": x, "segment": "Retail", "balance": y})
+    fig = build_time_series(df, width_px=400)
+    assert len(fig.data[0].x) == 400
+    assert "downsampled" in fig.layout.title.text
+    assert len(build_time_series(df).data[0].x) == 5_000
+
+
+def test_rolling_note_names_every_reduced_window():
+    x, y = _series(2_000, freq="D")
+    df = pd.DataFrame({"date": x, "balance": y + 10, "delinquent": 0})
+    rolling, note = rolling_series(df, "balance", windows=(7, 30), width_px=400)
+    assert rolling.groupby("window").size().to_dict() == {"7 days": 400, "30 days": 400}
+    assert note == "7 days, 30 days: downsampled (LTTB): 400 of 2,000 points"
+    assert rolling_series(df, "balance", windows=(7, 30))[1] is None
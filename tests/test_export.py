@@ -0,0 +1,73 @@
+import gzip
+import io
+
+import pandas as pd
+import pytest
+
+from services import export
+from services.data_loader import generate_synthetic_data
+from services.dataset import Dataset
+
+
+FILTERS = {"start_date": pd.Timestamp("2024-02-05"), "end_date": pd.Timestamp("2024-03-10"), "segments": ["Retail", "SME"], "products": []}
+
+
+@pytest.fixture(scope="module")
+def csv_path(tmp_path_factory):
+    path = tmp_path_factory.mktemp("export") / "transactions.csv"
+    generate_synthetic_data(num_days=60, num_customers=120, end_date="2024-03-31").to_csv(path, index=False)
+    return str(path)
+
+
+def _sorted(frame):
+    return frame.sort_values(["date", "customer_id"], kind="stable").reset_index(drop=True)
+
+
+def test_chunked_export_round_trips(csv_path):
+    dataset = Dataset.load(csv_path, streaming=False)
+    expected = dataset.rows.select(FILTERS)
+    chunks = list(export.iter_selection(dataset, FILTERS, chunk_rows=500))
+    assert len(chunks) > 1 and all(0 < len(chunk) <= 500 for chunk in chunks)
+
+    target = io.BytesIO()
+    assert export.export(dataset, FILTERS, target, "csv", compression="gzip", chunk_rows=500) == len(expected)
+    got = pd.read_csv(io.BytesIO(gzip.decompress(target.getvalue())), parse_dates=["date"])
+    assert len(got) == len(expected)
+    assert got["balance"].sum() == pytest.approx(float(expected["balance"].sum()), rel=1e-6)
+    assert (got["date"].to_numpy() == expected["date"].to_numpy()).all()
+
+    pytest.importorskip("pyarrow")
+    target = io.BytesIO()
+    export.export(dataset, FILTERS, target, "parquet", columns=["date", "balance"], compression="zstd", chunk_rows=500)
+    got = pd.read_parquet(io.BytesIO(target.getvalue()))
+    assert list(got.columns) == ["date", "balance"]
+    pd.testing.assert_frame_equal(got, expected[["date", "balance"]].reset_index(drop=True), check_dtype=False)
+
+
+def test_streaming_export_matches_in_memory(csv_path):
+    in_memory = Dataset.load(csv_path, streaming=False)
+    streamed = Dataset.load(csv_path, streaming=True)
+    assert streamed.rows is None
+    expected = _sorted(in_memory.rows.select(FILTERS))
+    got = _sorted(pd.concat(export.iter_selection(streamed, FILTERS, chunk_rows=700), ignore_index=True))
+    pd.testing.assert_frame_equal(got, expected, check_categorical=False)
+
+    target = io.BytesIO()
+    assert export.export(streamed, {**FILTERS, "segments": ["Nobody"]}, target, "csv", compression=None) == 0
+    assert target.getvalue().decode().strip() == ",".join(export.COLUMNS)
+    with pytest.raises(RuntimeError):
+        list(export.iter_selection(streamed, {**FILTERS, "mode": "snapshot"}))
+    assert export.file_name("transactions", "csv", "xz") == "transactions.csv.xz"
+
+
+def test_download_size_is_capped(csv_path):
+    dataset = Dataset.load(csv_path, streaming=False)
+    full = export.export_bytes(dataset, {}, compression=None, chunk_rows=500)
+    assert export.export_bytes(dataset, {}, max_bytes=len(full), compression=None, chunk_rows=500) == full
+    with pytest.raises(RuntimeError, match="limit"):
+        export.export_bytes(dataset, {}, max_bytes=len(full) // 4, compression=None, chunk_rows=500)
+    # The cap stops the export early instead of writing the whole selection first
+    target = io.BytesIO()
+    with pytest.raises(RuntimeError):
+        export.export(dataset, {}, target, compression=None, chunk_rows=500, max_bytes=len(full) // 4)
+    assert len(target.getvalue()) < len(full) // 2
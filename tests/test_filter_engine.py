@@ -0,0 +1,50 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from services.data_loader import generate_synthetic_data
+from services.filter_engine import FilterIndex
+
+
+def _mask_filter(df, filters):
+    mask = (df["date"] >= pd.to_datetime(filters["start_date"])) & (df["date"] <= pd.to_datetime(filters["end_date"]))
+    if filters["segments"]:
+        mask &= df["segment"].isin(filters["segments"])
+    if filters["products"]:
+        mask &= df["product"].isin(filters["products"])
+    return df.loc[mask]
+
+
+@pytest.fixture(scope="module")
+def frame():
+    df = generate_synthetic_data(num_days=30, num_customers=200, end_date="2024-03-31")
+    # shuffled input: the index must sort it by date itself
+    return df.sample(frac=1.0, random_state=0)
+
+
+@pytest.mark.parametrize(
+    "filters",
+    [
+        {"start_date": "2024-03-01", "end_date": "2024-03-31", "segments": [], "products": []},
+        {"start_date": "2024-03-05", "end_date": "2024-03-05", "segments": ["SME"], "products": []},
+        {"start_date": "2024-03-10", "end_date": "2024-03-20", "segments": ["Retail", "SME"], "products": ["Loan"]},
+        {"start_date": "2024-03-10", "end_date": "2024-03-20", "segments": ["Unknown"], "products": []},
+        {"start_date": "2025-01-01", "end_date": "2025-01-31", "segments": [], "products": []},
+    ],
+)
+def test_select_matches_boolean_mask(frame, filters):
+    filters = dict(filters, start_date=pd.Timestamp(filters["start_date"]), end_date=pd.Timestamp(filters["end_date"]))
+    index = FilterIndex(frame)
+    got = index.select(filters)
+    expected = _mask_filter(frame, filters).sort_values(["date", "customer_id"])
+    pd.testing.assert_frame_equal(
+        got.sort_values(["date", "customer_id"]).reset_index(drop=True),
+        expected.reset_index(drop=True),
+    )
+
+
+def test_date_only_selection_is_a_view(frame):
+    index = FilterIndex(frame)
+    rows = index.positions({"start_date": pd.Timestamp("2024-03-10"), "end_date": pd.Timestamp("2024-03-12"), "segments": [], "products": []})
+    assert isinstance(rows, slice)
+    assert np.shares_memory(index.frame["balance"].to_numpy(), index.frame.iloc[rows]["balance"].to_numpy())
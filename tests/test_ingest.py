@@ -0,0 +1,96 @@
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from services import query
+from services.cube import Cube
+from services.data_loader import generate_synthetic_data
+from services.dataset import Dataset
+from services.filter_engine import FilterIndex
+
+
+@pytest.fixture(scope="module")
+def data():
+    return generate_synthetic_data(num_days=30, num_customers=300, end_date="2024-03-31")
+
+
+def _split(df, day):
+    cut = df["date"] < pd.Timestamp(day)
+    return df[cut].reset_index(drop=True), df[~cut].reset_index(drop=True)
+
+
+def test_merged_cube_matches_cube_of_all_rows(data):
+    old, new = _split(data, "2024-03-20")
+    full = Cube.from_frame(data, distinct="bitmap")
+    base = Cube.from_frame(old, distinct="bitmap")
+    merged = base.merge(base.aggregate_like(new))
+
+    assert list(merged.dates) == list(full.dates)
+    for name in ("balance", "count", "delinquent"):
+        np.testing.assert_allclose(merged.pivot(name).to_numpy(), full.pivot(name).to_numpy())
+    assert merged.distinct_customers() == data["customer_id"].nunique()
+    edges, counts = merged.histogram("linear")
+    np.testing.assert_array_equal(edges, base.histogram("linear")[0])
+    assert counts.sum() == len(data)
+
+
+def test_append_keeps_index_equivalent_to_rebuild(data):
+    old, new = _split(data, "2024-03-20")
+    # One extra segment only present in the new rows
+    new = new.assign(segment=new["segment"].cat.add_categories(["Private"]))
+    new.loc[new.index[:5], "segment"] = "Private"
+    appended = FilterIndex(old).append(new)
+    rebuilt = FilterIndex(pd.concat([old, new.astype({"segment": "object"})], ignore_index=True))
+
+    filters = {"start_date": pd.Timestamp("2024-03-10"), "end_date": None, "segments": ["Private", "SME"], "products": ["Loan"]}
+    assert appended.select(filters)["balance"].sum() == pytest.approx(rebuilt.select(filters)["balance"].sum())
+    assert len(appended.select(filters)) == len(rebuilt.select(filters))
+    # Rows older than the index are re-sorted in
+    older = FilterIndex(new).append(old)
+    assert (np.diff(older.frame["date"].to_numpy().astype(np.int64)) >= 0).all()
+
+
+def test_dataset_ingests_only_new_files(tmp_path, data):
+    old, new = _split(data, "2024-03-20")
+    csv_path = tmp_path / "transactions.csv"
+    old.to_csv(csv_path, index=False)
+    incoming = tmp_path / "incoming"
+    incoming.mkdir()
+    query.clear_cache()
+
+    dataset = Dataset.load(str(csv_path), incoming_dir=incoming)
+    first = query.run_query({}, str(csv_path), str(incoming))
+    assert dataset.version == 0 and first.cube.totals()["count"] == len(old)
+
+    for day, rows in new.groupby(new["date"].dt.date):
+        rows.to_csv(incoming / f"{day}.csv", index=False)
+    assert dataset.refresh(force=True)
+    assert len(dataset.incoming) == new["date"].nunique()
+    assert dataset.cube.totals()["count"] == len(data)
+    assert len(dataset.frame) == len(data)
+    assert not dataset.refresh(force=True)
+
+    # Rewriting an ingested file reloads everything instead of double counting
+    last = sorted(incoming.glob("*.csv"))[-1]
+    pd.read_csv(last).head(10).to_csv(last, index=False)
+    os.utime(last, ns=(0, 0))
+    assert dataset.refresh(force=True)
+    assert dataset.cube.totals()["count"] == len(data) - (new["date"] == new["date"].max()).sum() + 10
+
+
+def test_query_cache_key_follows_dataset_version(tmp_path, data):
+    old, new = _split(data, "2024-03-25")
+    csv_path, incoming = tmp_path / "transactions.csv", tmp_path / "incoming"
+    old.to_csv(csv_path, index=False)
+    incoming.mkdir()
+    query.clear_cache()
+
+    before = query.run_query({}, str(csv_path), str(incoming))
+    dataset = query.load_dataset(str(csv_path), str(incoming))
+    new.to_csv(incoming / "late.csv", index=False)
+    dataset.refresh(force=True)
+    after = query.run_query({}, str(csv_path), str(incoming))
+    assert after is not before and after.version == before.version + 1
+    assert after.cube.totals()["count"] == len(data)
@@ -0,0 +1,50 @@
+import numpy as np
+import pytest
+
+from services import parallel
+from services.cube import Cube
+from services.data_loader import generate_synthetic_data, iter_transaction_chunks
+from services.streaming import aggregate_chunks
+
+
+@pytest.fixture(scope="module")
+def data():
+    return generate_synthetic_data(num_days=60, num_customers=400, end_date="2024-03-31")
+
+
+def _assert_same(cube, expected):
+    assert list(cube.dates) == list(expected.dates)
+    assert (cube.segments, cube.products) == (expected.segments, expected.products)
+    for name, values in expected.measures.items():
+        np.testing.assert_allclose(cube.measures[name], values, rtol=1e-9)
+    for mode, histogram in expected.histograms.items():
+        np.testing.assert_array_equal(cube.histograms[mode].edges, histogram.edges)
+        np.testing.assert_array_equal(cube.histograms[mode].counts, histogram.counts)
+    assert cube.distinct_customers() == expected.distinct_customers()
+
+
+@pytest.mark.parametrize("executor", ["thread", "process"])
+@pytest.mark.parametrize("distinct", ["bitmap", "hll"])
+def test_parallel_cube_matches_serial(data, executor, distinct):
+    serial = Cube.from_frame(data, distinct=distinct)
+    cube = parallel.build_cube(data, workers=3, executor=executor, min_rows_per_task=1000, distinct=distinct)
+    _assert_same(cube, serial)
+
+
+def test_falls_back_to_serial_when_no_pool(data, monkeypatch):
+    def unavailable(workers, kind):
+        raise OSError("no semaphores")
+
+    monkeypatch.setattr(parallel, "_make_executor", unavailable)
+    assert list(parallel.map_unordered(abs, [-1, -2], workers=4)) == [1, 2]
+    _assert_same(parallel.build_cube(data, workers=4, min_rows_per_task=1000), Cube.from_frame(data))
+
+
+def test_parallel_streaming_matches_serial(tmp_path, data):
+    path = tmp_path / "transactions.csv"
+    data.to_csv(path, index=False)
+
+    def chunks(columns):
+        return iter_transaction_chunks(str(path), chunk_rows=2000, columns=columns)
+
+    _assert_same(aggregate_chunks(chunks, workers=3, max_pending=2), aggregate_chunks(chunks, workers=1))
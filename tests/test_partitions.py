@@ -0,0 +1,61 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from services import column_store, partitions, query
+from services.data_loader import generate_synthetic_data, iter_transaction_chunks
+from services.dataset import Dataset
+from services.filter_engine import FilterIndex
+
+
+@pytest.fixture(scope="module")
+def source(tmp_path_factory):
+    df = generate_synthetic_data(num_days=90, num_customers=200, end_date="2024-03-31")
+    path = tmp_path_factory.mktemp("parts") / "transactions.csv"
+    df.to_csv(path, index=False)
+    manifest = partitions.write_partitions(iter_transaction_chunks(str(path), chunk_rows=5000), partitions.parts_dir_for(path))
+    return str(path), df, manifest
+
+
+def test_manifest_zone_maps(source):
+    _, df, manifest = source
+    assert manifest.rows == len(df)
+    assert sorted({p.key for p in manifest.partitions}) == ["2024-01", "2024-02", "2024-03"]
+    loaded = partitions.Manifest.load(manifest.root)
+    march = [p for p in loaded.partitions if p.key == "2024-03"]
+    rows = df[df["date"] >= "2024-03-01"]
+    assert sum(p.rows for p in march) == len(rows)
+    assert min(p.min_balance for p in march) == pytest.approx(float(rows["balance"].min()))
+    domain = loaded.domain()
+    assert (domain.min_date, domain.max_date) == (df["date"].min(), df["date"].max())
+    assert domain.segments == sorted(df["segment"].unique().tolist())
+
+
+def test_pruning_opens_only_matching_partitions(source, monkeypatch):
+    _, df, manifest = source
+    filters = {"start_date": pd.Timestamp("2024-02-10"), "end_date": pd.Timestamp("2024-02-20"), "segments": ["SME"], "products": []}
+    assert {p.key for p in manifest.prune(filters)} == {"2024-02"}
+    assert manifest.prune({"segments": ["Private"]}) == []
+
+    opened = []
+    read_columns = column_store.read_columns
+    monkeypatch.setattr(column_store, "read_columns", lambda path, **kw: opened.append(path) or read_columns(path, **kw))
+    selected = manifest.select(filters)
+    assert opened and all("2024-02" in str(path) for path in opened)
+
+    expected = FilterIndex(df).select(filters)
+    assert len(selected) == len(expected)
+    assert selected["balance"].sum() == pytest.approx(expected["balance"].sum())
+
+
+def test_dataset_on_partitions(source):
+    path, df, _ = source
+    query.clear_cache()
+    dataset = Dataset.load(path)
+    assert dataset.streaming and isinstance(dataset.rows, partitions.PartitionedRows)
+    assert dataset.domain.max_date == df["date"].max()
+
+    result = query.run_query({"start_date": pd.Timestamp("2024-03-15"), "segments": ["Retail"]}, path)
+    rows = result.rows()
+    assert len(rows) == result.cube.totals()["count"]
+    np.testing.assert_allclose(result.cube.totals()["balance"], rows["balance"].astype(np.float64).sum())
@@ -0,0 +1,49 @@
+import pandas as pd
+import pytest
+
+from services import precompute, query
+from services.data_loader import generate_synthetic_data
+from services.dataset import Dataset
+from viz.charts import build_bar_by_segment, build_time_series
+
+
+@pytest.fixture()
+def dataset(tmp_path, monkeypatch):
+    monkeypatch.setattr(query, "_recipes", {})  # charts rendered by other tests
+    path = tmp_path / "transactions.csv"
+    generate_synthetic_data(num_days=120, num_customers=50, end_date="2024-04-30").to_csv(path, index=False)
+    query.clear_cache()
+    yield Dataset.load(str(path), streaming=False)
+    query.clear_cache()
+
+
+def test_presets(dataset):
+    domain = dataset.domain
+    (last_30,) = precompute.preset_filters("last_30_days", domain)
+    assert last_30["start_date"] == pd.Timestamp("2024-04-01") and last_30["end_date"] == domain.max_date
+    assert [f["segments"] for f in precompute.preset_filters("segments", domain)] == [[s] for s in domain.segments]
+    with pytest.raises(ValueError):
+        precompute.preset_filters("yesterday", domain)
+
+
+def test_pass_fills_the_caches_within_budget(dataset):
+    query.figure(query.lookup(dataset, {}), build_bar_by_segment)  # a page rendered this chart once
+    worker = precompute.Precomputer(presets=["all", "last_30_days", "segments"], top_queries=0)
+    done = worker.run(dataset, wait_idle=False)
+    assert done["results"] == 1 + len(dataset.domain.segments) and done["figures"] == done["results"]
+
+    misses = query.cache_stats()["misses"]
+    result = query.lookup(dataset, {"segments": [dataset.domain.segments[0]]})
+    assert query.cache_stats()["misses"] == misses
+    assert query.has_figure(result, build_bar_by_segment)
+    assert worker.run(dataset, wait_idle=False)["bytes"] == 0  # nothing left to add
+
+    query.clear_cache()
+    assert precompute.Precomputer(presets=["segments"], top_queries=0, budget_bytes=1).run(dataset, wait_idle=False)["results"] == 1
+
+
+def test_figures_are_sized_without_serializing(dataset, monkeypatch):
+    fig = build_time_series(query.lookup(dataset, {}).cube)
+    size = len(fig.to_json())
+    monkeypatch.setattr(type(fig), "to_json", lambda self, *args, **kwargs: pytest.fail("serialized to be sized"))
+    assert 0.5 * size < query.figure_nbytes(fig) < 2 * size
@@ -0,0 +1,45 @@
+import numpy as np
+import pytest
+
+from services.cube import Cube
+from services.data_loader import generate_synthetic_data
+from services.prefix import rolling_from_daily
+
+
+@pytest.fixture(scope="module")
+def cube():
+    frame = generate_synthetic_data(num_days=120, num_customers=200, end_date="2024-04-30")
+    frame = frame[frame["date"].dt.dayofweek < 5]  # gaps: weekends have no rows
+    return Cube.from_frame(frame)
+
+
+def test_prefix_totals_match_a_scan(cube):
+    rng = np.random.default_rng(3)
+    dates = cube.dates
+    for _ in range(50):
+        lo, hi = sorted(rng.integers(0, len(dates), size=2))
+        filters = {
+            "start_date": dates[lo],
+            "end_date": dates[hi],
+            "segments": list(rng.choice(cube.segments, size=rng.integers(0, len(cube.segments) + 1), replace=False)),
+            "products": list(rng.choice(cube.products, size=rng.integers(0, len(cube.products) + 1), replace=False)),
+        }
+        expected = cube.select(filters).totals()
+        totals = cube.prefix_sums().totals(filters)
+        assert totals["count"] == expected["count"] and totals["delinquent"] == expected["delinquent"]
+        assert totals["balance"] == pytest.approx(expected["balance"])
+    assert cube.prefix_sums() is cube.prefix_sums()
+
+
+def test_rolling_windows_match_pandas_rolling(cube):
+    daily = cube.daily()
+    rolling = rolling_from_daily(daily, windows=(7, 30))
+    for window in (7, 30):
+        expected = daily.rolling(f"{window}D", on="date").sum()
+        got = rolling[rolling["window"] == f"{window} days"].set_index("date").reindex(daily["date"])
+        np.testing.assert_allclose(
+            got["balance"].to_numpy(), daily.rolling(f"{window}D", on="date")["balance"].mean().to_numpy()
+        )
+        np.testing.assert_allclose(got["delinquency_rate"].to_numpy(), (expected["delinquent"] / expected["count"] * 100.0).to_numpy())
+    # Weekend days are covered by the windows too
+    assert len(rolling[rolling["window"] == "7 days"]) == cube.num_days
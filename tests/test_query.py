@@ -0,0 +1,44 @@
+import pandas as pd
+import pytest
+
+from services import query
+from services.data_loader import generate_synthetic_data
+
+
+@pytest.fixture(scope="module")
+def csv_path(tmp_path_factory):
+    path = tmp_path_factory.mktemp("data") / "transactions.csv"
+    generate_synthetic_data(num_days=20, num_customers=200, end_date="2024-03-31").to_csv(path, index=False)
+    return str(path)
+
+
+def test_equivalent_filters_share_one_cache_entry(csv_path):
+    query.clear_cache()
+    dataset = query.load_dataset(csv_path)
+    first, last = dataset.frame["date"].min(), dataset.frame["date"].max()
+    all_segments = sorted(dataset.cube.segments)
+    before = query.cache_stats()
+
+    a = query.run_query({"start_date": first, "end_date": last, "segments": all_segments, "products": []}, csv_path)
+    b = query.run_query({"start_date": first - pd.Timedelta(days=3), "end_date": None, "segments": [], "products": []}, csv_path)
+    c = query.run_query({"start_date": first, "end_date": last, "segments": ["SME", "Retail"], "products": []}, csv_path)
+    d = query.run_query({"start_date": first, "end_date": last, "segments": ["Retail", "SME", "SME"], "products": []}, csv_path)
+
+    assert a is b and c is d and a is not c
+    stats = query.cache_stats()
+    assert stats["hits"] - before["hits"] == 2
+    assert stats["misses"] - before["misses"] == 2
+    assert a.kpis[0]["value"] == dataset.frame["customer_id"].nunique()
+    assert len(c.rows()) == c.cube.totals()["count"]
+
+
+def test_lru_evicts_by_size():
+    from services.result_cache import LRUCache
+
+    cache = LRUCache(max_entries=10, max_bytes=100, sizeof=len)
+    cache.put("a", "x" * 60)
+    cache.put("b", "x" * 30)
+    cache.get("a")
+    cache.put("c", "x" * 30)  # over budget: "b" is the least recently used
+    assert "b" not in cache and "a" in cache and "c" in cache
+    assert cache.stats()["evictions"] == 1
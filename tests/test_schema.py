@@ -0,0 +1,39 @@
+import pandas as pd
+
+from services import schema
+from services.data_loader import generate_synthetic_data
+
+
+def test_enforce_schema_casts_to_compact_dtypes():
+    raw = pd.DataFrame(
+        {
+            "date": ["2024-01-01 13:45", "2024-01-02 00:00"],
+            "customer_id": [100000, 100001],
+            "segment": ["SME", "Private"],
+            "product": ["Loan", "Current"],
+            "balance": [-12000.5, 1500.25],
+            "delinquent": [1, 0],
+        }
+    )
+    df = schema.enforce_schema(raw)
+    assert df["date"].dtype == schema.DATE_DTYPE
+    assert df["date"].iloc[0] == pd.Timestamp("2024-01-01")
+    assert df["customer_id"].dtype == schema.CUSTOMER_ID_DTYPE
+    assert df["balance"].dtype == schema.BALANCE_DTYPE
+    assert df["delinquent"].dtype == schema.DELINQUENT_DTYPE
+    # fixed dictionary first, unknown values appended
+    assert df["segment"].cat.categories.tolist() == schema.SEGMENTS + ["Private"]
+    assert schema.enforce_schema(df) is df
+
+
+def test_recode_merges_categories():
+    series = pd.Series(["Epargne", "Épargne", "Courant", None], dtype="category")
+    out = schema.recode(series, {"Epargne": "Savings", "Épargne": "Savings", "Courant": "Current"})
+    assert out.tolist()[:3] == ["Savings", "Savings", "Current"]
+    assert pd.isna(out.iloc[3])
+
+
+def test_compact_schema_uses_less_memory():
+    df = generate_synthetic_data(num_days=10, num_customers=300, end_date="2024-03-31")
+    wide = df.astype({"segment": object, "product": object, "customer_id": "int64", "balance": "float64"})
+    assert schema.memory_report(df).loc["total", "bytes"] * 3 < schema.memory_report(wide).loc["total", "bytes"]
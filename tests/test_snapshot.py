@@ -0,0 +1,56 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from services import query
+from services.data_loader import generate_synthetic_data
+from services.snapshot import AsOfIndex
+
+
+def _latest_by_groupby(frame, filters):
+    """Reference: last row per customer at or before the end date, then the other filters."""
+    rows = frame[frame["date"] <= filters["end_date"]].sort_values(["customer_id", "date"], kind="stable")
+    latest = rows.groupby("customer_id").tail(1)
+    latest = latest[latest["date"] >= filters["start_date"]]
+    for key, column in (("segments", "segment"), ("products", "product")):
+        if filters.get(key):
+            latest = latest[latest[column].isin(filters[key])]
+    return latest.sort_values("customer_id")
+
+
+def test_as_of_matches_a_groupby_last():
+    frame = generate_synthetic_data(num_days=40, num_customers=150, end_date="2024-02-29")
+    rng = np.random.default_rng(5)
+    frame = frame.iloc[rng.permutation(len(frame))[: len(frame) // 3]].reset_index(drop=True)  # sparse, unsorted
+    index = AsOfIndex(frame)
+    dates = pd.date_range("2024-01-15", "2024-03-05", freq="D")
+    for end in dates[::4]:
+        filters = {"start_date": end - pd.Timedelta(days=10), "end_date": end, "segments": ["Retail", "SME"], "products": []}
+        expected = _latest_by_groupby(frame, filters)
+        got = index.snapshot(filters).sort_values("customer_id")
+        pd.testing.assert_frame_equal(got, expected)
+    assert len(index.positions(pd.Timestamp("2023-12-31"))) == 0
+    assert len(index.positions(None)) == frame["customer_id"].nunique()
+
+
+def test_snapshot_mode_counts_each_customer_once(tmp_path):
+    path = tmp_path / "transactions.csv"
+    generate_synthetic_data(num_days=20, num_customers=200, end_date="2024-03-31").to_csv(path, index=False)
+    dataset = query.load_dataset(str(path))
+    frame = dataset.frame
+    filters = {"start_date": pd.Timestamp("2024-03-20"), "end_date": pd.Timestamp("2024-03-25"), "segments": [], "products": ["Loan"]}
+
+    flows = query.run_query(filters, str(path))
+    snapshot = query.run_query({**filters, "mode": "snapshot"}, str(path))
+    latest = _latest_by_groupby(frame, {**filters, "start_date": frame["date"].min()})
+    latest = latest[latest["date"] >= filters["start_date"]]
+
+    assert snapshot is not flows and snapshot.key[-1] == "snapshot"
+    customers, total, _, rate = (kpi["value"] for kpi in snapshot.kpis)
+    assert customers == len(latest) < flows.cube.totals()["count"]
+    assert total == pytest.approx(latest["balance"].astype(float).sum() / 1e6)
+    assert rate == pytest.approx(latest["delinquent"].mean() * 100.0)
+    assert list(snapshot.cube.dates) == [filters["end_date"]]
+    assert len(snapshot.rows()) == len(latest)
+    with pytest.raises(ValueError):
+        query.normalize_filters({"mode": "as_of"}, dataset.cube)
@@ -0,0 +1,103 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from services import export, query, sql_store
+from services.data_loader import generate_synthetic_data
+from services.dataset import Dataset
+
+
+SELECTIONS = [
+    {},
+    {"start_date": pd.Timestamp("2024-02-10"), "end_date": pd.Timestamp("2024-03-05"), "segments": ["SME", "Retail"], "products": ["Loan"]},
+    {"start_date": pd.Timestamp("2024-03-20"), "end_date": pd.Timestamp("2024-03-25"), "products": ["Loan"], "mode": "snapshot"},
+]
+
+
+@pytest.fixture(params=list(sql_store.ENGINES))
+def engine(request):
+    if request.param == "duckdb":
+        pytest.importorskip("duckdb")
+    return request.param
+
+
+def _source(tmp_path):
+    path = tmp_path / "transactions.csv"
+    generate_synthetic_data(num_days=60, num_customers=150, end_date="2024-03-31").to_csv(path, index=False)
+    return str(path)
+
+
+def test_pushdown_matches_pandas(tmp_path, engine):
+    path = _source(tmp_path)
+    in_memory = Dataset.load(path, streaming=False)
+    stored = Dataset.load(path, backend=engine)
+    assert isinstance(stored.rows, sql_store.SqlStore) and sql_store.sql_path_for(path, engine).exists()
+    assert stored.domain.__dict__ == in_memory.domain.__dict__
+
+    for filters in SELECTIONS:
+        got, expected = query.lookup(stored, filters), query.lookup(in_memory, filters)
+        assert [k["value"] for k in got.kpis] == pytest.approx([k["value"] for k in expected.kpis])
+        assert (got.cube.start, got.cube.segments, got.cube.products) == (expected.cube.start, expected.cube.segments, expected.cube.products)
+        for name, values in expected.cube.measures.items():
+            np.testing.assert_allclose(got.cube.measures[name], values)
+        for mode in expected.cube.histograms:
+            np.testing.assert_array_equal(got.cube.histogram(mode)[1], expected.cube.histogram(mode)[1])
+        rows, expected_rows = got.rows(), expected.rows()
+        if filters.get("mode") == "snapshot":
+            rows, expected_rows = rows.sort_values("customer_id"), expected_rows.sort_values("customer_id")
+        pd.testing.assert_frame_equal(rows.reset_index(drop=True), expected_rows.reset_index(drop=True), check_categorical=False)
+
+    chunks = list(export.iter_selection(stored, SELECTIONS[1], chunk_rows=100))
+    assert len(chunks) > 1 and sum(map(len, chunks)) == query.lookup(stored, SELECTIONS[1]).cube.totals()["count"]
+
+
+def test_store_is_reused_and_ingested_rows_are_dropped_on_reopen(tmp_path, monkeypatch):
+    path = _source(tmp_path)
+    incoming = tmp_path / "incoming"
+    incoming.mkdir()
+    dataset = Dataset.load(path, incoming_dir=incoming, backend="sqlite")
+    rows = dataset.rows.rows
+
+    extra = generate_synthetic_data(num_days=3, num_customers=20, end_date="2024-04-03")
+    extra.to_csv(incoming / "april.csv", index=False)
+    assert dataset.refresh(force=True)
+    result = query.lookup(dataset, {"start_date": pd.Timestamp("2024-04-01")})
+    assert result.cube.totals()["count"] == len(extra) == len(result.rows())
+    assert dataset.domain.max_date == pd.Timestamp("2024-04-03")
+
+    # Opening the file again reuses it without the ingested rows, which the dataset ingests anew
+    with monkeypatch.context() as patch:
+        patch.setattr(sql_store.SqlStore, "ingest", lambda *args: pytest.fail("the source did not change"))
+        reopened = Dataset.load(path, incoming_dir=incoming, backend="sqlite")
+    assert reopened.rows.rows == rows
+    assert reopened.cube.totals()["count"] == dataset.cube.totals()["count"] == rows + len(extra)
+    with pytest.raises(ValueError):
+        Dataset.load(path, backend="oracle")
+
+
+def test_store_is_created_in_a_missing_directory(tmp_path, engine):
+    # e.g. data/sample/ on a fresh checkout, before the sample is generated
+    source = tmp_path / "data" / "sample" / "transactions.csv"
+    frame = generate_synthetic_data(num_days=10, num_customers=20, end_date="2024-01-10")
+    store = sql_store.open_store(source, engine, None, lambda: [frame])
+    assert sql_store.sql_path_for(source, engine).exists() and store.rows == len(frame)
+
+
+def test_rows_without_a_category_are_left_out_of_aggregates_like_pandas(tmp_path, engine):
+    path = tmp_path / "transactions.csv"
+    frame = generate_synthetic_data(num_days=30, num_customers=60, end_date="2024-03-31")
+    frame.loc[frame.index[::7], "segment"] = None
+    frame.loc[frame.index[3::11], "product"] = None
+    frame.to_csv(path, index=False)
+    in_memory = Dataset.load(str(path), streaming=False)
+    stored = Dataset.load(str(path), backend=engine)
+    assert stored.domain.__dict__ == in_memory.domain.__dict__
+
+    for filters in [{}, {"products": ["Loan"]}, {"mode": "snapshot"}]:
+        got, expected = query.lookup(stored, filters), query.lookup(in_memory, filters)
+        assert [k["value"] for k in got.kpis] == pytest.approx([k["value"] for k in expected.kpis])
+        for name, values in expected.cube.measures.items():
+            np.testing.assert_allclose(got.cube.measures[name], values)
+        for mode in expected.cube.histograms:
+            np.testing.assert_array_equal(got.cube.histogram(mode)[1], expected.cube.histogram(mode)[1])
+        assert len(got.rows()) == len(expected.rows())
@@ -0,0 +1,57 @@
+import shutil
+
+import numpy as np
+import pytest
+
+from services import column_store, query
+from services.cube import Cube
+from services.data_loader import generate_synthetic_data, iter_transaction_chunks, read_transactions_csv
+from services.dataset import Dataset
+from services.streaming import aggregate_chunks
+
+
+@pytest.fixture(scope="module")
+def csv_path(tmp_path_factory):
+    path = tmp_path_factory.mktemp("stream") / "transactions.csv"
+    generate_synthetic_data(num_days=40, num_customers=300, end_date="2024-03-31").to_csv(path, index=False)
+    return str(path)
+
+
+@pytest.mark.parametrize("cached", [False, True])
+@pytest.mark.parametrize("distinct", ["bitmap", "hll"])
+def test_streamed_cube_matches_in_memory_cube(csv_path, cached, distinct):
+    cache_dir = column_store.cache_dir_for(csv_path)
+    df = read_transactions_csv(csv_path)
+    if cached:
+        column_store.write_columns(df, cache_dir)
+        assert column_store.is_fresh(cache_dir, csv_path)
+    else:
+        shutil.rmtree(cache_dir, ignore_errors=True)
+    full = Cube.from_frame(df, distinct=distinct)
+
+    streamed = aggregate_chunks(lambda columns: iter_transaction_chunks(csv_path, chunk_rows=997, columns=columns), distinct=distinct)
+
+    assert list(streamed.dates) == list(full.dates)
+    for name in ("balance", "count", "delinquent"):
+        expected = full.pivot(name)
+        actual = streamed.pivot(name).loc[expected.index, expected.columns]
+        np.testing.assert_allclose(actual.to_numpy(), expected.to_numpy(), rtol=1e-9)
+    assert streamed.distinct_customers() == full.distinct_customers()
+    for mode in ("linear", "log"):
+        np.testing.assert_allclose(streamed.histogram(mode)[0], full.histogram(mode)[0])
+        np.testing.assert_array_equal(streamed.histogram(mode)[1], full.histogram(mode)[1])
+    assert streamed.histogram("quantile")[1].sum() == len(df)
+
+
+def test_streaming_dataset_serves_queries_without_rows(csv_path):
+    query.clear_cache()
+    dataset = Dataset.load(csv_path, streaming=True)
+    assert dataset.index is None and dataset.frame is None
+    domain = dataset.domain
+    assert domain.min_date.date().isoformat() == "2024-02-21" and domain.max_date.date().isoformat() == "2024-03-31"
+    assert domain.segments == sorted(["Retail", "Affluent", "SME", "Corporate"])
+
+    in_memory = Dataset.load(csv_path, streaming=False)
+    filters = {"start_date": domain.min_date, "end_date": domain.max_date, "segments": ["SME"], "products": []}
+    expected = in_memory.cube.select(filters).totals()
+    assert dataset.cube.select(filters).totals() == pytest.approx(expected)
@@ -0,0 +1,83 @@
+import json
+import textwrap
+
+import pandas as pd
+
+from services import query, tracing
+from services.data_loader import generate_synthetic_data
+
+
+def test_spans_and_cache_state_are_recorded(tmp_path):
+    path = tmp_path / "transactions.csv"
+    generate_synthetic_data(num_days=30, num_customers=50, end_date="2024-01-31").to_csv(path, index=False)
+    recorder = tracing.LatencyRecorder(directory=None)
+    query.clear_cache()
+    filters = {"start_date": pd.Timestamp("2024-01-10"), "segments": ["Retail"]}
+
+    with tracing.span("ignored"):  # no active render: no-op
+        pass
+    for expected in ("miss", "hit"):
+        with tracing.trace("overview", recorder) as render:
+            with tracing.span("load"):
+                query.load_dataset(str(path))
+            query.run_query(filters, str(path))
+        assert render.notes["query_cache"] == expected
+    assert [s.stage for s in render.spans] == ["load", "query"]
+    assert recorder.last is render and render.seconds >= render.stages()["query"]
+
+    summary = {row["stage"]: row for row in recorder.summary()}
+    assert set(summary) == {"load", "query", "filter", "aggregate", "total"}
+    assert summary["total"]["count"] == 2 and summary["filter"]["count"] == 1
+    assert summary["total"]["p50"] <= summary["total"]["p95"]
+
+
+def test_flush_writes_jsonl_and_prometheus(tmp_path):
+    recorder = tracing.LatencyRecorder(directory=tmp_path, flush_seconds=0)
+    for _ in range(3):
+        with tracing.trace("risks", recorder):
+            with tracing.span("figure", "distribution"):
+                pass
+
+    lines = [json.loads(line) for line in (tmp_path / "latency.jsonl").read_text().splitlines()]
+    assert {(line["page"], line["stage"]) for line in lines} == {("risks", "figure"), ("risks", "total")}
+    prom = (tmp_path / "latency.prom").read_text()
+    assert 'dashboard_render_stage_seconds{page="risks",stage="figure",quantile="0.95"}' in prom
+    assert 'dashboard_render_stage_seconds_count{page="risks",stage="total"} 3' in prom
+
+
+def test_fragment_spans_join_the_page_render(tmp_path):
+    from streamlit.testing.v1 import AppTest
+
+    # A script file: Streamlit 1.52 cannot name the page of an AppTest.from_function script
+    script = tmp_path / "story3d.py"
+    script.write_text(
+        textwrap.dedent(
+            """
+            import streamlit as st
+
+            from components.timing import traced_fragment, traced_page
+            from services import tracing
+
+
+            @traced_fragment("story3d.scene")
+            def scene() -> None:
+                st.selectbox("Colorscale", ["Blues", "Viridis"])
+                with tracing.span("figure", "mini_3d"):
+                    pass
+
+
+            @traced_page("story3d")
+            def main() -> None:
+                scene()
+
+
+            main()
+            """
+        )
+    )
+
+    tracing.RECORDER.reset()
+    at = AppTest.from_file(str(script)).run()
+    assert not at.exception and at.selectbox[0].value == "Blues"
+    # In a full run the fragment is part of the page render, not a render of its own
+    assert [(row["page"], row["stage"]) for row in tracing.RECORDER.summary()] == [("story3d", "figure"), ("story3d", "total")]
@@ -0,0 +1,21 @@
+from services import query, warmup
+from services.data_loader import generate_synthetic_data
+
+
+def test_warmup_caches_the_default_view(tmp_path, monkeypatch):
+    sample = tmp_path / "data" / "sample"
+    sample.mkdir(parents=True)
+    generate_synthetic_data(num_days=30, num_customers=50, end_date="2024-01-31").to_csv(sample / "transactions.csv", index=False)
+    monkeypatch.chdir(tmp_path)
+    query._shared_dataset.clear()
+    query.clear_cache()
+
+    timings = warmup.warmup()
+    assert list(timings) == ["imports", "dataset", "query", "figures"]
+    dataset = query.load_dataset()
+    domain = dataset.domain
+    hits = query.cache_stats()["hits"]
+    # What render_filters returns by default
+    query.run_query({"start_date": domain.min_date, "end_date": domain.max_date, "segments": domain.segments, "products": domain.products})
+    assert query.cache_stats()["hits"] == hits + 1
+    query._shared_dataset.clear()
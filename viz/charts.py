@@ -1,26 +1,88 @@
 from __future__ import annotations
 
+from typing import Optional, Sequence
+
 import pandas as pd
-import plotly.express as px
+
+from services.cube import Cube
+from services.prefix import ROLLING_WINDOWS, rolling_from_daily
+from viz.downsample import downsample_frame
+
+
+def with_note(title: str, note: Optional[str]) -> str:
+    """Chart title with an optional second, smaller line (e.g. downsampling)."""
+    return title if not note else f"{title}<br><sup>{note}</sup>"
 
 
-def build_time_series(df: pd.DataFrame):
+def build_time_series(df: pd.DataFrame | Cube, width_px: Optional[int] = None, downsample: str = "lttb"):
+    """Daily balance line; with ``width_px`` the series is downsampled to that chart width."""
+    import plotly.express as px
     if df.empty:
         return px.line(title="No data")
-    df = df.copy()
-    df["date"] = pd.to_datetime(df["date"]).dt.floor("D")
-    daily = df.groupby("date", as_index=False)["balance"].sum()
-    fig = px.line(daily, x="date", y="balance", markers=True, title="Daily aggregated balance")
+    if isinstance(df, Cube):
+        daily = df.daily()[["date", "balance"]]
+    else:
+        df = df.copy()
+        df["date"] = pd.to_datetime(df["date"]).dt.floor("D")
+        daily = df.groupby("date", as_index=False)["balance"].sum()
+    daily, note = downsample_frame(daily, "date", "balance", width_px, downsample)
+    fig = px.line(daily, x="date", y="balance", markers=note is None, title=with_note("Daily aggregated balance", note))
     fig.update_layout(margin=dict(l=10, r=10, t=40, b=10))
     return fig
 
 
-def build_bar_by_segment(df: pd.DataFrame):
-    if df.empty or "segment" not in df.columns:
+def rolling_series(
+    df: pd.DataFrame | Cube,
+    y: str,
+    windows: Sequence[int] = ROLLING_WINDOWS,
+    width_px: Optional[int] = None,
+    downsample: str = "lttb",
+) -> tuple[pd.DataFrame, Optional[str]]:
+    """Rolling windows (see ``services.prefix.rolling_windows``) of rows or a cube,
+    each window's ``y`` series downsampled to ``width_px``; returns the frame and one note
+    naming the windows that were reduced."""
+    if isinstance(df, Cube):
+        daily = df.daily()
+    else:
+        if "delinquent" not in df.columns:
+            df = df.assign(delinquent=0)
+        daily = (
+            df.assign(date=pd.to_datetime(df["date"]).dt.floor("D"))
+            .groupby("date")
+            .agg(balance=("balance", "sum"), count=("balance", "size"), delinquent=("delinquent", "sum"))
+            .reset_index()
+        )
+    rolling = rolling_from_daily(daily, windows)
+    parts, windows_by_note = [], {}
+    for window, part in rolling.groupby("window", sort=False):
+        part, note = downsample_frame(part, "date", y, width_px, downsample)
+        parts.append(part)
+        if note is not None:
+            windows_by_note.setdefault(note, []).append(window)
+    note = "; ".join(f"{', '.join(windows)}: {note}" for note, windows in windows_by_note.items()) or None
+    return (pd.concat(parts, ignore_index=True) if parts else rolling), note
+
+
+def build_rolling_balance(df: pd.DataFrame | Cube, width_px: Optional[int] = None, downsample: str = "lttb"):
+    """Average daily balance over trailing 7/30/90-day windows, one line per window."""
+    import plotly.express as px
+    if df.empty:
+        return px.line(title="No data")
+    rolling, note = rolling_series(df, "balance", width_px=width_px, downsample=downsample)
+    fig = px.line(rolling, x="date", y="balance", color="window", title=with_note("Rolling average daily balance", note))
+    fig.update_layout(margin=dict(l=10, r=10, t=40, b=10), legend_title_text="")
+    return fig
+
+
+def build_bar_by_segment(df: pd.DataFrame | Cube):
+    import plotly.express as px
+    if df.empty or (not isinstance(df, Cube) and "segment" not in df.columns):
         return px.bar(title="No data")
-    agg = df.groupby("segment", as_index=False)["balance"].sum().sort_values("balance", ascending=False)
+    if isinstance(df, Cube):
+        agg = df.by_segment()[["segment", "balance"]]
+    else:
+        agg = df.groupby("segment", as_index=False, observed=True)["balance"].sum()
+    agg = agg.sort_values("balance", ascending=False)
     fig = px.bar(agg, x="segment", y="balance", title="Balance by segment")
     fig.update_layout(margin=dict(l=10, r=10, t=40, b=10))
     return fig
-
-
@@ -0,0 +1,99 @@
+from __future__ import annotations
+
+from typing import Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+
+METHODS = ("lttb", "minmax")
+# Points kept per horizontal pixel of chart; more than one per pixel is invisible
+POINTS_PER_PX = 1.0
+# Approximate chart widths in the wide page layout, the downsampling budget of each placement:
+# the 2/3 column, a half-page column and the full width
+CHART_WIDTH_PX = {"wide": 800, "half": 600, "full": 1200}
+
+
+def points_for_width(width_px: int, points_per_px: float = POINTS_PER_PX) -> int:
+    """Point budget for a chart ``width_px`` pixels wide (never below 3)."""
+    return max(3, int(width_px * points_per_px))
+
+
+def _as_float(values: np.ndarray) -> np.ndarray:
+    values = np.asarray(values)
+    if np.issubdtype(values.dtype, np.datetime64):
+        return values.view(np.int64).astype(np.float64)
+    return values.astype(np.float64)
+
+
+def lttb(x: np.ndarray, y: np.ndarray, threshold: int) -> np.ndarray:
+    """Indices kept by Largest-Triangle-Three-Buckets (Steinarsson, 2013).
+
+    The first and last points are always kept; every bucket in between keeps
+    the point forming the largest triangle with the previously kept point and
+    the mean of the next bucket. Work inside a bucket is vectorized; the loop
+    runs once per output point.
+    """
+    n = len(x)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+    xf, yf = _as_float(x), _as_float(y)
+    edges = (np.floor(np.arange(threshold - 1) * (n - 2) / (threshold - 2)).astype(np.int64) + 1)
+    edges[-1] = n - 1
+    # Mean of each bucket, from cumulative sums; the bucket after the last one is the last point
+    cx, cy = np.concatenate([[0.0], np.cumsum(xf)]), np.concatenate([[0.0], np.cumsum(yf)])
+    sizes = np.diff(edges)
+    mean_x = np.append((cx[edges[1:]] - cx[edges[:-1]]) / sizes, xf[-1])
+    mean_y = np.append((cy[edges[1:]] - cy[edges[:-1]]) / sizes, yf[-1])
+
+    kept = np.empty(threshold, dtype=np.int64)
+    kept[0], kept[-1] = 0, n - 1
+    a = 0
+    for bucket in range(threshold - 2):
+        lo, hi = edges[bucket], edges[bucket + 1]
+        nx, ny = mean_x[bucket + 1], mean_y[bucket + 1]
+        area = np.abs((xf[a] - nx) * (yf[lo:hi] - yf[a]) - (xf[a] - xf[lo:hi]) * (ny - yf[a]))
+        a = lo + int(np.argmax(area))
+        kept[bucket + 1] = a
+    return kept
+
+
+def minmax(x: np.ndarray, y: np.ndarray, threshold: int) -> np.ndarray:
+    """Indices of the min and max of ``threshold // 2`` equal-count buckets, plus both ends.
+
+    Every local extreme at bucket resolution survives, so spikes stay visible.
+    """
+    n = len(x)
+    if threshold >= n or threshold < 4:
+        return np.arange(n)
+    num_buckets = (threshold - 2) // 2
+    bucket = (np.arange(n) * num_buckets) // n
+    order = np.lexsort((_as_float(y), bucket))
+    starts = np.searchsorted(bucket[order], np.arange(num_buckets), "left")
+    ends = np.searchsorted(bucket[order], np.arange(num_buckets), "right")
+    return np.unique(np.concatenate([[0, n - 1], order[starts], order[ends - 1]]))
+
+
+def downsample_frame(
+    frame: pd.DataFrame,
+    x: str,
+    y: str,
+    width_px: Optional[int],
+    method: str = "lttb",
+) -> Tuple[pd.DataFrame, Optional[str]]:
+    """Downsample ``frame`` (sorted by ``x``) to the budget for ``width_px``.
+
+    Returns the frame and a short note for the chart title, or the untouched
+    frame and None when no downsampling was needed (or ``width_px`` is None).
+    """
+    if width_px is None:
+        return frame, None
+    if method not in METHODS:
+        raise ValueError(f"Unknown downsampling method: {method!r}")
+    budget = points_for_width(width_px)
+    if len(frame) <= budget:
+        return frame, None
+    pick = lttb if method == "lttb" else minmax
+    kept = pick(frame[x].to_numpy(), frame[y].to_numpy(), budget)
+    label = "LTTB" if method == "lttb" else "min/max"
+    return frame.iloc[kept], f"downsampled ({label}): {len(kept):,} of {len(frame):,} points"
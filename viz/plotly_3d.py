@@ -1,109 +1,147 @@
 from __future__ import annotations
 
+from typing import TYPE_CHECKING
+
 import numpy as np
 import pandas as pd
-import plotly.graph_objects as go
 
+from services.cube import Cube
 
-def build_mini_3d_scene(
-    df: pd.DataFrame,
-    metric: str = "sum_balance",
-    colorscale: str = "Blues",
-    bar_size: float = 0.4,
-) -> go.Figure:
-    """Simple 3D mini-scene: extruded bars by segment x product with metric selection.
+if TYPE_CHECKING:
+    import plotly.graph_objects as go
 
-    - X axis: segments
-    - Y axis: products
-    - Z axis: selected metric (sum/avg balance, accounts, delinquency rate)
+
+METRIC_TITLES = {
+    "sum_balance": ("Balance (€)", "€"),
+    "avg_balance": ("Avg. balance (€)", "Avg (€)"),
+    "accounts": ("Accounts", "Accounts"),
+    "delinquency_rate": ("Delinquency rate (%)", "%"),
+}
+
+
+# Unit cuboid: 4 bottom corners then 4 top corners, and its 12 triangles
+_BOX_CORNERS = np.array(
+    [
+        (-1, -1, 0), (1, -1, 0), (1, 1, 0), (-1, 1, 0),  # bottom
+        (-1, -1, 1), (1, -1, 1), (1, 1, 1), (-1, 1, 1),  # top
+    ],
+    dtype=float,
+)
+_BOX_TRIANGLES = np.array(
+    [
+        (0, 1, 2), (0, 2, 3),  # bottom
+        (4, 5, 6), (4, 6, 7),  # top
+        (0, 1, 5), (0, 5, 4),  # sides
+        (1, 2, 6), (1, 6, 5),
+        (2, 3, 7), (2, 7, 6),
+        (3, 0, 4), (3, 4, 7),
+    ],
+    dtype=np.int64,
+)
+
+
+def _bar_geometry(xs: np.ndarray, ys: np.ndarray, heights: np.ndarray, bar_size: float) -> dict:
+    """Vertices, triangles and per-vertex intensity of all bars, as one mesh.
+
+    Bar ``n`` owns vertices ``8n..8n+7``; intensity is 0 at the bottom and the
+    bar height at the top, so the colorscale runs along each bar.
     """
-    if df.empty:
-        fig = go.Figure()
-        fig.update_layout(title="No 3D data")
-        return fig
+    tops = np.maximum(0.0, heights)
+    corners = _BOX_CORNERS[None, :, :]
+    x = xs[:, None] + corners[..., 0] * bar_size
+    y = ys[:, None] + corners[..., 1] * bar_size
+    z = corners[..., 2] * tops[:, None]
+    faces = (_BOX_TRIANGLES[None, :, :] + len(_BOX_CORNERS) * np.arange(len(xs))[:, None, None]).reshape(-1, 3)
+    return {
+        "x": x.ravel(),
+        "y": y.ravel(),
+        "z": z.ravel(),
+        "i": faces[:, 0],
+        "j": faces[:, 1],
+        "k": faces[:, 2],
+        "intensity": z.ravel(),
+    }
+
 
+def _aggregate_frame(df: pd.DataFrame, metric: str) -> pd.DataFrame:
+    """Per (segment, product) value of ``metric`` from raw rows."""
     if "segment" not in df.columns or "product" not in df.columns:
         df = df.assign(segment="All", product="All")
 
     # Aggregate according to requested metric
     if metric == "avg_balance":
-        agg = df.groupby(["segment", "product"], as_index=False)["balance"].mean().rename(columns={"balance": "value"})
-        z_title = "Avg. balance (€)"
-        colorbar_title = "Avg (€)"
+        agg = df.groupby(["segment", "product"], as_index=False, observed=True)["balance"].mean().rename(columns={"balance": "value"})
     elif metric == "accounts":
-        agg = df.groupby(["segment", "product"], as_index=False).size().rename(columns={"size": "value"})
-        z_title = "Accounts"
-        colorbar_title = "Accounts"
+        agg = df.groupby(["segment", "product"], as_index=False, observed=True).size().rename(columns={"size": "value"})
     elif metric == "delinquency_rate":
         if "delinquent" not in df.columns:
             df = df.assign(delinquent=0)
-        agg = df.groupby(["segment", "product"], as_index=False)["delinquent"].mean()
+        agg = df.groupby(["segment", "product"], as_index=False, observed=True)["delinquent"].mean()
         agg["value"] = agg["delinquent"].astype(float) * 100.0
         agg = agg.drop(columns=["delinquent"])  # keep segment, product, value
-        z_title = "Delinquency rate (%)"
-        colorbar_title = "%"
     else:  # sum_balance
-        agg = df.groupby(["segment", "product"], as_index=False)["balance"].sum().rename(columns={"balance": "value"})
-        z_title = "Balance (€)"
-        colorbar_title = "€"
-    segments = agg["segment"].unique().tolist()
-    products = agg["product"].unique().tolist()
+        agg = df.groupby(["segment", "product"], as_index=False, observed=True)["balance"].sum().rename(columns={"balance": "value"})
+    return agg
+
+
+def _aggregate_cube(cube: Cube, metric: str) -> pd.DataFrame:
+    """Same as ``_aggregate_frame`` but rolled up from the cube cells."""
+    cells = cube.by_segment_product()
+    if metric == "avg_balance":
+        value = cells["balance"] / cells["count"]
+    elif metric == "accounts":
+        value = cells["count"]
+    elif metric == "delinquency_rate":
+        value = cells["delinquent"] / cells["count"] * 100.0
+    else:  # sum_balance
+        value = cells["balance"]
+    return cells[["segment", "product"]].assign(value=value)
+
 
-    x_pos = {s: i for i, s in enumerate(segments)}
-    y_pos = {p: j for j, p in enumerate(products)}
+def build_mini_3d_scene(
+    df: pd.DataFrame | Cube,
+    metric: str = "sum_balance",
+    colorscale: str = "Blues",
+    bar_size: float = 0.4,
+) -> go.Figure:
+    """Simple 3D mini-scene: extruded bars by segment x product with metric selection.
 
-    xs = np.array([x_pos[s] for s in agg["segment"]], dtype=float)
-    ys = np.array([y_pos[p] for p in agg["product"]], dtype=float)
+    - X axis: segments
+    - Y axis: products
+    - Z axis: selected metric (sum/avg balance, accounts, delinquency rate)
+    """
+    import plotly.graph_objects as go
+    if df.empty:
+        fig = go.Figure()
+        fig.update_layout(title="No 3D data")
+        return fig
+
+    agg = _aggregate_cube(df, metric) if isinstance(df, Cube) else _aggregate_frame(df, metric)
+    z_title, colorbar_title = METRIC_TITLES.get(metric, METRIC_TITLES["sum_balance"])
+    seg_codes, segments = pd.factorize(agg["segment"].astype(str))
+    prod_codes, products = pd.factorize(agg["product"].astype(str))
+    segments, products = segments.tolist(), products.tolist()
     heights = agg["value"].astype(float).to_numpy()
 
-    # Create 3D bars using Mesh3d per bar (lightweight for small matrices)
-    meshes = []
-    for x, y, h, seg, prod in zip(xs, ys, heights, agg["segment"], agg["product"]):
-        # Define the 8 vertices of the cuboid
-        x0, x1 = x - bar_size, x + bar_size
-        y0, y1 = y - bar_size, y + bar_size
-        z0, z1 = 0.0, max(0.0, float(h))
-        vertices = [
-            (x0, y0, z0), (x1, y0, z0), (x1, y1, z0), (x0, y1, z0),  # bottom
-            (x0, y0, z1), (x1, y0, z1), (x1, y1, z1), (x0, y1, z1),  # top
-        ]
-        # Triangles indices for a box
-        I, J, K = zip(
-            # bottom
-            (0, 1, 2), (0, 2, 3),
-            # top
-            (4, 5, 6), (4, 6, 7),
-            # sides
-            (0, 1, 5), (0, 5, 4),
-            (1, 2, 6), (1, 6, 5),
-            (2, 3, 7), (2, 7, 6),
-            (3, 0, 4), (3, 4, 7),
-        )
-        hovertext = f"Segment: {seg}<br>Product: {prod}<br>Value: {h:,.2f}"
-        # Intensity per vertex for colorscale (use top height for top vertices, 0 for bottom)
-        intensities = [
-            0.0, 0.0, 0.0, 0.0,  # bottom
-            z1, z1, z1, z1       # top
-        ]
-        mesh = go.Mesh3d(
-            x=[v[0] for v in vertices],
-            y=[v[1] for v in vertices],
-            z=[v[2] for v in vertices],
-            i=list(I),
-            j=list(J),
-            k=list(K),
-            opacity=0.95,
-            intensity=intensities,
-            colorscale=colorscale,
-            showscale=False,
-            flatshading=True,
-            hovertext=hovertext,
-            hoverinfo="text",
-            lighting=dict(ambient=0.4, diffuse=0.7, specular=0.2),
-        )
-        meshes.append(mesh)
-
-    fig = go.Figure(data=meshes)
+    # Hover data per bar, repeated on its 8 vertices
+    bar_data = np.empty((len(agg), 3), dtype=object)
+    bar_data[:, 0] = agg["segment"].astype(str).to_numpy()
+    bar_data[:, 1] = agg["product"].astype(str).to_numpy()
+    bar_data[:, 2] = heights
+    mesh = go.Mesh3d(
+        **_bar_geometry(seg_codes.astype(float), prod_codes.astype(float), heights, bar_size),
+        customdata=np.repeat(bar_data, len(_BOX_CORNERS), axis=0),
+        hovertemplate="Segment: %{customdata[0]}<br>Product: %{customdata[1]}<br>Value: %{customdata[2]:,.2f}<extra></extra>",
+        opacity=0.95,
+        colorscale=colorscale,
+        cmin=0.0,
+        showscale=True,
+        colorbar=dict(title=colorbar_title),
+        flatshading=True,
+        lighting=dict(ambient=0.4, diffuse=0.7, specular=0.2),
+    )
+
+    fig = go.Figure(data=[mesh])
     fig.update_layout(
         scene=dict(
             xaxis=dict(title="Segment", tickmode="array", tickvals=list(range(len(segments))), ticktext=segments),
@@ -115,13 +153,6 @@ def build_mini_3d_scene(
         title="3D metric by segment and product",
         showlegend=False,
     )
-    # Add a colorbar using a dummy scatter3d (for Mesh3d showscale per trace can be heavy)
-    fig.add_trace(go.Scatter3d(
-        x=[None], y=[None], z=[None],
-        mode="markers",
-        marker=dict(size=0.0001, color=[0, 1], colorscale=colorscale, colorbar=dict(title=colorbar_title)),
-        showlegend=False,
-    ))
     return fig
 
 